@@ -0,0 +1,87 @@
+"""
+Настройки gunicorn для production:
+
+    DJANGO_PROFILE=production gunicorn -c tdp/gunicorn.conf.py tdp.wsgi:application
+
+Перезапуск воркеров без потери запросов - `kill -HUP <pid мастера>`: новые
+воркеры стартуют, старые дообслуживают текущие запросы. С preload_app код
+загружен в мастере и HUP его не перечитывает; новая версия кода без простоя -
+`kill -USR2 <pid>` (стартует новый мастер), затем `kill -TERM <старый pid>`
+"""
+import multiprocessing
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name) or default)
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:80")
+
+# процессы нужны для CPU (сериализация, шаблоны), потоки - пока запрос ждёт базу
+workers = env_int("WEB_CONCURRENCY", cpu_count * 2 + 1)
+threads = env_int("GUNICORN_THREADS", 2)
+# ASGI (todo.async_views): GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+# и приложение tdp.asgi:application
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or (
+    "gthread" if threads > 1 else "sync"
+)
+
+# приложение загружается в мастере до fork: воркеры делят его память
+# (copy-on-write) и стартуют быстрее. GUNICORN_RELOAD=1 - перезапуск при
+# изменении кода для разработки, с предзагрузкой он несовместим
+reload = os.environ.get("GUNICORN_RELOAD") == "1"
+preload_app = not reload
+
+timeout = env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = 5
+
+# воркер перезапускается после стольких запросов, чтобы не копить память
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+pidfile = os.environ.get("GUNICORN_PIDFILE") or None
+
+
+def on_starting(server):
+    # кэш токенов без общего кэша: отозванный в одном воркере токен
+    # продолжает работать в остальных до истечения TTL
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tdp.settings")
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+
+    alias = settings.TOKEN_AUTH_CACHE.get("CACHE_ALIAS")
+    if settings.PRODUCTION and server.cfg.workers > 1 and alias is None:
+        raise ImproperlyConfigured(
+            "TOKEN_AUTH_CACHE['CACHE_ALIAS'] must name a shared cache "
+            "when gunicorn runs several workers"
+        )
+
+
+def when_ready(server):
+    # /metrics на отдельном порту (METRICS["PORT"]) отдаёт мастер: он же
+    # сводит в архив файлы завершившихся воркеров, вне их запросов
+    import django
+    from django.conf import settings
+
+    django.setup()
+    port = settings.METRICS.get("PORT")
+    if port:
+        from todo import metrics
+
+        metrics.start_server(port)
+
+
+def post_fork(server, worker):
+    # соединение, открытое мастером при загрузке, не должно достаться
+    # нескольким процессам сразу
+    from django.db import connections
+    from todo import metrics
+
+    connections.close_all()
+    metrics.close_server_after_fork()
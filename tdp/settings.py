@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 
@@ -9,11 +10,31 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-SECRET_KEY = "django-insecure-)zk%nb7gxt&x9hqk8+(jzdo2d%k@1m3&k-!1c#imky3cju@+rd"
-
-DEBUG = True
-
-ALLOWED_HOSTS = []
+# профиль настроек: development (по умолчанию) или production (gunicorn,
+# см. tdp/gunicorn.conf.py)
+DJANGO_PROFILE = os.environ.get("DJANGO_PROFILE", "development")
+if DJANGO_PROFILE not in ("development", "production"):
+    raise ImproperlyConfigured(f"Unknown DJANGO_PROFILE {DJANGO_PROFILE!r}")
+PRODUCTION = DJANGO_PROFILE == "production"
+
+if PRODUCTION:
+    SECRET_KEY = os.environ.get("SECRET_KEY")
+    if not SECRET_KEY:
+        raise ImproperlyConfigured("SECRET_KEY is required in production")
+else:
+    SECRET_KEY = os.environ.get(
+        "SECRET_KEY",
+        "django-insecure-)zk%nb7gxt&x9hqk8+(jzdo2d%k@1m3&k-!1c#imky3cju@+rd",
+    )
+
+# в DEBUG каждое соединение копит SQL-запросы в connection.queries (а воркеры
+# celery не очищают их вовсе), поэтому в production он выключен
+DEBUG = os.environ.get("DJANGO_DEBUG", "0" if PRODUCTION else "1") == "1"
+
+# через запятую: example.com,api.example.com
+ALLOWED_HOSTS = [
+    host for host in os.environ.get("ALLOWED_HOSTS", "").split(",") if host
+]
 
 
 INSTALLED_APPS = [
@@ -33,11 +54,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы время запроса включало остальные middleware
+    "todo.profiling.ProfilingMiddleware",
+    "todo.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "todo.routers.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -63,15 +88,74 @@ TEMPLATES = [
 WSGI_APPLICATION = "tdp.wsgi.application"
 
 
+# соединения с базой: при DB_POOL_MAX_SIZE > 0 потоки процесса берут их из
+# общего пула (todo.db.postgresql) и возвращают после каждого запроса,
+# иначе каждый поток держит своё соединение DB_CONN_MAX_AGE секунд.
+# runserver создаёт поток на запрос, поэтому в разработке оба выключены
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 4 if PRODUCTION else 0))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": (
+            "todo.db.postgresql"
+            if DB_POOL_MAX_SIZE
+            else "django.db.backends.postgresql"
+        ),
         "HOST": os.environ.get("DB_HOST"),
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASS"),
         "PORT": 5432,
+        "CONN_MAX_AGE": (
+            0
+            if DB_POOL_MAX_SIZE
+            else int(os.environ.get("DB_CONN_MAX_AGE", 60 if PRODUCTION else 0))
+        ),
+        # переиспользуемое соединение проверяется в начале запроса
+        "CONN_HEALTH_CHECKS": True,
+        "POOL": {
+            "MAX_SIZE": DB_POOL_MAX_SIZE,
+            "MAX_AGE": 600,
+            "HEALTH_CHECK_INTERVAL": 30,
+            "TIMEOUT": 10,
+        },
+    }
+}
+
+# реплики только для чтения: DB_REPLICAS=host1,host2/name -> алиасы replica1,
+# replica2 с тем же пользователем, что и default (база - та же, если не указана)
+DB_REPLICAS = [
+    replica for replica in os.environ.get("DB_REPLICAS", "").split(",") if replica
+]
+for number, replica in enumerate(DB_REPLICAS, start=1):
+    host, _, name = replica.partition("/")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host or DATABASES["default"]["HOST"],
+        "NAME": name or DATABASES["default"]["NAME"],
+        # в тестах реплика - та же тестовая база
+        "TEST": {"MIRROR": "default"},
     }
+
+DATABASE_ROUTERS = ["todo.routers.ReplicaRouter"]
+
+REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != "default"],
+    "VIEWS": [
+        "todo-list",
+        "todo-detail",
+        "done_tasks",
+        "subtask",
+        "async-todo-list",
+        "async-todo-detail",
+        "async-done_tasks",
+        "async-subtask",
+    ],
+    # после записи пользователь столько секунд читает с основной базы
+    "STICKY_SECONDS": int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 10)),
+    "MAX_LAG": 5,
+    "LAG_CHECK_INTERVAL": 5,
+    "CACHE_ALIAS": None,
 }
 
 
@@ -105,14 +189,122 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# бенчмарки запускаются только явно, см. todo.tests.runner
+TEST_RUNNER = "todo.tests.runner.TestRunner"
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "todo.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "todo.renderers.ORJSONRenderer",
+        "todo.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "todo.parsers.ORJSONParser",
+        "todo.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+}
+
+# кэш, общий для процессов: в production отзыв токена (смена пароля,
+# деактивация) должен дойти до всех воркеров gunicorn
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+if PRODUCTION:
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_REDIS_URL", "redis://redis:6379/1"),
+    }
+
+# кэш token -> user для CachedTokenAuthentication; без CACHE_ALIAS отзыв
+# виден только своему процессу (gunicorn с несколькими воркерами не стартует)
+TOKEN_AUTH_CACHE = {
+    "MAX_SIZE": 10000,
+    "TTL": 60,
+    "CACHE_ALIAS": "shared" if PRODUCTION else None,
+}
+
+
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 587))
+EMAIL_HOST_USER = os.environ.get("EMAIL")
+EMAIL_HOST_PASSWORD = os.environ.get("PASSWORD")
+EMAIL_USE_TLS = True
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# пул SMTP-соединений воркера celery, см. todo.mail
+SMTP_POOL = {
+    "MAX_SIZE": 4,
+    "MAX_AGE": 300,
+    "HEALTH_CHECK_INTERVAL": 30,
+    "TIMEOUT": 10,
+}
+
+# задач в одной пачке потоковой выгрузки (/export/, export_tasks)
+EXPORT_CHUNK_SIZE = 500
+# задач в одной пачке (и транзакции) импорта (/import/, import_tasks)
+IMPORT_BATCH_SIZE = 500
+
+# вложенные объекты задачи в /todo/ без ?expand= (например, ("subtasks",))
+TASK_DEFAULT_EXPAND = ()
+
+# кэш сериализованных задач, см. todo.cache
+# (todo.cache.RedisPayloadCache с OPTIONS {"url": ..., "ttl": ...} - общий кэш)
+TASK_CACHE = {
+    "BACKEND": "todo.cache.LocMemPayloadCache",
+    "OPTIONS": {"max_size": 10000},
+}
+
+# профилирование запросов, гистограммы - /profiling/ (только для админов)
+PROFILING = {
+    "ENABLED": True,
+    # в production профилируется каждый десятый запрос
+    "SAMPLE_RATE": 0.1 if PRODUCTION else 1.0,
+    "SLOW_REQUEST_MS": 500,
+    "TOP_QUERIES": 5,
+}
+
+# метрики Prometheus (/metrics); при нескольких процессах (gunicorn,
+# воркеры celery) нужен общий для них каталог MULTIPROCESS_DIR
+METRICS = {
+    "ENABLED": True,
+    "MULTIPROCESS_DIR": os.environ.get("METRICS_MULTIPROCESS_DIR"),
+    "FLUSH_INTERVAL": 5,
+    # кроме этих адресов и сетей - только с `Authorization: Bearer <METRICS_TOKEN>`
+    "ALLOWED_IPS": [
+        "127.0.0.1",
+        "::1",
+        *filter(None, os.environ.get("METRICS_ALLOWED_IPS", "").split(",")),
+    ],
+    "TOKEN": os.environ.get("METRICS_TOKEN") or None,
+    # в production /metrics отдаёт мастер gunicorn на этом порту, не на основном
+    "PORT": int(os.environ.get("METRICS_PORT", 9100 if PRODUCTION else 0)) or None,
+    "COMPACT_INTERVAL": 60,
+}
+
+# дельта-синхронизация, см. todo.sync
+SYNC = {
+    "SKEW_WINDOW": 5,
+    "TOMBSTONE_DAYS": 30,
 }
 
 
 CELERY_BROKER_URL = "redis://redis:6379"
 CELERY_RESULT_BACKEND = "redis://redis:6379"
 CELERY_RESULT_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "prune-tombstones": {
+        "task": "todo.tasks.prune_tombstones",
+        "schedule": 60 * 60 * 24,
+    },
+    # файлы метрик завершившихся процессов celery, см. todo.metrics.compact
+    "compact-metrics": {
+        "task": "todo.tasks.compact_metrics",
+        "schedule": 60,
+    },
+}
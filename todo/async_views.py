@@ -0,0 +1,210 @@
+"""
+Асинхронные версии нагруженных ручек чтения для ASGI (tdp.asgi) по адресам
+с префиксом /async/: ответы те же, что у TodoViewSet.list и retrieve,
+SubTaskDetailView (GET) и DoneTasksView. ORM вызывается асинхронно (aget,
+afirst, async for), токен проверяется aauthenticate; сессии не поддерживаются.
+
+Под WSGI Django выполнит их через async_to_sync, выигрыша там нет, поэтому
+синхронные ручки остаются основными для gunicorn
+"""
+import functools
+from calendar import timegm
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    MethodNotAllowed,
+    NotAuthenticated,
+    NotFound,
+    PermissionDenied,
+)
+from rest_framework.request import Request
+
+from todo.authentication import CachedTokenAuthentication, aauthenticate
+from todo.cache import aget_payloads
+from todo.models import SubTask, Task, UserTaskStats
+from todo.pagination import TaskCursorPagination
+from todo.permissions import IsTaskOwner
+from todo.renderers import MessagePackRenderer, ORJSONRenderer
+from todo.serializers import (
+    DoneTasksSerializer,
+    SubTaskSerializer,
+    TaskReadSerializer,
+)
+from todo.services import get_user_tasks
+from todo.versions import (
+    aget_task_version,
+    aget_user_stats,
+    task_etag,
+    task_last_modified,
+    user_etag,
+    user_last_modified,
+)
+from todo.views import TodoViewSet
+
+
+ALLOWED_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def respond(request, data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    # как у DRF: MessagePack по Accept, иначе JSON
+    if MessagePackRenderer.media_type in request.headers.get("Accept", ""):
+        renderer = MessagePackRenderer()
+        content_type = renderer.media_type
+    else:
+        renderer = ORJSONRenderer()
+        content_type = "application/json"
+    return HttpResponse(
+        renderer.render(data), status=status_code, content_type=content_type
+    )
+
+
+def error_response(request, error: APIException) -> HttpResponse:
+    # тело ошибки как у exception_handler DRF
+    if isinstance(error.detail, (list, dict)):
+        data = error.detail
+    else:
+        data = {"detail": error.detail}
+    response = respond(request, data, error.status_code)
+    if isinstance(error, NotAuthenticated):
+        response.headers["WWW-Authenticate"] = CachedTokenAuthentication.keyword
+    if isinstance(error, MethodNotAllowed):
+        response.headers["Allow"] = ", ".join(ALLOWED_METHODS)
+    return response
+
+
+def api_view(view):
+    """
+    Только чтение, токен обязателен; исключения DRF превращаются в ответы
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ALLOWED_METHODS:
+                raise MethodNotAllowed(request.method)
+            credentials = await aauthenticate(request)
+            if credentials is None:
+                raise NotAuthenticated()
+            request.user, request.auth = credentials
+            if request.method == "OPTIONS":
+                response = HttpResponse()
+                response.headers["Allow"] = ", ".join(ALLOWED_METHODS)
+                return response
+            return await view(request, *args, **kwargs)
+        except APIException as error:
+            return error_response(request, error)
+
+    return wrapper
+
+
+def condition(load, etag_func, last_modified_func):
+    """
+    django.views.decorators.http.condition для async view: версии данных
+    загружает корутина load, дальше работают те же etag_func и
+    last_modified_func, что у синхронных ручек (todo.versions)
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def inner(request, *args, **kwargs):
+            await load(request, *args, **kwargs)
+            etag = etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            last_modified = last_modified_func(request, *args, **kwargs)
+            if last_modified:
+                last_modified = timegm(last_modified.utctimetuple())
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if last_modified and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault("ETag", etag)
+            return response
+
+        return inner
+
+    return decorator
+
+
+def filter_tasks(request: Request, queryset):
+    # фильтры и поиск те же, что у TodoViewSet
+    view = TodoViewSet(request=request, action="list", args=(), kwargs={})
+    for backend in view.filter_backends:
+        queryset = backend().filter_queryset(request, queryset, view)
+    return queryset
+
+
+def read_queryset(user, fields: tuple):
+    queryset = get_user_tasks(user, overdue="overdue" in fields, subtasks=False)
+    return queryset.only(*TaskReadSerializer.columns(fields))
+
+
+async def represent(rows: list, fields: tuple, expand: tuple) -> list:
+    async def serialize(misses: list) -> list:
+        subtasks = None
+        if "subtasks" in expand:
+            subtasks = await TaskReadSerializer.asubtasks_by_task(
+                [row["id"] for row in misses]
+            )
+        return TaskReadSerializer.to_representation(misses, fields, expand, subtasks)
+
+    return await aget_payloads(rows, serialize, shape=fields + expand)
+
+
+@api_view
+@condition(aget_user_stats, user_etag, user_last_modified)
+async def task_list(request):
+    fields, expand = TaskReadSerializer.shape(request.GET, settings.TASK_DEFAULT_EXPAND)
+    # Request DRF нужен фильтрам и пагинации (query_params), запросов он не делает
+    drf_request = Request(request)
+    queryset = TaskReadSerializer.values(
+        filter_tasks(drf_request, read_queryset(request.user, fields)), fields
+    )
+    pagination = TaskCursorPagination()
+    page = await pagination.apaginate_queryset(queryset, drf_request)
+    data = await represent(page, fields, expand)
+    return respond(request, pagination.get_paginated_response(data).data)
+
+
+@api_view
+@condition(aget_task_version, task_etag, task_last_modified)
+async def task_detail(request, pk):
+    fields, expand = TaskReadSerializer.shape(request.GET, settings.TASK_DEFAULT_EXPAND)
+    try:
+        task = await read_queryset(request.user, fields).aget(pk=pk)
+    except Task.DoesNotExist:
+        raise NotFound()
+    row = TaskReadSerializer.row(task, fields)
+    data = await represent([row], fields, expand)
+    return respond(request, data[0])
+
+
+@api_view
+async def subtask_detail(request, pk):
+    try:
+        # задача нужна для проверки владельца, как в SubTaskDetailView
+        subtask = await SubTask.objects.select_related("task").aget(pk=pk)
+    except SubTask.DoesNotExist:
+        raise NotFound()
+    if subtask.task.user_id != request.user.id:
+        raise PermissionDenied(IsTaskOwner.message)
+    return respond(request, SubTaskSerializer(subtask).data)
+
+
+@api_view
+@condition(aget_user_stats, user_etag, user_last_modified)
+async def done_tasks(request):
+    stats = await aget_user_stats(request) or UserTaskStats(user_id=request.user.pk)
+    serializer = DoneTasksSerializer([stats], many=True)
+    return respond(request, serializer.data)
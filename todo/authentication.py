@@ -0,0 +1,242 @@
+import copy
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.authtoken.models import Token
+
+
+DEFAULTS = {
+    "MAX_SIZE": 10000,
+    "TTL": 60,
+    "CACHE_ALIAS": None,
+}
+
+
+class TokenCache:
+    """
+    LRU-кэш token -> (user, token) с временем жизни записей.
+
+    Опционально за локальным кэшем стоит кэш Django (CACHE_ALIAS), общий для
+    всех процессов. В нём же хранится поколение пользователя: при его
+    изменении (invalidate_user) записи с прежним поколением перестают
+    действовать во всех процессах. Поколение проверяется при каждом попадании,
+    поэтому без общего кэша отзыв токена виден только текущему процессу.
+
+    Хранятся и отдаются копии: запросы и потоки не делят один объект User.
+    """
+
+    key_prefix = "auth_token:"
+    generation_prefix = "auth_token_generation:"
+
+    def __init__(
+        self, max_size: int = 10000, ttl: float = 60, cache_alias: str | None = None
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        if self.cache_alias is None:
+            return None
+        return caches[self.cache_alias]
+
+    def generation_key(self, user_id: int) -> str:
+        return self.generation_prefix + str(user_id)
+
+    def get(self, key: str) -> tuple | None:
+        entry = self.get_local(key)
+        shared = self.shared
+        if shared is not None:
+            if entry is None:
+                entry = self.from_shared(key, shared.get(self.key_prefix + key))
+            if entry is not None:
+                generation = shared.get(self.generation_key(entry[1][0].pk))
+                entry = self.revalidate(key, entry, generation)
+        return self.count(entry)
+
+    async def aget(self, key: str) -> tuple | None:
+        """
+        get для async view: общий кэш Django (сеть) опрашивается через его
+        async API, а не блокирует цикл событий
+        """
+        entry = self.get_local(key)
+        shared = self.shared
+        if shared is not None:
+            if entry is None:
+                value = await shared.aget(self.key_prefix + key)
+                entry = self.from_shared(key, value)
+            if entry is not None:
+                generation = await shared.aget(self.generation_key(entry[1][0].pk))
+                entry = self.revalidate(key, entry, generation)
+        return self.count(entry)
+
+    def get_local(self, key: str) -> tuple | None:
+        """
+        (поколение, (user, token)) из локального кэша
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, generation, value = entry
+            if expires > now:
+                self.entries.move_to_end(key)
+                return generation, copy.deepcopy(value)
+            del self.entries[key]
+        return None
+
+    def from_shared(self, key: str, entry: tuple | None) -> tuple | None:
+        if entry is not None:
+            self.set_local(key, *entry)
+        return entry
+
+    def revalidate(self, key: str, entry: tuple, generation: str | None):
+        """
+        entry, если поколение пользователя с момента записи не менялось, иначе
+        запись удаляется из локального кэша
+        """
+        if entry[0] == generation:
+            return entry
+        with self.lock:
+            self.entries.pop(key, None)
+        return None
+
+    def count(self, entry: tuple | None) -> tuple | None:
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: tuple) -> None:
+        shared = self.shared
+        if shared is None:
+            self.set_local(key, None, value)
+            return
+        generation = shared.get(self.generation_key(value[0].pk))
+        self.set_local(key, generation, value)
+        shared.set(self.key_prefix + key, (generation, value), timeout=self.ttl)
+
+    async def aset(self, key: str, value: tuple) -> None:
+        shared = self.shared
+        if shared is None:
+            self.set_local(key, None, value)
+            return
+        generation = await shared.aget(self.generation_key(value[0].pk))
+        self.set_local(key, generation, value)
+        await shared.aset(self.key_prefix + key, (generation, value), timeout=self.ttl)
+
+    def set_local(self, key: str, generation: str | None, value: tuple) -> None:
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Отзывает все закэшированные токены пользователя; вызывается при
+        сохранении User и удалении Token.
+
+        Новое поколение случайное, а не счётчик: после вытеснения ключа из
+        общего кэша счёт не начнётся заново и не совпадёт со старыми записями.
+        Ключ живёт TTL: записи, выданные до его появления, истекают раньше
+        """
+        with self.lock:
+            keys = [
+                key
+                for key, (_, _, (user, _)) in self.entries.items()
+                if user.pk == user_id
+            ]
+            for key in keys:
+                del self.entries[key]
+        if self.shared is not None:
+            self.shared.set(
+                self.generation_key(user_id), uuid.uuid4().hex, timeout=self.ttl
+            )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+def get_token_cache() -> TokenCache:
+    options = {**DEFAULTS, **getattr(settings, "TOKEN_AUTH_CACHE", {})}
+    return TokenCache(
+        max_size=options["MAX_SIZE"],
+        ttl=options["TTL"],
+        cache_alias=options["CACHE_ALIAS"],
+    )
+
+
+token_cache = get_token_cache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который не ходит в базу за уже известными токенами
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = token_cache.get(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_cache.set(key, credentials)
+        return credentials
+
+
+async def aauthenticate(request) -> tuple | None:
+    """
+    CachedTokenAuthentication для async view: (user, token) по заголовку
+    `Authorization: Token <key>`, None без него. Токен читается из базы
+    асинхронно
+    """
+    auth = get_authorization_header(request).split()
+    keyword = CachedTokenAuthentication.keyword.lower().encode()
+    if not auth or auth[0].lower() != keyword:
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed(_("Invalid token header. No credentials provided."))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed(
+            _(
+                "Invalid token header. "
+                "Token string should not contain invalid characters."
+            )
+        )
+
+    credentials = await token_cache.aget(key)
+    if credentials is None:
+        try:
+            token = await Token.objects.select_related("user").aget(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_("Invalid token."))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        credentials = (token.user, token)
+        await token_cache.aset(key, credentials)
+    return credentials
@@ -0,0 +1,326 @@
+from django.db import transaction
+from django.db.models import Count, Q, prefetch_related_objects
+from django.utils import timezone
+
+from rest_framework import serializers, status
+
+from todo import sync
+from todo.models import Task, SubTask, Tombstone
+from todo.search import index_tasks
+from todo.serializers import TaskSerializer, BulkSubTaskSerializer
+from todo.stats import apply_done, update_user_stats
+from todo.versions import bump_task_versions
+
+
+MAX_BULK_ITEMS = 1000
+BATCH_SIZE = 500
+
+# bulk_update не выставляет auto_now и не вызывает save(),
+# поэтому updated_at и version в списке полей
+TASK_FIELDS = (
+    "name",
+    "description",
+    "is_done",
+    "priority",
+    "date",
+    "week_number",
+    "updated_at",
+    "version",
+)
+SUBTASK_FIELDS = ("name", "description", "priority", "is_done", "task_id", "updated_at")
+
+
+def validate_items(data) -> list:
+    """
+    Тело bulk-запроса - непустой список не длиннее MAX_BULK_ITEMS
+    """
+    if not isinstance(data, list) or not data:
+        raise serializers.ValidationError("Expected a non-empty list of items")
+    if len(data) > MAX_BULK_ITEMS:
+        raise serializers.ValidationError(
+            f"Too many items, the limit is {MAX_BULK_ITEMS}"
+        )
+    return data
+
+
+def parse_ids(values) -> list:
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def item_id(item):
+    if not isinstance(item, dict):
+        return None
+    ids = parse_ids([item.get("id")])
+    return ids[0] if ids else None
+
+
+def success(status_code: int, data=None) -> dict:
+    result = {"status": status_code}
+    if data is not None:
+        result["data"] = data
+    return result
+
+
+def failure(status_code: int, errors) -> dict:
+    return {"status": status_code, "errors": errors}
+
+
+NOT_FOUND = failure(status.HTTP_404_NOT_FOUND, {"detail": "Not found."})
+NOT_TASK_OWNER = failure(
+    status.HTTP_403_FORBIDDEN, {"detail": "You don't have permission to access"}
+)
+
+
+def owned_task_ids(user, task_ids) -> set:
+    """
+    Проверка владельца сразу для всех задач - один запрос
+    """
+    return set(
+        Task.objects.filter(user=user, id__in=parse_ids(task_ids)).values_list(
+            "id", flat=True
+        )
+    )
+
+
+def bulk_create_tasks(items: list, context: dict) -> list:
+    user = context["request"].user
+    results, tasks = [], []
+
+    for item in items:
+        serializer = TaskSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results.append(failure(status.HTTP_400_BAD_REQUEST, serializer.errors))
+            continue
+        task = Task(**serializer.validated_data)
+        task.fill_week_number()
+        tasks.append(task)
+        results.append(task)
+
+    with transaction.atomic():
+        Task.objects.bulk_create(tasks, batch_size=BATCH_SIZE)
+        update_user_stats(
+            user.id, tasks=len(tasks), done_tasks=sum(task.is_done for task in tasks)
+        )
+        index_tasks([task.id for task in tasks], created=True)
+
+    return represent_tasks(results, status.HTTP_201_CREATED, context)
+
+
+def bulk_update_tasks(items: list, context: dict) -> list:
+    user = context["request"].user
+    tasks = Task.objects.filter(user=user).in_bulk(
+        [item_id(item) for item in items if item_id(item) is not None]
+    )
+    results, updated, completed = [], {}, []
+    now = timezone.now()
+
+    for item in items:
+        task = tasks.get(item_id(item))
+        if task is None:
+            results.append(NOT_FOUND)
+            continue
+        serializer = TaskSerializer(task, data=item, partial=True, context=context)
+        if not serializer.is_valid():
+            results.append(failure(status.HTTP_400_BAD_REQUEST, serializer.errors))
+            continue
+
+        was_done = task.is_done
+        for field, value in serializer.validated_data.items():
+            setattr(task, field, value)
+        task.fill_week_number()
+        task.updated_at = now
+        task.bump_version()
+        # как и в TodoViewSet.perform_update: выполненная задача выполняет подзадачи
+        if task.is_done and not was_done:
+            completed.append(task.id)
+        updated[task.id] = task
+        results.append(task)
+
+    with transaction.atomic():
+        done_tasks = apply_done(Task, *split_done(updated.values()))
+        Task.objects.bulk_update(updated.values(), TASK_FIELDS, batch_size=BATCH_SIZE)
+        done_subtasks = SubTask.objects.filter(
+            task_id__in=completed, is_done=False
+        ).update(is_done=True, updated_at=now)
+        update_user_stats(user.id, done_tasks=done_tasks, done_subtasks=done_subtasks)
+        index_tasks(list(updated))
+    for task in updated.values():
+        task.forget_version()
+
+    return represent_tasks(results, status.HTTP_200_OK, context)
+
+
+def split_done(objects) -> tuple:
+    """
+    pk выполненных и невыполненных объектов для apply_done
+    """
+    done, undone = [], []
+    for obj in objects:
+        (done if obj.is_done else undone).append(obj.pk)
+    return done, undone
+
+
+def bulk_delete_tasks(ids: list, user) -> list:
+    tasks = Task.objects.filter(user=user, id__in=parse_ids(ids))
+    with transaction.atomic():
+        rows = dict(tasks.select_for_update().values_list("id", "is_done"))
+        subtasks = SubTask.objects.filter(task_id__in=rows).aggregate(
+            total=Count("id"), done=Count("id", filter=Q(is_done=True))
+        )
+        delete_batch(Task.objects.filter(id__in=rows))
+        update_user_stats(
+            user.id,
+            tasks=-len(rows),
+            done_tasks=-sum(rows.values()),
+            subtasks=-subtasks["total"],
+            done_subtasks=-subtasks["done"],
+        )
+        sync.bury_many(Tombstone.TASK, rows, user.id)
+    return deleted_results(ids, set(rows))
+
+
+def delete_batch(queryset) -> None:
+    """
+    Удаляет queryset без обновления счётчиков и записей об удалении
+    сигналами по одному объекту: вызывающий обновляет их сам на всю пачку
+    """
+    queryset.batch_delete = True
+    queryset.delete()
+
+
+def deleted_results(ids: list, found: set) -> list:
+    return [
+        success(status.HTTP_204_NO_CONTENT)
+        if parse_ids([value]) and parse_ids([value])[0] in found
+        else NOT_FOUND
+        for value in ids
+    ]
+
+
+def represent_tasks(results: list, status_code: int, context: dict) -> list:
+    tasks = [result for result in results if isinstance(result, Task)]
+    prefetch_related_objects(tasks, "subtasks")
+    # как аннотация в get_user_tasks: ответ такой же, как у POST/PATCH /todo/
+    today = timezone.now().date()
+    for task in tasks:
+        task.overdue = task.date < today
+    serializer = TaskSerializer(context=context)
+    return [
+        success(status_code, serializer.to_representation(result))
+        if isinstance(result, Task)
+        else result
+        for result in results
+    ]
+
+
+def bulk_create_subtasks(items: list, user) -> list:
+    owned = owned_task_ids(
+        user, [item.get("task") for item in items if isinstance(item, dict)]
+    )
+    results, subtasks = [], []
+
+    for item in items:
+        serializer = BulkSubTaskSerializer(data=item)
+        if not serializer.is_valid():
+            results.append(failure(status.HTTP_400_BAD_REQUEST, serializer.errors))
+            continue
+        if serializer.validated_data["task_id"] not in owned:
+            results.append(NOT_TASK_OWNER)
+            continue
+        subtask = SubTask(**serializer.validated_data)
+        subtasks.append(subtask)
+        results.append(subtask)
+
+    with transaction.atomic():
+        SubTask.objects.bulk_create(subtasks, batch_size=BATCH_SIZE)
+        update_user_stats(
+            user.id,
+            subtasks=len(subtasks),
+            done_subtasks=sum(subtask.is_done for subtask in subtasks),
+        )
+        touched_tasks = list({subtask.task_id for subtask in subtasks})
+        bump_task_versions(touched_tasks)
+        index_tasks(touched_tasks)
+
+    return represent_subtasks(results, status.HTTP_201_CREATED)
+
+
+def bulk_update_subtasks(items: list, user) -> list:
+    subtasks = SubTask.objects.filter(task__user=user).in_bulk(
+        [item_id(item) for item in items if item_id(item) is not None]
+    )
+    owned = owned_task_ids(
+        user, [item.get("task") for item in items if isinstance(item, dict)]
+    )
+    results, updated, touched_tasks = [], {}, set()
+    now = timezone.now()
+
+    for item in items:
+        subtask = subtasks.get(item_id(item))
+        if subtask is None:
+            results.append(NOT_FOUND)
+            continue
+        serializer = BulkSubTaskSerializer(subtask, data=item, partial=True)
+        if not serializer.is_valid():
+            results.append(failure(status.HTTP_400_BAD_REQUEST, serializer.errors))
+            continue
+        task_id = serializer.validated_data.get("task_id", subtask.task_id)
+        if task_id != subtask.task_id and task_id not in owned:
+            results.append(NOT_TASK_OWNER)
+            continue
+
+        # документ нужно обновить и у старой, и у новой задачи
+        touched_tasks.add(subtask.task_id)
+        for field, value in serializer.validated_data.items():
+            setattr(subtask, field, value)
+        touched_tasks.add(subtask.task_id)
+        subtask.updated_at = now
+        updated[subtask.id] = subtask
+        results.append(subtask)
+
+    with transaction.atomic():
+        done_subtasks = apply_done(SubTask, *split_done(updated.values()))
+        SubTask.objects.bulk_update(
+            updated.values(), SUBTASK_FIELDS, batch_size=BATCH_SIZE
+        )
+        update_user_stats(user.id, done_subtasks=done_subtasks)
+        bump_task_versions(touched_tasks)
+        index_tasks(list(touched_tasks))
+
+    return represent_subtasks(results, status.HTTP_200_OK)
+
+
+def bulk_delete_subtasks(ids: list, user) -> list:
+    subtasks = SubTask.objects.filter(task__user=user, id__in=parse_ids(ids))
+    with transaction.atomic():
+        rows = list(
+            subtasks.select_for_update().values_list("id", "task_id", "is_done")
+        )
+        found = {subtask_id for subtask_id, _, _ in rows}
+        touched_tasks = list({task_id for _, task_id, _ in rows})
+        delete_batch(SubTask.objects.filter(id__in=found))
+        update_user_stats(
+            user.id,
+            subtasks=-len(rows),
+            done_subtasks=-sum(is_done for _, _, is_done in rows),
+        )
+        bump_task_versions(touched_tasks)
+        index_tasks(touched_tasks)
+        sync.bury_many(Tombstone.SUBTASK, found, user.id)
+    return deleted_results(ids, found)
+
+
+def represent_subtasks(results: list, status_code: int) -> list:
+    serializer = BulkSubTaskSerializer()
+    return [
+        success(status_code, serializer.to_representation(result))
+        if isinstance(result, SubTask)
+        else result
+        for result in results
+    ]
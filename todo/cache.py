@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BACKEND": "todo.cache.LocMemPayloadCache",
+    "OPTIONS": {},
+}
+
+
+class PayloadCache:
+    """
+    Кэш сериализованных задач по ключу (id, version).
+
+    Версия задачи растёт при любом её изменении (см. todo.versions), поэтому
+    записи не инвалидируются - устаревшие просто перестают запрашиваться
+    и вытесняются.
+    """
+
+    # данные в памяти процесса: async view обращаются к кэшу без потока,
+    # сетевой кэш вызывается в потоке, чтобы не блокировать цикл событий
+    in_process = False
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+
+    def get_many(self, keys: list) -> dict:
+        found = self.fetch(keys)
+        with self.stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    async def aget_many(self, keys: list) -> dict:
+        if self.in_process:
+            return self.get_many(keys)
+        return await sync_to_async(self.get_many, thread_sensitive=False)(keys)
+
+    def set_many(self, payloads: dict) -> None:
+        raise NotImplementedError
+
+    async def aset_many(self, payloads: dict) -> None:
+        if self.in_process:
+            return self.set_many(payloads)
+        return await sync_to_async(self.set_many, thread_sensitive=False)(payloads)
+
+    def fetch(self, keys: list) -> dict:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        with self.stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+
+class LocMemPayloadCache(PayloadCache):
+    """
+    LRU в памяти процесса
+    """
+
+    in_process = True
+
+    def __init__(self, max_size: int = 10000) -> None:
+        super().__init__()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fetch(self, keys: list) -> dict:
+        found = {}
+        with self.lock:
+            for key in keys:
+                payload = self.entries.get(key)
+                if payload is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = payload
+        return found
+
+    def set_many(self, payloads: dict) -> None:
+        with self.lock:
+            for key, payload in payloads.items():
+                self.entries[key] = payload
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        super().clear()
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "size": len(self.entries)}
+
+
+class RedisPayloadCache(PayloadCache):
+    """
+    Общий для всех процессов кэш в Redis (или совместимом сервере).
+    client - объект с методами mget и pipeline, как у redis.Redis
+    """
+
+    key_prefix = "task_payload:"
+
+    def __init__(self, url: str | None = None, ttl: int = 3600, client=None) -> None:
+        super().__init__()
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+
+    def fetch(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        values = self.client.mget([self.key_prefix + key for key in keys])
+        return {
+            key: json.loads(value)
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def set_many(self, payloads: dict) -> None:
+        if not payloads:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for key, payload in payloads.items():
+            pipeline.set(self.key_prefix + key, json.dumps(payload), ex=self.ttl)
+        pipeline.execute()
+
+
+def get_task_cache() -> PayloadCache:
+    options = {**DEFAULTS, **getattr(settings, "TASK_CACHE", {})}
+    return import_string(options["BACKEND"])(**options["OPTIONS"])
+
+
+task_cache = get_task_cache()
+
+
+def payload_key(row: dict, shape: str = "") -> str:
+    # updated_at защищает от повторного использования id после отката
+    # транзакции (sqlite), shape - набор полей ответа (?fields, ?expand)
+    return f"{row['id']}:{row['version']}:{row['updated_at'].timestamp()}:{shape}"
+
+
+def get_payloads(rows: list, serialize, shape: tuple = ()) -> list:
+    """
+    Сериализованные задачи (строки из .values()): найденные в кэше берутся
+    оттуда, остальные сериализуются функцией serialize.
+
+    Признак просрочки зависит от текущей даты, поэтому пересчитывается
+    при каждой сборке ответа
+    """
+    keys = payload_keys(rows, shape)
+    payloads = task_cache.get_many(keys)
+    misses = find_misses(rows, keys, payloads)
+    if misses:
+        fresh = fresh_payloads(misses, serialize(misses), shape)
+        task_cache.set_many(fresh)
+        payloads.update(fresh)
+    return build_payloads(rows, keys, payloads)
+
+
+async def aget_payloads(rows: list, serialize, shape: tuple = ()) -> list:
+    """
+    get_payloads для async view: serialize - корутина, кэш опрашивается
+    через aget_many/aset_many
+    """
+    keys = payload_keys(rows, shape)
+    payloads = await task_cache.aget_many(keys)
+    misses = find_misses(rows, keys, payloads)
+    if misses:
+        fresh = fresh_payloads(misses, await serialize(misses), shape)
+        await task_cache.aset_many(fresh)
+        payloads.update(fresh)
+    return build_payloads(rows, keys, payloads)
+
+
+def payload_keys(rows: list, shape: tuple) -> list:
+    shape = ",".join(shape)
+    return [payload_key(row, shape) for row in rows]
+
+
+def find_misses(rows: list, keys: list, payloads: dict) -> list:
+    misses = [row for row, key in zip(rows, keys) if key not in payloads]
+    logger.debug("task cache: %s hits, %s misses", len(rows) - len(misses), len(misses))
+    return misses
+
+
+def fresh_payloads(misses: list, serialized: list, shape: tuple) -> dict:
+    return dict(zip(payload_keys(misses, shape), serialized))
+
+
+def build_payloads(rows: list, keys: list, payloads: dict) -> list:
+    today = timezone.now().date()
+    return [with_overdue(payloads[key], row, today) for row, key in zip(rows, keys)]
+
+
+def with_overdue(payload: dict, row: dict, today) -> dict:
+    # date есть в строке, даже если поля нет в ответе (?fields=id,overdue)
+    if "overdue" not in payload:
+        return payload
+    # копия: закэшированный словарь общий для всех запросов
+    payload = payload.copy()
+    payload["overdue"] = row["date"] < today
+    return payload
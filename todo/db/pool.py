@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+
+from django.db import OperationalError
+
+
+DEFAULTS = {
+    # соединений на процесс: выданных потокам и простаивающих вместе
+    "MAX_SIZE": 4,
+    "MAX_AGE": 600,
+    "HEALTH_CHECK_INTERVAL": 30,
+    # столько секунд поток ждёт свободное соединение, потом ошибка
+    "TIMEOUT": 10,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class PooledConnection:
+    __slots__ = ("connection", "created", "last_used")
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.created = self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с базой одного процесса, общий для его потоков.
+
+    Как и todo.mail.SMTPConnectionPool: соединение живёт не дольше max_age
+    секунд, а простаивавшее дольше health_check_interval проверяется перед
+    выдачей. Сами соединения открывает, проверяет, сбрасывает и закрывает
+    драйвер базы: функции connect, check, reset и close
+    """
+
+    def __init__(
+        self,
+        connect,
+        check,
+        reset,
+        close,
+        max_size: int = 4,
+        max_age: float = 600,
+        health_check_interval: float = 30,
+        timeout: float = 10,
+    ) -> None:
+        self.connect = connect
+        self.check = check
+        self.reset_connection = reset
+        self.close_connection = close
+        self.max_size = max_size
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.forget()
+
+    def forget(self) -> None:
+        """
+        Забывает соединения, не закрывая их (сокеты принадлежат родителю после fork)
+        """
+        self.idle = []
+        # id(соединение) -> PooledConnection выданных соединений
+        self.in_use = {}
+        # мест, занятых соединениями, которые сейчас открываются
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.opened = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.idle) + len(self.in_use) + self.pending
+
+    def is_usable(self, pooled: PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - pooled.created > self.max_age:
+            return False
+        if now - pooled.last_used > self.health_check_interval:
+            return self.check(pooled.connection)
+        return True
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    raise PoolTimeout(
+                        f"No free database connection in {self.timeout} s "
+                        f"(pool size {self.max_size})"
+                    )
+            pooled = self.idle.pop() if self.idle else None
+            # место занимается сразу, а соединение проверяется и открывается
+            # вне блокировки
+            self.pending += 1
+
+        try:
+            if pooled is not None and not self.is_usable(pooled):
+                self.close_connection(pooled.connection)
+                pooled = None
+            if pooled is None:
+                pooled = PooledConnection(self.connect())
+                with self.condition:
+                    self.opened += 1
+        except BaseException:
+            with self.condition:
+                self.pending -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.pending -= 1
+            self.in_use[id(pooled.connection)] = pooled
+        return pooled.connection
+
+    def give_back(self, connection, pooled: PooledConnection | None = None) -> None:
+        with self.condition:
+            del self.in_use[id(connection)]
+            if pooled is not None:
+                self.idle.append(pooled)
+            self.condition.notify()
+
+    def release(self, connection) -> None:
+        """
+        Возвращает соединение в пул. Соединение с незавершённой транзакцией
+        откатывается, а если сбросить его не удалось - закрывается
+        """
+        with self.condition:
+            pooled = self.in_use.get(id(connection))
+        if pooled is None:
+            # не из этого пула, например унаследовано от родителя при fork
+            return
+        if self.reset_connection(connection):
+            pooled.last_used = time.monotonic()
+            self.give_back(connection, pooled)
+        else:
+            self.discard(connection)
+
+    def discard(self, connection) -> None:
+        """
+        Закрывает выданное соединение и освобождает его место в пуле
+        """
+        with self.condition:
+            if id(connection) not in self.in_use:
+                return
+        self.give_back(connection)
+        self.close_connection(connection)
+
+    def close_all(self) -> None:
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            self.close_connection(pooled.connection)
+
+
+def get_options(settings_dict: dict) -> dict:
+    return {**DEFAULTS, **settings_dict.get("POOL", {})}
+
+
+# пулы процесса по алиасу базы
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, factory) -> ConnectionPool:
+    pool = pools.get(alias)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(alias)
+            if pool is None:
+                pool = pools[alias] = factory()
+    return pool
+
+
+def close_pools() -> None:
+    with pools_lock:
+        for pool in pools.values():
+            pool.close_all()
+
+
+def _forget_pools_after_fork() -> None:
+    global pools_lock
+    pools_lock = threading.Lock()
+    for pool in pools.values():
+        pool.forget()
+
+
+# воркеры gunicorn и prefork-воркеры celery открывают свои соединения
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
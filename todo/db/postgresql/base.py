@@ -0,0 +1,113 @@
+"""
+PostgreSQL с пулом соединений процесса (todo.db.pool): ENGINE
+"todo.db.postgresql", настройки пула - ключ POOL базы в DATABASES.
+
+Django закрывает соединение в конце запроса (CONN_MAX_AGE = 0), а этот
+backend вместо закрытия возвращает его в пул, и следующий запрос любого
+потока получает уже открытое соединение
+"""
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from django.db.backends.postgresql import base, creation
+from django.db.backends.base.base import NO_DB_ALIAS
+
+from todo.db.pool import ConnectionPool, get_options, get_pool
+
+
+def check(connection) -> bool:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        # без autocommit SELECT открыл транзакцию
+        return reset(connection)
+    except psycopg2.Error:
+        return False
+
+
+def reset(connection) -> bool:
+    """
+    Откатывает незавершённую транзакцию; False - соединение не годится
+    """
+    try:
+        if connection.closed:
+            return False
+        if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        return connection.info.transaction_status == TRANSACTION_STATUS_IDLE
+    except psycopg2.Error:
+        return False
+
+
+def close(connection) -> None:
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # простаивающие в пуле соединения не дают удалить или скопировать базу
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close_pool()
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.connection.close_pool()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params: dict) -> ConnectionPool:
+        def create() -> ConnectionPool:
+            options = get_options(self.settings_dict)
+            return ConnectionPool(
+                connect=lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params
+                ),
+                check=check,
+                reset=reset,
+                close=close,
+                max_size=options["MAX_SIZE"],
+                max_age=options["MAX_AGE"],
+                health_check_interval=options["HEALTH_CHECK_INTERVAL"],
+                timeout=options["TIMEOUT"],
+            )
+
+        # параметры меняются, например при переключении на тестовую базу
+        return get_pool((self.alias, repr(sorted(conn_params.items()))), create)
+
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            # служебные соединения (создание и удаление баз) не переиспользуются
+            self.pool = None
+            return super().get_new_connection(conn_params)
+
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.acquire()
+        # базовый класс запоминает уровень изоляции только при подключении
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        pool = getattr(self, "pool", None)
+        if self.connection is None or pool is None:
+            return super()._close()
+        if self.in_atomic_block:
+            # Django оставит ссылку на соединение до конца atomic-блока,
+            # отдавать его другому потоку нельзя
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
+
+    def close_pool(self) -> None:
+        """
+        Закрывает простаивающие соединения пула этой базы
+        """
+        self.close()
+        self.get_pool(self.get_connection_params()).close_all()
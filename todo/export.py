@@ -0,0 +1,84 @@
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from todo.serializers import TaskReadSerializer
+from todo.services import get_user_tasks
+
+
+CHUNK_SIZE = 500
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+SUBTASK_COLUMNS = ("id", "name", "description", "priority", "is_done")
+CSV_HEADER = (
+    *TaskReadSerializer.output_fields,
+    *(f"subtask_{column}" for column in SUBTASK_COLUMNS),
+)
+
+
+def get_chunk_size() -> int:
+    return getattr(settings, "EXPORT_CHUNK_SIZE", CHUNK_SIZE)
+
+
+class Echo:
+    """
+    Файлоподобный объект для csv.writer: write возвращает строку,
+    а не пишет её в буфер
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_tasks(user, chunk_size: int | None = None):
+    """
+    Задачи пользователя вместе с подзадачами.
+
+    Строки читаются курсором (.iterator) пачками по chunk_size, подзадачи
+    загружаются одним запросом на пачку, поэтому в памяти одновременно
+    находится не больше одной пачки
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    queryset = TaskReadSerializer.values(
+        get_user_tasks(user, subtasks=False).order_by("id")
+    )
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield from TaskReadSerializer.to_representation(chunk)
+
+
+def export_ndjson(user, chunk_size: int | None = None):
+    for task in iter_tasks(user, chunk_size):
+        yield json.dumps(task, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def export_csv(user, chunk_size: int | None = None):
+    """
+    Строка на каждую подзадачу; задача без подзадач - одна строка
+    с пустыми колонками подзадачи
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for task in iter_tasks(user, chunk_size):
+        values = [task[field] for field in TaskReadSerializer.output_fields]
+        for subtask in task["subtasks"] or [dict.fromkeys(SUBTASK_COLUMNS)]:
+            yield writer.writerow(
+                [*values, *(subtask[column] for column in SUBTASK_COLUMNS)]
+            )
+
+
+EXPORTERS = {
+    "ndjson": export_ndjson,
+    "csv": export_csv,
+}
+
+
+def export_tasks(user, output: str, chunk_size: int | None = None):
+    return EXPORTERS[output](user, chunk_size)
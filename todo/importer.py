@@ -0,0 +1,171 @@
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework import serializers
+
+from todo.export import CONTENT_TYPES, SUBTASK_COLUMNS
+from todo.models import Task, SubTask
+from todo.search import index_tasks
+from todo.serializers import ImportTaskSerializer
+from todo.stats import update_user_stats
+
+
+BATCH_SIZE = 500
+# в ответе не больше стольких ошибок, остальные только считаются
+MAX_REPORTED_ERRORS = 1000
+
+# формат по Content-Type запроса
+FORMATS = {content_type: name for name, content_type in CONTENT_TYPES.items()}
+
+
+def get_batch_size() -> int:
+    return getattr(settings, "IMPORT_BATCH_SIZE", BATCH_SIZE)
+
+
+def parse_ndjson(lines):
+    """
+    (номер строки, задача) для каждой непустой строки; подзадачи - в ключе
+    subtasks, как в выгрузке
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def parse_csv(lines):
+    """
+    Формат выгрузки: строка на подзадачу, соседние строки с одинаковым id
+    относятся к одной задаче. Пустая ячейка - значение не задано
+    """
+    reader = csv.DictReader(lines)
+
+    def numbered_rows():
+        start = reader.line_num + 2
+        for row in reader:
+            yield start, row
+            start = reader.line_num + 1
+
+    def task_key(numbered_row):
+        # строки без id - отдельные задачи
+        return numbered_row[1].get("id") or object()
+
+    for _, rows in itertools.groupby(numbered_rows(), key=task_key):
+        rows = list(rows)
+        line_number, first = rows[0]
+        task = {
+            column: value
+            for column, value in first.items()
+            if column and value and not column.startswith("subtask_")
+        }
+        task["subtasks"] = [
+            subtask
+            for _, row in rows
+            if (
+                subtask := {
+                    column: row[f"subtask_{column}"]
+                    for column in SUBTASK_COLUMNS
+                    if row.get(f"subtask_{column}")
+                }
+            )
+        ]
+        yield line_number, task
+
+
+PARSERS = {
+    "ndjson": parse_ndjson,
+    "csv": parse_csv,
+}
+
+
+def validate_batch(records: list, serializer: ImportTaskSerializer) -> tuple:
+    """
+    Проверяет пачку записей одним экземпляром сериализатора.
+    Возвращает (валидные задачи, ошибки по строкам)
+    """
+    valid, errors = [], []
+    for line_number, data in records:
+        if not isinstance(data, dict):
+            errors.append({"line": line_number, "errors": ["Expected an object"]})
+            continue
+        try:
+            valid.append(serializer.run_validation(data))
+        except serializers.ValidationError as exc:
+            errors.append({"line": line_number, "errors": exc.detail})
+    return valid, errors
+
+
+@transaction.atomic
+def insert_batch(user, items: list) -> tuple:
+    """
+    bulk_create задач, затем подзадач; save() и сигналы не вызываются,
+    поэтому week_number, счётчики и поисковые документы - здесь же
+    """
+    tasks, subtasks = [], []
+    for item in items:
+        subtasks.append(item.pop("subtasks", []))
+        task = Task(user=user, **item)
+        task.fill_week_number()
+        tasks.append(task)
+    Task.objects.bulk_create(tasks)
+
+    subtasks = [
+        SubTask(task_id=task.id, **subtask)
+        for task, task_subtasks in zip(tasks, subtasks)
+        for subtask in task_subtasks
+    ]
+    SubTask.objects.bulk_create(subtasks)
+
+    update_user_stats(
+        user.id,
+        tasks=len(tasks),
+        done_tasks=sum(task.is_done for task in tasks),
+        subtasks=len(subtasks),
+        done_subtasks=sum(subtask.is_done for subtask in subtasks),
+    )
+    index_tasks([task.id for task in tasks], created=True)
+    return len(tasks), len(subtasks)
+
+
+def import_tasks(user, lines, input_format: str, batch_size: int | None = None) -> dict:
+    """
+    Импорт задач с подзадачами из строк NDJSON или CSV.
+
+    Записи читаются потоком и обрабатываются пачками по batch_size: каждая
+    пачка проверяется и вставляется в своей транзакции. Ошибочные записи
+    пропускаются и попадают в отчёт, остальные записи пачки сохраняются
+    """
+    batch_size = batch_size or get_batch_size()
+    records = PARSERS[input_format](lines)
+    serializer = ImportTaskSerializer()
+    report = {"tasks": 0, "subtasks": 0, "error_count": 0, "errors": []}
+
+    while True:
+        try:
+            batch = list(itertools.islice(records, batch_size))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            # дальше файл не читается; уже вставленные пачки остаются
+            add_errors(report, [{"line": None, "errors": [f"Unreadable file: {exc}"]}])
+            break
+        if not batch:
+            break
+        valid, errors = validate_batch(batch, serializer)
+        if valid:
+            tasks, subtasks = insert_batch(user, valid)
+            report["tasks"] += tasks
+            report["subtasks"] += subtasks
+        add_errors(report, errors)
+    return report
+
+
+def add_errors(report: dict, errors: list) -> None:
+    report["error_count"] += len(errors)
+    free = MAX_REPORTED_ERRORS - len(report["errors"])
+    report["errors"].extend(errors[:free])
@@ -0,0 +1,545 @@
+import asyncio
+import http.client
+import io
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from todo.models import Task, SubTask, User
+from todo.seed import WORDS
+
+
+# сценарий -> вес; сценарии описаны в SCENARIOS
+DEFAULT_MIX = {
+    "todo-list": 4,
+    "todo-list-filter": 2,
+    "todo-list-search": 2,
+    "todo-detail": 3,
+    "subtask": 2,
+    "create_subtask": 1,
+    "done_tasks": 2,
+    "api-token-auth": 1,
+}
+
+# только чтение: у этих сценариев есть асинхронные ручки (/async/...)
+READ_MIX = {
+    name: DEFAULT_MIX[name]
+    for name in (
+        "todo-list",
+        "todo-list-filter",
+        "todo-list-search",
+        "todo-detail",
+        "subtask",
+        "done_tasks",
+    )
+}
+
+# столько задач и подзадач пользователя запоминается для запросов по id
+SAMPLE_IDS = 20
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class Session:
+    """
+    Виртуальный пользователь: токен и id части его задач и подзадач
+    """
+
+    def __init__(self, user: User, token: str) -> None:
+        self.user = user
+        self.token = token
+        self.task_ids = []
+        self.subtask_ids = []
+
+
+def build_sessions(prefix: str, limit: int | None = None) -> list:
+    """
+    Сессии пользователей с именами на prefix (см. seed_load); недостающие
+    токены создаются одним запросом
+    """
+    users = list(User.objects.filter(username__startswith=prefix).order_by("id"))
+    if limit is not None:
+        users = users[:limit]
+    tokens = dict(Token.objects.filter(user__in=users).values_list("user_id", "key"))
+    missing = [
+        Token(user=user, key=Token.generate_key())
+        for user in users
+        if user.id not in tokens
+    ]
+    Token.objects.bulk_create(missing)
+    tokens.update((token.user_id, token.key) for token in missing)
+
+    sessions = {user.id: Session(user, tokens[user.id]) for user in users}
+    for user_id, task_id in Task.objects.filter(user__in=users).values_list(
+        "user_id", "id"
+    ):
+        if len(sessions[user_id].task_ids) < SAMPLE_IDS:
+            sessions[user_id].task_ids.append(task_id)
+    for user_id, subtask_id in SubTask.objects.filter(task__user__in=users).values_list(
+        "task__user_id", "id"
+    ):
+        if len(sessions[user_id].subtask_ids) < SAMPLE_IDS:
+            sessions[user_id].subtask_ids.append(subtask_id)
+    return list(sessions.values())
+
+
+# сценарии: (rng, сессия, пароль) -> (метод, путь, query, тело) или None,
+# если у пользователя нет нужных данных
+
+
+def todo_list(rng, session, password):
+    return "GET", reverse("todo-list"), {}, None
+
+
+def todo_list_filter(rng, session, password):
+    query = rng.choice(
+        [
+            {"is_done": rng.choice(["true", "false"])},
+            {"priority": rng.randint(1, 3)},
+            {"is_done": "false", "priority": rng.randint(1, 3)},
+        ]
+    )
+    return "GET", reverse("todo-list"), query, None
+
+
+def todo_list_search(rng, session, password):
+    return "GET", reverse("todo-list"), {"search": rng.choice(WORDS)}, None
+
+
+def todo_detail(rng, session, password):
+    if not session.task_ids:
+        return None
+    task_id = rng.choice(session.task_ids)
+    return "GET", reverse("todo-detail", args=(task_id,)), {}, None
+
+
+def subtask(rng, session, password):
+    if not session.subtask_ids:
+        return None
+    subtask_id = rng.choice(session.subtask_ids)
+    return "GET", reverse("subtask", args=(subtask_id,)), {}, None
+
+
+def create_subtask(rng, session, password):
+    if not session.task_ids:
+        return None
+    data = {"name": f"load {rng.choice(WORDS)}", "task": rng.choice(session.task_ids)}
+    return "POST", reverse("create_subtask"), {}, data
+
+
+def done_tasks(rng, session, password):
+    return "GET", reverse("done_tasks"), {}, None
+
+
+def token_auth(rng, session, password):
+    data = {"username": session.user.username, "password": password}
+    return "POST", reverse("auth"), {}, data
+
+
+SCENARIOS = {
+    "todo-list": todo_list,
+    "todo-list-filter": todo_list_filter,
+    "todo-list-search": todo_list_search,
+    "todo-detail": todo_detail,
+    "subtask": subtask,
+    "create_subtask": create_subtask,
+    "done_tasks": done_tasks,
+    "api-token-auth": token_auth,
+}
+
+
+def parse_mix(value: str) -> dict:
+    """
+    "todo-list=3,subtask=1" -> {"todo-list": 3, "subtask": 1}
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}")
+        try:
+            mix[name] = float(weight) if weight else 1
+        except ValueError:
+            raise ValueError(f"Wrong weight for {name!r}")
+    if not any(mix.values()):
+        raise ValueError("All weights are zero")
+    return mix
+
+
+def get_host() -> str:
+    hosts = [host for host in settings.ALLOWED_HOSTS if not host.startswith((".", "*"))]
+    return hosts[0] if hosts else "localhost"
+
+
+class WSGIClient:
+    """
+    Запросы к WSGI-приложению в этом же процессе, без сети
+    """
+
+    def __init__(self, application) -> None:
+        self.application = application
+        self.host = get_host()
+
+    def __call__(self, method: str, path: str, query: dict, data, token=None) -> int:
+        """
+        Возвращает код ответа. Тело ответа дочитывается: потоковые ответы
+        отдают данные только так
+        """
+        body = json.dumps(data).encode() if data is not None else b""
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": urlencode(query),
+            "HTTP_HOST": self.host,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+        }
+        if token is not None:
+            environ["HTTP_AUTHORIZATION"] = f"Token {token}"
+        setup_testing_defaults(environ)
+
+        status = []
+        response = self.application(
+            environ,
+            lambda status_line, headers, exc_info=None: status.append(status_line),
+        )
+        try:
+            for _ in response:
+                pass
+        finally:
+            # close() отправляет request_finished, как это сделал бы WSGI-сервер
+            if hasattr(response, "close"):
+                response.close()
+        return int(status[0].split()[0])
+
+    def close(self) -> None:
+        # соединения с базой открываются в каждом потоке отдельно
+        connections.close_all()
+
+
+class HTTPClient:
+    """
+    Запросы к запущенному серверу по HTTP; у каждого потока своё
+    keep-alive соединение
+    """
+
+    def __init__(self, url: str, timeout: float = 30) -> None:
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        return connection
+
+    def __call__(self, method: str, path: str, query: dict, data, token=None) -> int:
+        body = json.dumps(data).encode() if data is not None else None
+        headers = {"Content-Type": "application/json"}
+        if token is not None:
+            headers["Authorization"] = f"Token {token}"
+        if query:
+            path = f"{path}?{urlencode(query)}"
+
+        # сервер мог закрыть простаивающее соединение: одна повторная попытка
+        for attempt in range(2):
+            connection = self.connection()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+class AsyncHTTPClient:
+    """
+    HTTP/1.1 на asyncio: сотни одновременных keep-alive соединений из одного
+    потока. prefix добавляется к путям, например /async для todo.async_views
+    """
+
+    def __init__(self, url: str, prefix: str = "", timeout: float = 30) -> None:
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def connection(self) -> "AsyncHTTPConnection":
+        return AsyncHTTPConnection(self)
+
+
+class AsyncHTTPConnection:
+    def __init__(self, client: AsyncHTTPClient) -> None:
+        self.client = client
+        self.reader = self.writer = None
+
+    async def __call__(self, method: str, path: str, query: dict, data, token=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        path = self.client.prefix + path
+        if query:
+            path = f"{path}?{urlencode(query)}"
+        headers = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.client.host}:{self.client.port}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        if token is not None:
+            headers.append(f"Authorization: Token {token}")
+        request = ("\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+        # сервер мог закрыть простаивающее соединение: одна повторная попытка
+        for attempt in range(2):
+            try:
+                if self.writer is None:
+                    self.reader, self.writer = await asyncio.open_connection(
+                        self.client.host, self.client.port
+                    )
+                self.writer.write(request)
+                return await asyncio.wait_for(
+                    self.read_response(method), self.client.timeout
+                )
+            except (OSError, EOFError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    async def read_response(self, method: str) -> int:
+        """
+        Код ответа; тело дочитывается (Content-Length или chunked)
+        """
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise EOFError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "HEAD" or status in (204, 304):
+            pass
+        elif headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                # данные куска и CRLF после него (после последнего - пустая строка)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection") == "close":
+            await self.close()
+        return status
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+
+def run(
+    client,
+    sessions: list,
+    mix: dict,
+    requests: int | None = None,
+    duration: float | None = None,
+    threads: int = 8,
+    password: str = "loadtest",
+    seed: int | None = None,
+) -> dict:
+    """
+    Гоняет сценарии из mix с весами в threads потоках через client
+    (WSGIClient или HTTPClient), пока не выполнено requests запросов
+    или не прошло duration секунд. Возвращает отчёт summarize
+    """
+    if not sessions:
+        raise ValueError("No users to run the load test with")
+    if requests is None and duration is None:
+        raise ValueError("Set requests or duration")
+
+    names, weights = zip(*mix.items())
+    lock = threading.Lock()
+    sent = 0
+    deadline = None if duration is None else time.monotonic() + duration
+
+    def take() -> bool:
+        nonlocal sent
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        with lock:
+            if requests is not None and sent >= requests:
+                return False
+            sent += 1
+        return True
+
+    def worker(index: int) -> list:
+        rng = random.Random(None if seed is None else seed + index)
+        samples = []
+        try:
+            while take():
+                name = rng.choices(names, weights)[0]
+                session = rng.choice(sessions)
+                request = SCENARIOS[name](rng, session, password)
+                if request is None:
+                    continue
+                started = time.perf_counter()
+                try:
+                    status = client(*request, token=session.token)
+                except Exception:
+                    status = None
+                samples.append((name, status, time.perf_counter() - started))
+        finally:
+            client.close()
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+    return summarize([sample for samples in results for sample in samples], elapsed)
+
+
+def arun(
+    client: AsyncHTTPClient,
+    sessions: list,
+    mix: dict,
+    requests: int | None = None,
+    duration: float | None = None,
+    connections: int = 100,
+    password: str = "loadtest",
+    seed: int | None = None,
+) -> dict:
+    """
+    run с connections одновременными соединениями в одном потоке (asyncio):
+    так нагрузку с большим числом соединений не ограничивают потоки клиента
+    """
+    if not sessions:
+        raise ValueError("No users to run the load test with")
+    if requests is None and duration is None:
+        raise ValueError("Set requests or duration")
+
+    names, weights = zip(*mix.items())
+    sent = 0
+    deadline = None if duration is None else time.monotonic() + duration
+
+    def take() -> bool:
+        # корутины переключаются только на await, блокировка не нужна
+        nonlocal sent
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        if requests is not None and sent >= requests:
+            return False
+        sent += 1
+        return True
+
+    async def worker(index: int) -> list:
+        rng = random.Random(None if seed is None else seed + index)
+        connection = client.connection()
+        samples = []
+        try:
+            while take():
+                name = rng.choices(names, weights)[0]
+                session = rng.choice(sessions)
+                request = SCENARIOS[name](rng, session, password)
+                if request is None:
+                    continue
+                started = time.perf_counter()
+                try:
+                    status = await connection(*request, token=session.token)
+                except Exception:
+                    status = None
+                samples.append((name, status, time.perf_counter() - started))
+        finally:
+            await connection.close()
+        return samples
+
+    async def main() -> list:
+        return await asyncio.gather(*(worker(index) for index in range(connections)))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    return summarize([sample for samples in results for sample in samples], elapsed)
+
+
+def percentile(values: list, q: float) -> float:
+    # values отсортированы
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """
+    По каждому сценарию и в сумме: число запросов, ошибок (код >= 400 или
+    исключение), запросов в секунду и перцентили времени в мс
+    """
+    groups = defaultdict(list)
+    for name, status, seconds in samples:
+        groups[name].append((status, seconds))
+    groups = {**dict(sorted(groups.items())), "total": [r for _, *r in samples]}
+
+    report = {}
+    for name, results in groups.items():
+        if not results:
+            continue
+        timings = sorted(seconds * 1000 for _, seconds in results)
+        report[name] = {
+            "requests": len(results),
+            "errors": sum(status is None or status >= 400 for status, _ in results),
+            "rps": round(len(results) / elapsed, 2) if elapsed else 0,
+            **{
+                f"p{int(q * 100)}": round(percentile(timings, q), 3)
+                for q in PERCENTILES
+            },
+        }
+    return {"elapsed": round(elapsed, 3), "endpoints": report}
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'rps':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    for name, row in report["endpoints"].items():
+        lines.append(
+            f"{name:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}"
+            f"{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,193 @@
+import os
+import time
+import smtplib
+import threading
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    "MAX_SIZE": 4,
+    "MAX_AGE": 300,
+    "HEALTH_CHECK_INTERVAL": 30,
+    "TIMEOUT": 10,
+}
+
+# ошибки, после которых соединение выбрасывается и письмо отправляется заново
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class PooledConnection:
+    __slots__ = ("smtp", "created", "last_used")
+
+    def __init__(self, smtp: smtplib.SMTP) -> None:
+        self.smtp = smtp
+        self.created = self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPConnectionPool:
+    """
+    Пул SMTP-соединений одного процесса.
+
+    Соединение живёт не дольше max_age секунд, а если простаивало дольше
+    health_check_interval - перед использованием проверяется командой NOOP.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str | None = None,
+        password: str | None = None,
+        use_tls: bool = True,
+        max_size: int = 4,
+        max_age: float = 300,
+        health_check_interval: float = 30,
+        timeout: float = 10,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def connect(self) -> PooledConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        with self.lock:
+            self.opened += 1
+        return PooledConnection(smtp)
+
+    def is_usable(self, connection: PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - connection.created > self.max_age:
+            return False
+        if now - connection.last_used > self.health_check_interval:
+            try:
+                return connection.smtp.noop()[0] == 250
+            except OSError:
+                return False
+        return True
+
+    def acquire(self) -> PooledConnection:
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                connection = self.idle.pop()
+            if self.is_usable(connection):
+                return connection
+            connection.close()
+        return self.connect()
+
+    def release(self, connection: PooledConnection) -> None:
+        connection.last_used = time.monotonic()
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection.smtp
+        except CONNECTION_ERRORS:
+            connection.smtp.close()
+            raise
+        except smtplib.SMTPException:
+            # сервер отклонил письмо, но соединение рабочее
+            self.release(connection)
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        self.release(connection)
+
+    def sendmail(self, sender: str, recipient: str, message: str) -> None:
+        """
+        Отправляет письмо; если соединение оборвалось - переподключается
+        и пробует ещё раз
+        """
+        try:
+            with self.connection() as smtp:
+                smtp.sendmail(sender, recipient, message)
+        except CONNECTION_ERRORS:
+            with self.connection() as smtp:
+                smtp.sendmail(sender, recipient, message)
+
+    def close_all(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def reset(self) -> None:
+        """
+        Забывает соединения, не закрывая их (сокеты принадлежат родителю после fork)
+        """
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+
+_pool = None
+
+
+def get_pool() -> SMTPConnectionPool:
+    global _pool
+    if _pool is None:
+        options = {**DEFAULTS, **getattr(settings, "SMTP_POOL", {})}
+        _pool = SMTPConnectionPool(
+            host=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER,
+            password=settings.EMAIL_HOST_PASSWORD,
+            use_tls=settings.EMAIL_USE_TLS,
+            max_size=options["MAX_SIZE"],
+            max_age=options["MAX_AGE"],
+            health_check_interval=options["HEALTH_CHECK_INTERVAL"],
+            timeout=options["TIMEOUT"],
+        )
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+        _pool = None
+
+
+def _forget_pool_after_fork() -> None:
+    if _pool is not None:
+        _pool.reset()
+
+
+# каждый prefork-воркер celery открывает свои соединения
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+def build_code_message(code: int) -> str:
+    message = MIMEText(f"{code}")
+    message["Subject"] = "Reset PASSWORD"
+    return message.as_string()
@@ -0,0 +1,109 @@
+import os
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from todo.loadtest import AsyncHTTPClient, READ_MIX, arun, build_sessions, format_report
+from todo.management.commands.benchmark_servers import (
+    free_port,
+    production_env,
+    serve,
+)
+
+
+class Command(BaseCommand):
+    """
+    Ручки чтения при большом числе одновременных соединений: gunicorn с
+    синхронными view (WSGI), те же view под ASGI (uvicorn-воркеры gunicorn) и
+    async view (/async/...). Настройки gunicorn - tdp/gunicorn.conf.py,
+    пользователи - из seed_load
+    """
+
+    help = "Compare sync views under WSGI and ASGI with async views under ASGI"
+
+    targets = {
+        # имя: (воркер gunicorn, приложение, префикс путей)
+        "wsgi-sync": ("", "tdp.wsgi:application", ""),
+        "asgi-sync": ("uvicorn.workers.UvicornWorker", "tdp.asgi:application", ""),
+        "asgi-async": (
+            "uvicorn.workers.UvicornWorker",
+            "tdp.asgi:application",
+            "/async",
+        ),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=256)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--workers", type=int, help="gunicorn workers")
+        parser.add_argument(
+            "--worker-threads", type=int, help="gunicorn threads (WSGI)"
+        )
+        parser.add_argument(
+            "--only", choices=list(self.targets), action="append", help="Targets"
+        )
+        parser.add_argument("--prefix", default="load_")
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--startup-timeout", type=float, default=30)
+
+    def command(self, worker_class: str, application: str, port: int) -> tuple:
+        env = production_env()
+        env["GUNICORN_WORKER_CLASS"] = worker_class
+        for option, name in (
+            ("workers", "WEB_CONCURRENCY"),
+            ("worker_threads", "GUNICORN_THREADS"),
+        ):
+            if self.options[option]:
+                env[name] = str(self.options[option])
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            os.path.join(settings.BASE_DIR, "tdp", "gunicorn.conf.py"),
+            "--bind",
+            f"127.0.0.1:{port}",
+            application,
+        ]
+        return command, env
+
+    def handle(self, *args, **options):
+        self.options = options
+        sessions = build_sessions(options["prefix"])
+        if not sessions:
+            raise CommandError(
+                f"No users with prefix {options['prefix']!r}, run seed_load first"
+            )
+
+        reports = {}
+        for name in options["only"] or self.targets:
+            worker_class, application, prefix = self.targets[name]
+            port = free_port()
+            command, env = self.command(worker_class, application, port)
+            self.stdout.write(
+                f"{name}: {options['requests']} requests, "
+                f"{options['connections']} connections..."
+            )
+            with serve(command, env, port, options["startup_timeout"]):
+                reports[name] = arun(
+                    AsyncHTTPClient(f"http://127.0.0.1:{port}", prefix=prefix),
+                    sessions,
+                    READ_MIX,
+                    requests=options["requests"],
+                    connections=options["connections"],
+                    password=options["password"],
+                    seed=options["seed"],
+                )
+            self.stdout.write(format_report(reports[name]))
+
+        self.stdout.write("")
+        for name, report in reports.items():
+            total = report["endpoints"]["total"]
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name:<12} {total['rps']:>10} rps  p50 {total['p50']} ms  "
+                    f"p99 {total['p99']} ms  errors {total['errors']}"
+                )
+            )
@@ -0,0 +1,152 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.core.management.utils import get_random_secret_key
+
+from todo.loadtest import DEFAULT_MIX, HTTPClient, build_sessions, format_report, run
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server did not start on port {port} in {timeout} s")
+
+
+@contextmanager
+def serve(command: list, env: dict, port: int, timeout: float):
+    """
+    Сервер в дочернем процессе на время блока
+    """
+    process = subprocess.Popen(
+        command,
+        cwd=settings.BASE_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process, timeout)
+        yield process
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def production_env() -> dict:
+    return {
+        "DJANGO_PROFILE": "production",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or get_random_secret_key(),
+        "ALLOWED_HOSTS": "127.0.0.1,localhost",
+    }
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает runserver (как в разработке, DEBUG) и gunicorn с
+    tdp/gunicorn.conf.py (профиль production) одной и той же нагрузкой
+    loadtest по HTTP. Пользователи берутся из seed_load
+    """
+
+    help = "Compare runserver and gunicorn under the same HTTP load"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--workers", type=int, help="gunicorn workers")
+        parser.add_argument("--worker-threads", type=int, help="gunicorn threads")
+        parser.add_argument("--prefix", default="load_")
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--startup-timeout", type=float, default=30)
+
+    def servers(self, options: dict, port: int) -> dict:
+        manage = os.path.join(settings.BASE_DIR, "manage.py")
+        gunicorn_env = production_env()
+        if options["workers"]:
+            gunicorn_env["WEB_CONCURRENCY"] = str(options["workers"])
+        if options["worker_threads"]:
+            gunicorn_env["GUNICORN_THREADS"] = str(options["worker_threads"])
+        return {
+            "runserver": (
+                [
+                    sys.executable,
+                    manage,
+                    "runserver",
+                    "--noreload",
+                    f"127.0.0.1:{port}",
+                ],
+                {"DJANGO_PROFILE": "development"},
+            ),
+            "gunicorn": (
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    "-c",
+                    os.path.join(settings.BASE_DIR, "tdp", "gunicorn.conf.py"),
+                    "--bind",
+                    f"127.0.0.1:{port}",
+                    "tdp.wsgi:application",
+                ],
+                gunicorn_env,
+            ),
+        }
+
+    def benchmark(self, command: list, env: dict, port: int, sessions: list, options):
+        with serve(command, env, port, options["startup_timeout"]):
+            return run(
+                HTTPClient(f"http://127.0.0.1:{port}"),
+                sessions,
+                DEFAULT_MIX,
+                requests=options["requests"],
+                threads=options["threads"],
+                password=options["password"],
+                seed=options["seed"],
+            )
+
+    def handle(self, *args, **options):
+        sessions = build_sessions(options["prefix"])
+        if not sessions:
+            raise CommandError(
+                f"No users with prefix {options['prefix']!r}, run seed_load first"
+            )
+
+        reports = {}
+        for name in ("runserver", "gunicorn"):
+            port = free_port()
+            command, env = self.servers(options, port)[name]
+            self.stdout.write(f"{name}: {options['requests']} requests...")
+            reports[name] = self.benchmark(command, env, port, sessions, options)
+            self.stdout.write(format_report(reports[name]))
+
+        before = reports["runserver"]["endpoints"]["total"]
+        after = reports["gunicorn"]["endpoints"]["total"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"gunicorn: {after['rps'] / before['rps']:.2f}x requests per second, "
+                f"p99 {after['p99']} ms vs {before['p99']} ms"
+            )
+        )
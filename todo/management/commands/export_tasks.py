@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand, CommandError
+
+from todo.export import EXPORTERS, export_tasks
+from todo.models import User
+
+
+class Command(BaseCommand):
+    """Выгружает задачи пользователя с подзадачами в NDJSON или CSV"""
+
+    help = "Stream a user's tasks and subtasks as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", choices=list(EXPORTERS), default="ndjson")
+        parser.add_argument("--file", help="Write to this file instead of stdout")
+        parser.add_argument("--chunk-size", type=int)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        chunks = export_tasks(user, options["output"], options["chunk_size"])
+        if options["file"] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["file"], "w", encoding="utf-8", newline="") as file:
+            file.writelines(chunks)
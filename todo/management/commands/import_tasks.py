@@ -0,0 +1,43 @@
+import os
+
+from django.core.management import BaseCommand, CommandError
+
+from todo.importer import PARSERS, import_tasks
+from todo.models import User
+
+
+class Command(BaseCommand):
+    """Загружает задачи с подзадачами пользователю из NDJSON или CSV"""
+
+    help = "Import tasks and subtasks for a user from an NDJSON or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("file")
+        parser.add_argument(
+            "--input",
+            choices=list(PARSERS),
+            help="File format, by default taken from the file extension",
+        )
+        parser.add_argument("--batch-size", type=int)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        input_format = options["input"] or os.path.splitext(options["file"])[1][1:]
+        if input_format not in PARSERS:
+            raise CommandError("Unknown file format, use --input")
+
+        with open(options["file"], encoding="utf-8", newline="") as file:
+            report = import_tasks(user, file, input_format, options["batch_size"])
+
+        for error in report["errors"]:
+            self.stdout.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['tasks']} tasks and {report['subtasks']} subtasks, "
+                f"{report['error_count']} errors"
+            )
+        )
@@ -0,0 +1,78 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from todo.loadtest import (
+    DEFAULT_MIX,
+    HTTPClient,
+    WSGIClient,
+    build_sessions,
+    parse_mix,
+    format_report,
+    run,
+)
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест: потоки вызывают WSGI-приложение этого процесса напрямую,
+    без сети, или с --url - запущенный сервер. Пользователи берутся из seed_load
+    """
+
+    help = "Run an in-process load test against the WSGI application"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument(
+            "--duration", type=float, help="Run for N seconds instead of --requests"
+        )
+        parser.add_argument(
+            "--mix",
+            help="Scenario weights, e.g. todo-list=4,subtask=1. "
+            f"Scenarios: {', '.join(DEFAULT_MIX)}",
+        )
+        parser.add_argument(
+            "--url", help="Send requests to a running server, e.g. http://127.0.0.1:80"
+        )
+        parser.add_argument("--prefix", default="load_")
+        parser.add_argument("--users", type=int, help="Use at most N users")
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"]) if options["mix"] else DEFAULT_MIX
+        except ValueError as error:
+            raise CommandError(error)
+
+        sessions = build_sessions(options["prefix"], options["users"])
+        if not sessions:
+            raise CommandError(
+                f"No users with prefix {options['prefix']!r}, run seed_load first"
+            )
+
+        if options["url"]:
+            client = HTTPClient(options["url"])
+        else:
+            client = WSGIClient(get_internal_wsgi_application())
+        report = run(
+            client,
+            sessions,
+            mix,
+            requests=None if options["duration"] else options["requests"],
+            duration=options["duration"],
+            threads=options["threads"],
+            password=options["password"],
+            seed=options["seed"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(format_report(report))
+        self.stdout.write(f"{report['elapsed']} s, {len(sessions)} users")
@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand, CommandError
+
+from todo.stats import rebuild_user_stats, verify_user_stats
+
+
+class Command(BaseCommand):
+    """Пересчитывает счётчики UserTaskStats или проверяет их без изменения"""
+
+    help = "Rebuild or verify per-user task completion counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare stored counters with the real ones",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            mismatches = verify_user_stats()
+            for user_id, actual, expected in mismatches:
+                self.stdout.write(
+                    f"user {user_id}: stored {actual}, expected {expected}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} users have wrong counters")
+            self.stdout.write(self.style.SUCCESS("Counters are correct!"))
+            return
+
+        fixed = rebuild_user_stats()
+        self.stdout.write(self.style.SUCCESS(f"Fixed counters for {fixed} users"))
@@ -0,0 +1,72 @@
+from django.core.management import BaseCommand, CommandError
+
+from todo.seed import DEFAULTS, seed_users
+
+
+def int_range(value: str) -> tuple:
+    """
+    "10:200" -> (10, 200), "5" -> (5, 5)
+    """
+    low, _, high = value.partition(":")
+    low, high = int(low), int(high or low)
+    if low > high:
+        raise ValueError
+    return low, high
+
+
+def priorities(value: str) -> dict:
+    """
+    "none=1,1=3,2=2,3=1" -> {None: 1, 1: 3, 2: 2, 3: 1}
+    """
+    weights = {}
+    for part in value.split(","):
+        priority, _, weight = part.partition("=")
+        weights[None if priority == "none" else int(priority)] = float(weight)
+    return weights
+
+
+class Command(BaseCommand):
+    """Создаёт пользователей с задачами и подзадачами для нагрузочного теста"""
+
+    help = "Bulk-generate users with tasks and subtasks for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("users", type=int)
+        parser.add_argument("--prefix", default="load_")
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--tasks", type=int_range, help="Tasks per user, e.g. 10:200"
+        )
+        parser.add_argument("--tasks-distribution", choices=["uniform", "pareto"])
+        parser.add_argument("--subtasks", type=int_range, help="Subtasks per task")
+        parser.add_argument(
+            "--days",
+            type=int_range,
+            help="Task dates in days from today, e.g. --days=-30:90",
+        )
+        parser.add_argument(
+            "--priorities", type=priorities, help="Weights, e.g. none=1,1=3,2=2,3=1"
+        )
+        parser.add_argument("--done-ratio", type=float)
+        parser.add_argument("--subtask-done-ratio", type=float)
+
+    def handle(self, *args, **options):
+        distribution = {
+            name: options[name.lower()]
+            for name in DEFAULTS
+            if options[name.lower()] is not None
+        }
+        try:
+            users = seed_users(
+                options["users"],
+                prefix=options["prefix"],
+                password=options["password"],
+                seed=options["seed"],
+                **distribution,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(
+            self.style.SUCCESS(f"Created {len(users)} users {options['prefix']}*")
+        )
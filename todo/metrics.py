@@ -0,0 +1,580 @@
+import atexit
+import fcntl
+import glob
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connections
+
+from todo.authentication import token_cache
+from todo.cache import task_cache
+from todo.middleware import Middleware
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    # общий каталог процессов (gunicorn, prefork-воркеры celery): каждый процесс
+    # пишет туда свои метрики, /metrics суммирует все файлы
+    "MULTIPROCESS_DIR": None,
+    # не чаще раза в столько секунд процесс перезаписывает свой файл
+    "FLUSH_INTERVAL": 5,
+    # доступ к /metrics: с этих адресов (или сетей) либо с заголовком
+    # `Authorization: Bearer <TOKEN>`
+    "ALLOWED_IPS": ("127.0.0.1", "::1"),
+    "TOKEN": None,
+    # отдельный порт для /metrics в мастере gunicorn (см. start_server);
+    # тогда на основном порту /metrics не отвечает
+    "PORT": None,
+    # раз в столько секунд файлы завершившихся процессов сводятся в архив
+    "COMPACT_INTERVAL": 60,
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# сумма файлов завершившихся процессов
+ARCHIVE_NAME = "archive.json"
+ARCHIVE_LOCK_NAME = "archive.lock"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# имя -> (тип, описание)
+METRICS = {
+    "todo_http_requests_total": ("counter", "HTTP requests by URL name"),
+    "todo_http_request_duration_seconds": (
+        "histogram",
+        "HTTP request latency by URL name",
+    ),
+    "todo_db_queries_total": ("counter", "SQL queries by URL name"),
+    "todo_cache_hits_total": ("counter", "Cache hits"),
+    "todo_cache_misses_total": ("counter", "Cache misses"),
+    "todo_cache_hit_ratio": ("gauge", "Cache hit ratio over the process lifetime"),
+    "todo_celery_tasks_total": ("counter", "Finished Celery tasks by state"),
+    "todo_celery_task_failures_total": ("counter", "Failed Celery tasks"),
+    "todo_celery_task_duration_seconds": ("histogram", "Celery task duration"),
+}
+
+
+def get_options() -> dict:
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+class Shard:
+    """
+    Метрики одного потока. Пишет в шард только его поток, поэтому запись
+    обходится без блокировок; сборка читает копии словарей
+    """
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self) -> None:
+        # (имя, метки) -> значение
+        self.counters = defaultdict(float)
+        # (имя, метки) -> [корзины..., сумма, количество]
+        self.histograms = {}
+
+
+def merge_shard(total: Shard, shard: Shard) -> None:
+    for key, value in shard.counters.copy().items():
+        total.counters[key] += value
+    for key, histogram in shard.histograms.copy().items():
+        merge_histogram(total.histograms, key, list(histogram))
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.local = threading.local()
+        # (поток, шард) живых потоков
+        self.shards = []
+        # шарды завершившихся потоков, сложенные в один
+        self.retired = Shard()
+        # берётся при первой записи нового потока, при сборке и при сбросе
+        self.shards_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+        # файл процесса в MULTIPROCESS_DIR уже очищен от данных прежнего
+        # процесса с тем же pid
+        self.claimed = False
+
+    def shard(self) -> Shard:
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = Shard()
+            with self.shards_lock:
+                self.retire_dead()
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def retire_dead(self) -> None:
+        """
+        Складывает шарды завершившихся потоков в retired, иначе при потоке
+        на запрос (runserver) их число росло бы без предела. Вызывается
+        под shards_lock
+        """
+        alive = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                merge_shard(self.retired, shard)
+        self.shards = alive
+
+    def inc(self, name: str, labels: dict, value: float = 1) -> None:
+        self.shard().counters[(name, labels_key(labels))] += value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        histograms = self.shard().histograms
+        key = (name, labels_key(labels))
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(DURATION_BUCKETS) + 3)
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+                break
+        else:
+            histogram[-3] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def collect(self) -> dict:
+        """
+        Сумма шардов процесса и счётчиков кэшей
+        """
+        total = Shard()
+        with self.shards_lock:
+            self.retire_dead()
+            merge_shard(total, self.retired)
+            shards = [shard for _, shard in self.shards]
+        for shard in shards:
+            merge_shard(total, shard)
+        counters, histograms = total.counters, total.histograms
+        for name, cache in (("task_payload", task_cache), ("auth_token", token_cache)):
+            stats = cache.stats()
+            labels = labels_key({"cache": name})
+            counters[("todo_cache_hits_total", labels)] += stats["hits"]
+            counters[("todo_cache_misses_total", labels)] += stats["misses"]
+        return {"counters": dict(counters), "histograms": histograms}
+
+    def reset(self) -> None:
+        # новые объекты, а не clear(): старые шарды могут дописываться потоками
+        self.local = threading.local()
+        with self.shards_lock:
+            self.shards = []
+            self.retired = Shard()
+
+    def after_fork(self) -> None:
+        # данные родителя уже учтены в его файле
+        self.shards_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.claimed = False
+        self.reset()
+
+    def claim(self, directory: str) -> None:
+        """
+        Файл с pid этого процесса, оставшийся от завершившегося процесса
+        с тем же pid, переносится в архив до первой записи своего
+        """
+        if self.claimed:
+            return
+        own = dump_path(directory, os.getpid())
+        if os.path.exists(own):
+            archive_dumps(directory, [own])
+        self.claimed = True
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Записывает метрики процесса в MULTIPROCESS_DIR не чаще FLUSH_INTERVAL.
+        Если файл уже пишет другой поток, запрос не ждёт
+        """
+        options = get_options()
+        directory = options["MULTIPROCESS_DIR"]
+        if directory is None:
+            return
+        if not force and time.monotonic() - self.flushed_at < options["FLUSH_INTERVAL"]:
+            return
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.flushed_at = time.monotonic()
+            self.claim(directory)
+            write_dump(directory, os.getpid(), self.collect())
+        except (OSError, ValueError):
+            logger.exception("Can't write metrics to %s", directory)
+        finally:
+            self.flush_lock.release()
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.after_fork)
+atexit.register(registry.flush, force=True)
+
+
+def labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def merge_histogram(histograms: dict, key: tuple, histogram: list) -> None:
+    total = histograms.get(key)
+    if total is None:
+        histograms[key] = histogram
+    else:
+        for index, value in enumerate(histogram):
+            total[index] += value
+
+
+def dump_path(directory: str, pid: int) -> str:
+    # у процессов разных контейнеров с общим каталогом pid могут совпадать
+    return os.path.join(directory, f"{socket.gethostname()}-{pid}.json")
+
+
+def write_dump(directory: str, pid: int, data: dict) -> None:
+    write_dump_file(dump_path(directory, pid), data)
+
+
+def write_dump_file(path: str, data: dict) -> None:
+    dump = {
+        kind: [[name, labels, value] for (name, labels), value in metrics.items()]
+        for kind, metrics in data.items()
+    }
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(dump, file)
+    # файл заменяется целиком, читатель не увидит половину записи
+    os.replace(f"{path}.tmp", path)
+
+
+def read_dump(path: str) -> dict:
+    with open(path) as file:
+        dump = json.load(file)
+    return {
+        kind: {
+            (name, tuple(map(tuple, labels))): value for name, labels, value in items
+        }
+        for kind, items in dump.items()
+    }
+
+
+def merge_dump(data: dict, dump: dict) -> None:
+    for key, value in dump.get("counters", {}).items():
+        data["counters"][key] = data["counters"].get(key, 0) + value
+    for key, histogram in dump.get("histograms", {}).items():
+        merge_histogram(data["histograms"], key, histogram)
+
+
+@contextmanager
+def directory_lock(directory: str, exclusive: bool):
+    """
+    Блокировка архива между процессами: архив меняется под exclusive,
+    /metrics читает файлы под shared и не видит перенос наполовину
+    """
+    with open(os.path.join(directory, ARCHIVE_LOCK_NAME), "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def archive_dumps(directory: str, paths: list) -> None:
+    """
+    Прибавляет файлы процессов к архиву и удаляет их
+    """
+    archive = os.path.join(directory, ARCHIVE_NAME)
+    with directory_lock(directory, exclusive=True):
+        data = {"counters": {}, "histograms": {}}
+        if os.path.exists(archive):
+            merge_dump(data, read_dump(archive))
+        # файл мог уже перенести другой процесс
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            return
+        for path in paths:
+            try:
+                merge_dump(data, read_dump(path))
+            except ValueError:
+                logger.warning("Skipping broken metrics file %s", path)
+        write_dump_file(archive, data)
+        for path in paths:
+            os.remove(path)
+
+
+def archive_dead(directory: str) -> None:
+    """
+    Файлы завершившихся процессов этого хоста (например, воркеров gunicorn
+    после max_requests) складываются в один архив. Живость pid проверяется
+    только для своего хоста, файлы других контейнеров переносят их процессы
+    """
+    prefix = f"{socket.gethostname()}-"
+    dead = []
+    for path in glob.glob(os.path.join(directory, f"{glob.escape(prefix)}*.json")):
+        pid = os.path.basename(path)[len(prefix) : -len(".json")]
+        if pid.isdigit() and int(pid) != os.getpid() and not process_alive(int(pid)):
+            dead.append(path)
+    if dead:
+        archive_dumps(directory, dead)
+
+
+def compact() -> None:
+    """
+    Переносит в архив файлы завершившихся процессов этого хоста. Выполняется
+    вне запросов: потоком start_server и задачей celery compact_metrics
+    """
+    directory = get_options()["MULTIPROCESS_DIR"]
+    if directory is None:
+        return
+    try:
+        archive_dead(directory)
+    except (OSError, ValueError):
+        logger.exception("Can't archive metrics in %s", directory)
+
+
+def aggregate() -> dict:
+    """
+    Метрики текущего процесса плюс файлы остальных процессов и архив
+    завершившихся. Только читает файлы: архив меняет compact
+    """
+    data = registry.collect()
+    directory = get_options()["MULTIPROCESS_DIR"]
+    if directory is None:
+        return data
+
+    # свой файл учтён в registry; до claim это файл прежнего процесса
+    # с тем же pid, и его счётчики ещё не в архиве
+    own = dump_path(directory, os.getpid()) if registry.claimed else None
+    with directory_lock(directory, exclusive=False):
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            if path == own:
+                continue
+            try:
+                dump = read_dump(path)
+            except (OSError, ValueError):
+                continue
+            merge_dump(data, dump)
+    return data
+
+
+def allowed(address: str, authorization: str) -> bool:
+    """
+    Можно ли отдать метрики клиенту с этим адресом и заголовком Authorization
+    """
+    options = get_options()
+    token = options["TOKEN"]
+    if token and hmac.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    ):
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        ip in ipaddress.ip_network(network, strict=False)
+        for network in options["ALLOWED_IPS"]
+    )
+
+
+def format_labels(labels: tuple, **extra) -> str:
+    pairs = (*labels, *extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(data: dict) -> str:
+    """
+    Текстовый формат Prometheus (version 0.0.4)
+    """
+    series = defaultdict(list)
+    for (name, labels), value in sorted(data["counters"].items()):
+        series[name].append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    for (name, labels), histogram in sorted(data["histograms"].items()):
+        cumulative = 0
+        for bound, count in zip((*DURATION_BUCKETS, "+Inf"), histogram):
+            cumulative += count
+            series[name].append(
+                f"{name}_bucket{format_labels(labels, le=bound)} {cumulative}"
+            )
+        series[name].append(
+            f"{name}_sum{format_labels(labels)} {format_value(histogram[-2])}"
+        )
+        series[name].append(
+            f"{name}_count{format_labels(labels)} {format_value(histogram[-1])}"
+        )
+
+    for (name, labels), hits in sorted(data["counters"].items()):
+        if name != "todo_cache_hits_total":
+            continue
+        misses = data["counters"].get(("todo_cache_misses_total", labels), 0)
+        ratio = hits / (hits + misses) if hits + misses else 0
+        series["todo_cache_hit_ratio"].append(
+            f"todo_cache_hit_ratio{format_labels(labels)} {format_value(ratio)}"
+        )
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        if series[name]:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            lines += series[name]
+    return "\n".join(lines) + "\n"
+
+
+def url_name(request) -> str:
+    # имя маршрута, а не путь: у /todo/<pk>/ одна серия на все задачи
+    match = getattr(request, "resolver_match", None)
+    if match is None or not match.url_name:
+        return "unresolved"
+    return match.url_name
+
+
+class MetricsMiddleware(Middleware):
+    """
+    Число и время HTTP-запросов и число SQL-запросов по имени маршрута
+    """
+
+    @contextmanager
+    def around(self, request, call):
+        if not get_options()["ENABLED"]:
+            yield
+            return
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            yield
+        duration = time.perf_counter() - started
+
+        name = url_name(request)
+        registry.inc(
+            "todo_http_requests_total",
+            {
+                "url_name": name,
+                "method": request.method,
+                "status": str(call.response.status_code),
+            },
+        )
+        registry.observe(
+            "todo_http_request_duration_seconds", {"url_name": name}, duration
+        )
+        if queries:
+            registry.inc("todo_db_queries_total", {"url_name": name}, queries)
+        registry.flush()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        if not allowed(self.client_address[0], self.headers.get("Authorization", "")):
+            self.send_error(403)
+            return
+        body = render(aggregate()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple) -> None:
+        super().__init__(address, MetricsHandler)
+        self.stopped = threading.Event()
+
+    def compact_forever(self) -> None:
+        while not self.stopped.wait(get_options()["COMPACT_INTERVAL"]):
+            compact()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+# сервер start_server этого процесса
+server = None
+
+
+def start_server(port: int, host: str = "0.0.0.0") -> MetricsServer:
+    """
+    /metrics на отдельном порту и периодическое сведение архива в фоновых
+    потоках. Запускается в мастере gunicorn: он не обслуживает запросы
+    приложения, а метрики воркеров читает из MULTIPROCESS_DIR
+    """
+    global server
+    server = MetricsServer((host, port))
+    for target in (server.serve_forever, server.compact_forever):
+        threading.Thread(target=target, daemon=True).start()
+    return server
+
+
+def close_server_after_fork() -> None:
+    # потоки сервера остались в родителе, у ребёнка только копия сокета
+    if server is not None:
+        server.socket.close()
+
+
+# время старта выполняемых задач по task_id
+task_started = {}
+
+
+def task_prerun(task_id: str) -> None:
+    task_started[task_id] = time.perf_counter()
+
+
+def task_postrun(task_id: str, task_name: str, state: str | None) -> None:
+    started = task_started.pop(task_id, None)
+    labels = {"task": task_name}
+    registry.inc("todo_celery_tasks_total", {**labels, "state": state or "UNKNOWN"})
+    if state == "FAILURE":
+        registry.inc("todo_celery_task_failures_total", labels)
+    if started is not None:
+        registry.observe(
+            "todo_celery_task_duration_seconds",
+            labels,
+            time.perf_counter() - started,
+        )
+    registry.flush()
@@ -0,0 +1,42 @@
+import asyncio
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+
+class Middleware:
+    """
+    Middleware для WSGI и ASGI. Под ASGI цепочка асинхронная: синхронное
+    middleware Django обернул бы в поток вместе со всеми view под ним,
+    и async view потеряли бы смысл.
+
+    Наследник описывает обработку в around(request, call) - контекстном
+    менеджере, внутри которого выполняется запрос; после yield ответ уже
+    в call.response
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # так Django (MiddlewareMixin) помечает middleware асинхронным
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        call = SimpleNamespace(response=None)
+        with self.around(request, call):
+            call.response = self.get_response(request)
+        return call.response
+
+    async def __acall__(self, request):
+        call = SimpleNamespace(response=None)
+        with self.around(request, call):
+            call.response = await self.get_response(request)
+        return call.response
+
+    @contextmanager
+    def around(self, request, call):
+        yield
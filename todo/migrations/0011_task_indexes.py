@@ -0,0 +1,48 @@
+# Generated by Django 4.1 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("todo", "0010_resetpasswordcode_attempt"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["user", "date", "id"], name="task_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["user", "is_done", "date", "id"],
+                name="task_user_is_done_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["user", "priority", "date", "id"],
+                name="task_user_priority_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["user", "week_number", "date", "id"],
+                name="task_user_week_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_done", False)),
+                fields=["user", "date", "id"],
+                name="task_user_open_date_idx",
+            ),
+        ),
+    ]
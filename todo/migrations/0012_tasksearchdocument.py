@@ -0,0 +1,125 @@
+# Generated by Django 4.1 on 2026-10-18 17:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE todo_tasksearchdocument
+    ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED
+    """,
+    """
+    CREATE INDEX todo_tasksearchdocument_vector_idx
+    ON todo_tasksearchdocument USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS todo_tasksearchdocument_vector_idx",
+    "ALTER TABLE todo_tasksearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+# external content FTS5-таблица, синхронизируется триггерами с todo_tasksearchdocument
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE todo_task_fts USING fts5(
+        document, content='todo_tasksearchdocument', content_rowid='task_id'
+    )
+    """,
+    """
+    CREATE TRIGGER todo_task_fts_insert AFTER INSERT ON todo_tasksearchdocument
+    BEGIN
+        INSERT INTO todo_task_fts(rowid, document) VALUES (new.task_id, new.document);
+    END
+    """,
+    """
+    CREATE TRIGGER todo_task_fts_delete AFTER DELETE ON todo_tasksearchdocument
+    BEGIN
+        INSERT INTO todo_task_fts(todo_task_fts, rowid, document)
+        VALUES ('delete', old.task_id, old.document);
+    END
+    """,
+    """
+    CREATE TRIGGER todo_task_fts_update AFTER UPDATE ON todo_tasksearchdocument
+    BEGIN
+        INSERT INTO todo_task_fts(todo_task_fts, rowid, document)
+        VALUES ('delete', old.task_id, old.document);
+        INSERT INTO todo_task_fts(rowid, document) VALUES (new.task_id, new.document);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS todo_task_fts_update",
+    "DROP TRIGGER IF EXISTS todo_task_fts_delete",
+    "DROP TRIGGER IF EXISTS todo_task_fts_insert",
+    "DROP TABLE IF EXISTS todo_task_fts",
+]
+
+
+def run_vendor_sql(statements: dict):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return run
+
+
+def build_documents(apps, schema_editor):
+    Task = apps.get_model("todo", "Task")
+    SubTask = apps.get_model("todo", "SubTask")
+    TaskSearchDocument = apps.get_model("todo", "TaskSearchDocument")
+
+    documents = {}
+    for task_id, name, description in Task.objects.values_list(
+        "id", "name", "description"
+    ).iterator(chunk_size=2000):
+        documents[task_id] = [name, description or ""]
+    for task_id, name, description in SubTask.objects.values_list(
+        "task_id", "name", "description"
+    ).iterator(chunk_size=2000):
+        documents[task_id].extend([name, description or ""])
+
+    TaskSearchDocument.objects.bulk_create(
+        [
+            TaskSearchDocument(
+                task_id=task_id, document="\n".join(part for part in parts if part)
+            )
+            for task_id, parts in documents.items()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("todo", "0011_task_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskSearchDocument",
+            fields=[
+                (
+                    "task",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search",
+                        serialize=False,
+                        to="todo.task",
+                    ),
+                ),
+                ("document", models.TextField(blank=True, default="")),
+            ],
+        ),
+        migrations.RunPython(
+            run_vendor_sql({"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}),
+            run_vendor_sql(
+                {"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}
+            ),
+        ),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
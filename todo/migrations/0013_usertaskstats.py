@@ -0,0 +1,76 @@
+# Generated by Django 4.1 on 2026-10-18 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_stats(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    Task = apps.get_model("todo", "Task")
+    SubTask = apps.get_model("todo", "SubTask")
+    UserTaskStats = apps.get_model("todo", "UserTaskStats")
+
+    stats = {
+        user_id: UserTaskStats(user_id=user_id)
+        for user_id in User.objects.values_list("id", flat=True).iterator()
+    }
+
+    tasks = (
+        Task.objects.filter(user__isnull=False)
+        .values("user_id")
+        .annotate(
+            total=models.Count("id"),
+            done=models.Count("id", filter=models.Q(is_done=True)),
+        )
+        .order_by()
+    )
+    for row in tasks:
+        stats[row["user_id"]].tasks = row["total"]
+        stats[row["user_id"]].done_tasks = row["done"]
+
+    subtasks = (
+        SubTask.objects.filter(task__user__isnull=False)
+        .values("task__user_id")
+        .annotate(
+            total=models.Count("id"),
+            done=models.Count("id", filter=models.Q(is_done=True)),
+        )
+        .order_by()
+    )
+    for row in subtasks:
+        stats[row["task__user_id"]].subtasks = row["total"]
+        stats[row["task__user_id"]].done_subtasks = row["done"]
+
+    UserTaskStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("todo", "0012_tasksearchdocument"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserTaskStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="task_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("tasks", models.PositiveIntegerField(default=0)),
+                ("done_tasks", models.PositiveIntegerField(default=0)),
+                ("subtasks", models.PositiveIntegerField(default=0)),
+                ("done_subtasks", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1 on 2026-10-18 17:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("todo", "0014_sync_tracking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="usertaskstats",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="usertaskstats",
+            name="version",
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1 on 2026-10-18 19:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import todo.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("todo", "0016_drop_redundant_task_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskFTS",
+            fields=[
+                (
+                    "task",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="fts",
+                        serialize=False,
+                        to="todo.task",
+                    ),
+                ),
+                ("match", todo.models.FTSMatchField(db_column="todo_task_fts")),
+            ],
+            options={
+                "db_table": "todo_task_fts",
+                "managed": False,
+            },
+        ),
+    ]
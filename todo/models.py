@@ -1,6 +1,7 @@
 import datetime
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -50,8 +51,10 @@ class Task(models.Model):
 
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
+    # отдельный индекс внешнего ключа не нужен: user - первое поле
+    # составных индексов в Meta
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="tasks", null=True
+        User, on_delete=models.CASCADE, related_name="tasks", null=True, db_index=False
     )
     is_done = models.BooleanField(default=False)
     priority = models.PositiveSmallIntegerField(
@@ -59,13 +62,78 @@ class Task(models.Model):
     )
     date = models.DateField(validators=[validate_date])
     week_number = models.PositiveIntegerField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # растёт при любом изменении задачи или её подзадач, см. todo.versions
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # индексы повторяют запросы TodoViewSet: всегда фильтр по user,
+        # дальше фильтры из filterset_fields и сортировка (date, id) пагинации
+        indexes = [
+            models.Index(fields=["user", "date", "id"], name="task_user_date_idx"),
+            models.Index(
+                fields=["user", "is_done", "date", "id"],
+                name="task_user_is_done_date_idx",
+            ),
+            models.Index(
+                fields=["user", "priority", "date", "id"],
+                name="task_user_priority_date_idx",
+            ),
+            models.Index(
+                fields=["user", "week_number", "date", "id"],
+                name="task_user_week_date_idx",
+            ),
+            # дельта-синхронизация, см. todo.sync
+            models.Index(fields=["user", "updated_at"], name="task_user_updated_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = (
+            instance.__dict__.get("user_id"),
+            instance.__dict__.get("is_done"),
+        )
+        return instance
+
+    def fill_week_number(self) -> None:
+        """
+        Номер недели считается из даты; вызывается и для bulk_create/bulk_update,
+        которые не вызывают save()
+        """
         self.week_number = self.date.isocalendar().week
-        return super().save(*args, **kwargs)
+
+    def bump_version(self) -> None:
+        """
+        Версия увеличивается в базе, а не в памяти: подзадачи могли поднять
+        её после загрузки задачи (todo.versions.bump_task_versions)
+        """
+        self.version = F("version") + 1
+
+    def forget_version(self) -> None:
+        """
+        После сохранения с bump_version новая версия прочитается из базы
+        при первом обращении к полю
+        """
+        self.__dict__.pop("version", None)
+
+    def save(self, *args, **kwargs):
+        self.fill_week_number()
+        bump = not self._state.adding
+        if bump:
+            self.bump_version()
+            if kwargs.get("update_fields"):
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        try:
+            # счётчики в UserTaskStats обновляются сигналами внутри этой же транзакции
+            with transaction.atomic(using=kwargs.get("using")):
+                return super().save(*args, **kwargs)
+        finally:
+            if bump:
+                self.forget_version()
 
 
 class SubTask(models.Model):
@@ -78,3 +146,131 @@ class SubTask(models.Model):
     )
     is_done = models.BooleanField(default=False)
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="subtasks")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["task", "updated_at"], name="subtask_task_updated_idx"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = (
+            instance.__dict__.get("task_id"),
+            instance.__dict__.get("is_done"),
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            return super().save(*args, **kwargs)
+
+
+class TaskSearchDocument(models.Model):
+    """
+    Поисковый документ задачи: текст задачи и всех её подзадач.
+
+    Полнотекстовый индекс по нему создаётся в миграции отдельно для каждой базы
+    (tsvector + GIN в postgres, FTS5 в sqlite), см. todo.search
+    """
+
+    task = models.OneToOneField(
+        Task, on_delete=models.CASCADE, primary_key=True, related_name="search"
+    )
+    document = models.TextField(blank=True, default="")
+
+
+class FTSMatchField(models.TextField):
+    """
+    Скрытая колонка FTS5 с именем таблицы - левая часть `MATCH`
+    """
+
+
+@FTSMatchField.register_lookup
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class TaskFTS(models.Model):
+    """
+    FTS5-таблица todo_task_fts (только sqlite, создаётся миграцией 0012):
+    поиск делает по ней один join вместо подзапроса на каждую задачу
+    """
+
+    task = models.OneToOneField(
+        Task,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="fts",
+    )
+    match = FTSMatchField(db_column="todo_task_fts")
+
+    class Meta:
+        managed = False
+        db_table = "todo_task_fts"
+
+
+class UserTaskStats(models.Model):
+    """
+    Счётчики задач и подзадач пользователя.
+
+    Обновляются в той же транзакции, что и сами задачи (см. todo.stats),
+    поэтому статистика отдаётся одним запросом по первичному ключу
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="task_stats"
+    )
+    tasks = models.PositiveIntegerField(default=0)
+    done_tasks = models.PositiveIntegerField(default=0)
+    subtasks = models.PositiveIntegerField(default=0)
+    done_subtasks = models.PositiveIntegerField(default=0)
+    # версия и время изменения всех задач пользователя для ETag/Last-Modified
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def all_tasks(self) -> int:
+        return self.tasks + self.subtasks
+
+    @property
+    def done(self) -> int:
+        return self.done_tasks + self.done_subtasks
+
+
+class Tombstone(models.Model):
+    """
+    Запись об удалённой задаче или подзадаче для дельта-синхронизации.
+
+    Старые записи удаляются задачей prune_tombstones, клиенты с более старым
+    токеном синхронизации получают все задачи заново
+    """
+
+    TASK = "task"
+    SUBTASK = "subtask"
+    KIND_CHOICE = (
+        (TASK, "task"),
+        (SUBTASK, "subtask"),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tombstones")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICE)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "deleted_at"], name="tombstone_user_deleted_idx"
+            ),
+        ]
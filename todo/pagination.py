@@ -0,0 +1,223 @@
+import base64
+import datetime
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class Cursor:
+    """
+    Позиция в выдаче: значение первого поля сортировки и id последней
+    увиденной записи, а также направление
+    """
+
+    __slots__ = ("position", "pk", "reverse")
+
+    def __init__(self, position, pk: int, reverse: bool = False) -> None:
+        self.position = position
+        self.pk = pk
+        self.reverse = reverse
+
+
+class TaskCursorPagination(BasePagination):
+    """
+    Keyset-пагинация задач по (date, id).
+
+    Следующая страница выбирается условием `(date, id) > (last_date, last_id)`
+    вместо OFFSET, поэтому любая страница стоит столько же, сколько первая.
+    Результаты полнотекстового поиска (аннотация `search_rank`) идут
+    по убыванию релевантности: `(-search_rank, id)`.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    invalid_cursor_message = "Invalid cursor"
+
+    ordering = ("date", "id")
+    search_ordering = ("-search_rank", "id")
+    position_parsers = {
+        "date": datetime.date.fromisoformat,
+        "search_rank": float,
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request) -> list:
+        """
+        paginate_queryset для async view: страница читается асинхронно
+        """
+        queryset = self.page_queryset(queryset, request)
+        return self.set_page([item async for item in queryset])
+
+    def page_queryset(self, queryset, request):
+        """
+        Запрос страницы; выполняется вызывающим, результат передаётся в set_page
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.cursor = cursor = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor))
+            if cursor.reverse:
+                ordering = tuple(self.invert(field) for field in ordering)
+
+        # берём на одну запись больше, чтобы узнать, есть ли ещё страница
+        return queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def set_page(self, results: list) -> list:
+        cursor = self.cursor
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if cursor is not None and cursor.reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, queryset) -> tuple:
+        if "search_rank" in queryset.query.annotations:
+            return self.search_ordering
+        return self.ordering
+
+    def get_keyset_filter(self, cursor: Cursor) -> Q:
+        """
+        Условие `(field, id) > (position, pk)` с учётом направления сортировки
+        """
+        field = self.ordering[0]
+        descending = field.startswith("-")
+        field = field.lstrip("-")
+
+        # для обратного прохода (ссылка previous) сравнения меняются местами
+        greater = descending == cursor.reverse
+        field_lookup = f"{field}__gt" if greater else f"{field}__lt"
+        id_lookup = "id__lt" if cursor.reverse else "id__gt"
+
+        return Q(**{field_lookup: cursor.position}) | Q(
+            **{field: cursor.position, id_lookup: cursor.pk}
+        )
+
+    @staticmethod
+    def invert(field: str) -> str:
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position, pk = self.get_position(self.page[-1])
+        return self.encode_cursor(Cursor(position, pk, reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        position, pk = self.get_position(self.page[0])
+        return self.encode_cursor(Cursor(position, pk, reverse=True))
+
+    def get_position(self, item) -> tuple:
+        """
+        Возвращает (значение первого поля сортировки, id) записи:
+        модели или словаря из `.values()`
+        """
+        field = self.ordering[0].lstrip("-")
+        if isinstance(item, dict):
+            return item[field], item["id"]
+        return getattr(item, field), item.id
+
+    def decode_cursor(self, request) -> Cursor | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode("ascii")).decode(
+                "ascii"
+            )
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            parse_position = self.position_parsers[self.ordering[0].lstrip("-")]
+            position = parse_position(tokens["p"][0])
+            pk = int(tokens["i"][0])
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(position, pk, reverse)
+
+    def encode_cursor(self, cursor: Cursor) -> str:
+        position = cursor.position
+        if isinstance(position, datetime.date):
+            position = position.isoformat()
+        else:
+            position = repr(position)
+        tokens = {"p": position, "i": cursor.pk}
+        if cursor.reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = base64.urlsafe_b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
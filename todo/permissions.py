@@ -5,7 +5,8 @@ class IsOwner(permissions.BasePermission):
     message = "Not an owner"
 
     def has_object_permission(self, request, _, obj):
-        return obj.user == request.user
+        # по id, без загрузки пользователя задачи
+        return request.user.is_authenticated and obj.user_id == request.user.id
 
 
 class IsTaskOwner(permissions.BasePermission):
@@ -14,4 +15,5 @@ class IsTaskOwner(permissions.BasePermission):
     message = "Not a task owner"
 
     def has_object_permission(self, request, _, obj):
-        return obj.task.user == request.user
+        # задача загружается вместе с подзадачей, см. SubTaskDetailView
+        return request.user.is_authenticated and obj.task.user_id == request.user.id
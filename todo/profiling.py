@@ -0,0 +1,254 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from todo.middleware import Middleware
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    # доля профилируемых запросов
+    "SAMPLE_RATE": 1.0,
+    # запросы дольше этого (мс) пишутся в лог вместе с самыми долгими SQL
+    "SLOW_REQUEST_MS": 500,
+    "TOP_QUERIES": 5,
+}
+
+# границы корзин гистограмм: миллисекунды и количество SQL-запросов
+TIME_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BOUNDS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+def get_options() -> dict:
+    return {**DEFAULTS, **getattr(settings, "PROFILING", {})}
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами: запись - поиск корзины и
+    несколько сложений, память не растёт с числом наблюдений
+    """
+
+    __slots__ = ("bounds", "buckets", "count", "sum", "max")
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        # последняя корзина - всё, что больше последней границы
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float):
+        """
+        Верхняя граница корзины, в которую попадает квантиль q
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{
+                    str(bound): count for bound, count in zip(self.bounds, self.buckets)
+                },
+                "+Inf": self.buckets[-1],
+            },
+        }
+
+
+class ViewStats:
+    __slots__ = ("wall", "sql_time", "serialization", "queries", "duplicates")
+
+    def __init__(self) -> None:
+        self.wall = Histogram(TIME_BOUNDS)
+        self.sql_time = Histogram(TIME_BOUNDS)
+        self.serialization = Histogram(TIME_BOUNDS)
+        self.queries = Histogram(COUNT_BOUNDS)
+        self.duplicates = Histogram(COUNT_BOUNDS)
+
+    def snapshot(self) -> dict:
+        return {name: getattr(self, name).snapshot() for name in self.__slots__}
+
+
+class Profiler:
+    """
+    Гистограммы по view для всего процесса
+    """
+
+    def __init__(self) -> None:
+        self.views = defaultdict(ViewStats)
+        self.lock = threading.Lock()
+
+    def record(self, profile: "RequestProfile") -> None:
+        with self.lock:
+            stats = self.views[profile.view]
+            stats.wall.observe(profile.wall_ms)
+            stats.sql_time.observe(profile.sql_ms)
+            stats.queries.observe(len(profile.queries))
+            stats.duplicates.observe(profile.duplicates)
+            if profile.serialization_ms is not None:
+                stats.serialization.observe(profile.serialization_ms)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                view: stats.snapshot() for view, stats in sorted(self.views.items())
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.views.clear()
+
+
+profiler = Profiler()
+
+
+class RequestProfile:
+    """
+    SQL одного запроса; подключается к соединениям через execute_wrapper
+    """
+
+    def __init__(self) -> None:
+        self.view = "unresolved"
+        self.started = time.perf_counter()
+        self.wall_ms = 0.0
+        self.serialization_ms = None
+        # (sql без параметров, мс)
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+    @property
+    def sql_ms(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self) -> int:
+        """
+        Повторы одного и того же SQL (отличаются только параметры) - признак N+1
+        """
+        return sum(
+            count - 1 for count in Counter(sql for sql, _ in self.queries).values()
+        )
+
+    def top_queries(self, limit: int) -> list:
+        """
+        Самые долгие SQL с суммарным временем и числом выполнений
+        """
+        total, count = Counter(), Counter()
+        for sql, duration in self.queries:
+            total[sql] += duration
+            count[sql] += 1
+        return [
+            {"sql": sql, "ms": round(duration, 3), "count": count[sql]}
+            for sql, duration in total.most_common(limit)
+        ]
+
+
+def view_name(request) -> str:
+    """
+    TodoViewSet.list для viewset'ов, имя класса для остальных DRF view
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    func = match.func
+    cls = getattr(func, "cls", None)
+    if cls is None:
+        return f"{func.__module__}.{func.__qualname__}"
+    actions = getattr(func, "actions", None)
+    if actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f"{cls.__name__}.{action}"
+    return cls.__name__
+
+
+class ProfilingMiddleware(Middleware):
+    """
+    Время запроса, число и время SQL, время сериализации ответа (render)
+    и повторяющиеся SQL по каждому view; см. ProfilingView
+    """
+
+    @contextmanager
+    def around(self, request, call):
+        options = get_options()
+        if not options["ENABLED"] or random.random() >= options["SAMPLE_RATE"]:
+            yield
+            return
+
+        profile = request._profile = RequestProfile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            yield
+
+        profile.wall_ms = (time.perf_counter() - profile.started) * 1000
+        profile.view = view_name(request)
+        profiler.record(profile)
+        if profile.wall_ms >= options["SLOW_REQUEST_MS"]:
+            log_slow_request(request, profile, options["TOP_QUERIES"])
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после выхода из view - это и есть сериализация
+        profile = getattr(request, "_profile", None)
+        if profile is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.serialization_ms = (time.perf_counter() - started) * 1000
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def log_slow_request(request, profile: RequestProfile, limit: int) -> None:
+    top = "".join(
+        f"\n  {query['ms']:.1f} ms x{query['count']}: {query['sql']}"
+        for query in profile.top_queries(limit)
+    )
+    logger.warning(
+        "Slow request %s %s (%s): %.1f ms, %s queries in %.1f ms, %s duplicated%s",
+        request.method,
+        request.path,
+        profile.view,
+        profile.wall_ms,
+        len(profile.queries),
+        profile.sql_ms,
+        profile.duplicates,
+        top,
+    )
@@ -0,0 +1,71 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from rest_framework.utils import encoders
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson; без orjson (и для отступов, отличных от 2,
+    и настроек UNICODE_JSON/COMPACT_JSON не по умолчанию) работает как обычный.
+
+    Даты и время передаются в encoder_class DRF, поэтому их формат (например,
+    'Z' вместо '+00:00' и миллисекунды) совпадает со стандартным рендерером.
+    NaN и Infinity orjson выводит как null, а не выбрасывает ошибку.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (
+            orjson is None
+            or indent not in (None, 2)
+            or self.ensure_ascii
+            or not self.compact
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = self.options | (orjson.OPT_INDENT_2 if indent else 0)
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=options)
+
+        # как и JSONRenderer, экранируем U+2028 и U+2029
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    application/msgpack для межсервисных клиентов.
+
+    Типы, которых нет в MessagePack (даты, Decimal, UUID), приводятся
+    так же, как в JSON - энкодером DRF
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    encoder_class = encoders.JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if msgpack is None:
+            raise ImproperlyConfigured("MessagePackRenderer requires msgpack")
+        return msgpack.packb(data, default=self.encoder_class().default)
@@ -0,0 +1,304 @@
+"""
+Чтение с реплик: GET и HEAD маршрутов из REPLICAS["VIEWS"] читают с одной из
+реплик REPLICAS["ALIASES"], всё остальное (запись, прочие маршруты, celery,
+команды) идёт в основную базу default.
+
+После записи пользователь STICKY_SECONDS секунд читает с основной базы и
+видит свои изменения. Реплика с отставанием больше MAX_LAG или недоступная
+пропускается, а если она отказала посреди запроса, запрос повторяется на
+основной базе
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, OperationalError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+from todo.middleware import Middleware
+
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "default"
+
+DEFAULTS = {
+    # алиасы реплик в DATABASES; пустой список - всё читается с основной базы
+    "ALIASES": [],
+    # имена маршрутов, которые можно читать с реплики
+    "VIEWS": [
+        "todo-list",
+        "todo-detail",
+        "done_tasks",
+        "subtask",
+        "async-todo-list",
+        "async-todo-detail",
+        "async-done_tasks",
+        "async-subtask",
+    ],
+    "STICKY_SECONDS": 10,
+    # отставание реплики в секундах, после которого она не используется
+    "MAX_LAG": 5,
+    # отставание проверяется не чаще раза в столько секунд на процесс
+    "LAG_CHECK_INTERVAL": 5,
+    # кэш Django для отметок о записи, общий для процессов (None - свой у процесса)
+    "CACHE_ALIAS": None,
+}
+
+# токены и сессии читаются с основной базы: только что выданный токен
+# может ещё не дойти до реплики
+PRIMARY_APPS = {"auth", "authtoken", "sessions", "contenttypes"}
+
+SAFE_METHODS = {"GET", "HEAD"}
+
+# отставание реплики PostgreSQL в секундах: 0 на основной базе и у реплики,
+# применившей всё полученное
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+def get_options() -> dict:
+    return {**DEFAULTS, **getattr(settings, "REPLICAS", {})}
+
+
+class WriteMarks:
+    """
+    Время последней записи пользователя: пока не прошло STICKY_SECONDS,
+    его чтения идут в основную базу
+    """
+
+    key_prefix = "replica_sticky:"
+
+    def __init__(self) -> None:
+        # user_id -> время (monotonic), до которого читать с основной базы
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def mark(self, user_id: int, seconds: float, cache_alias: str | None) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.entries[user_id] = now + seconds
+            if len(self.entries) > 10000:
+                self.entries = {
+                    key: until for key, until in self.entries.items() if until > now
+                }
+        if cache_alias is not None:
+            caches[cache_alias].set(self.key_prefix + str(user_id), 1, timeout=seconds)
+
+    def is_sticky(self, user_id: int, cache_alias: str | None) -> bool:
+        with self.lock:
+            until = self.entries.get(user_id)
+        if until is not None and until > time.monotonic():
+            return True
+        if cache_alias is not None:
+            return caches[cache_alias].get(self.key_prefix + str(user_id)) is not None
+        return False
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+def measure_lag(alias: str) -> float:
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        # у других баз отставание не узнать, реплика считается актуальной
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+class LagMonitor:
+    """
+    Отставание реплик с кэшированием на interval секунд; None - реплика
+    недоступна
+    """
+
+    def __init__(self, measure=measure_lag) -> None:
+        self.measure = measure
+        # alias -> (время проверки, отставание)
+        self.checked = {}
+        self.lock = threading.Lock()
+
+    def lag(self, alias: str, interval: float) -> float | None:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.checked.get(alias)
+        if entry is not None and now - entry[0] < interval:
+            return entry[1]
+
+        try:
+            lag = self.measure(alias)
+        except DatabaseError:
+            logger.warning("Replica %s is unavailable", alias, exc_info=True)
+            lag = None
+        with self.lock:
+            self.checked[alias] = (now, lag)
+        return lag
+
+    def mark_down(self, alias: str) -> None:
+        with self.lock:
+            self.checked[alias] = (time.monotonic(), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.checked.clear()
+
+
+write_marks = WriteMarks()
+lag_monitor = LagMonitor()
+
+
+def choose_replica(options: dict) -> str:
+    """
+    Случайная реплика с допустимым отставанием, иначе основная база
+    """
+    replicas = [
+        alias
+        for alias in options["ALIASES"]
+        if (lag := lag_monitor.lag(alias, options["LAG_CHECK_INTERVAL"])) is not None
+        and lag <= options["MAX_LAG"]
+    ]
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+def user_id(request) -> int | None:
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # пользователь запросу не понадобился, сессию ради него не читаем
+        # (под ASGI это и нельзя сделать синхронно)
+        return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class ReadState:
+    """
+    Выбор базы для чтений одного запроса. Объект общий для контекста запроса
+    и потоков, в которых Django выполняет синхронный код под ASGI.
+
+    Чтение с реплик включается в process_view, а база выбирается при первом
+    чтении: к этому моменту DRF уже определил пользователя по токену
+    """
+
+    def __init__(self, request) -> None:
+        self.request = request
+        self.view = None
+        self.options = None
+        self.alias = None
+
+    def enable(self, view: tuple, options: dict) -> None:
+        self.view = view
+        self.options = options
+
+    def db_for_read(self) -> str:
+        if self.options is None:
+            return PRIMARY
+        if self.alias is None:
+            self.alias = PRIMARY
+            current = user_id(self.request)
+            if current is None or not write_marks.is_sticky(
+                current, self.options["CACHE_ALIAS"]
+            ):
+                self.alias = choose_replica(self.options)
+        return self.alias
+
+
+read_state = contextvars.ContextVar("read_state", default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = read_state.get()
+        if state is None or model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            # внутри транзакции нужны её же незафиксированные изменения
+            return PRIMARY
+        return state.db_for_read()
+
+    def db_for_write(self, model, **hints):
+        # явно, иначе Django записал бы объект в базу, из которой он прочитан
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *get_options()["ALIASES"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_options()["ALIASES"]:
+            # схема реплик приходит с основной базы
+            return False
+        return None
+
+
+class ReplicaMiddleware(Middleware):
+    """
+    Включает чтение с реплик для безопасных запросов к маршрутам из VIEWS и
+    отмечает пользователей, которые что-то записали
+    """
+
+    @contextmanager
+    def around(self, request, call):
+        token = read_state.set(ReadState(request))
+        try:
+            yield
+        finally:
+            read_state.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            current = user_id(request)
+            if current is not None:
+                options = get_options()
+                write_marks.mark(
+                    current, options["STICKY_SECONDS"], options["CACHE_ALIAS"]
+                )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        options = get_options()
+        state = read_state.get()
+        if (
+            state is not None
+            and options["ALIASES"]
+            and request.method in SAFE_METHODS
+            and request.resolver_match.url_name in options["VIEWS"]
+        ):
+            state.enable((view_func, view_args, view_kwargs), options)
+
+    def process_exception(self, request, exception):
+        state = read_state.get()
+        if (
+            state is None
+            or state.alias in (None, PRIMARY)
+            or not isinstance(exception, OperationalError)
+        ):
+            return None
+        # реплика отказала: до следующей проверки не используется, а
+        # безопасный запрос повторяется на основной базе
+        logger.warning("Replica %s failed, retrying on primary", state.alias)
+        lag_monitor.mark_down(state.alias)
+        state.alias = PRIMARY
+        view_func, view_args, view_kwargs = state.view
+        if asyncio.iscoroutinefunction(view_func):
+            # process_exception синхронный: под ASGI Django вызывает его в потоке
+            return async_to_sync(view_func)(request, *view_args, **view_kwargs)
+        return view_func(request, *view_args, **view_kwargs)
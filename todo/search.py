@@ -0,0 +1,229 @@
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.expressions import Expression, RawSQL
+
+from rest_framework.filters import SearchFilter
+
+from todo.models import Task, SubTask, TaskSearchDocument
+
+
+def build_document(task: Task) -> str:
+    """
+    Собирает текст поискового документа из задачи и её подзадач
+    """
+    parts = [task.name, task.description]
+    for name, description in SubTask.objects.filter(task_id=task.id).values_list(
+        "name", "description"
+    ):
+        parts.extend([name, description])
+    return join_document(parts)
+
+
+def build_documents(task_ids: list) -> dict:
+    """
+    Тексты документов сразу для многих задач: два запроса на все задачи
+    """
+    parts = {
+        task_id: [name, description]
+        for task_id, name, description in Task.objects.filter(
+            id__in=task_ids
+        ).values_list("id", "name", "description")
+    }
+    for task_id, name, description in SubTask.objects.filter(
+        task_id__in=task_ids
+    ).values_list("task_id", "name", "description"):
+        parts[task_id].extend([name, description])
+    return {task_id: join_document(task_parts) for task_id, task_parts in parts.items()}
+
+
+def join_document(parts: list) -> str:
+    return "\n".join(part for part in parts if part)
+
+
+def index_task(task: Task, created: bool = False) -> None:
+    """
+    Создаёт или обновляет поисковый документ задачи
+    """
+    document = build_document(task)
+    if created:
+        TaskSearchDocument.objects.create(task_id=task.id, document=document)
+    else:
+        TaskSearchDocument.objects.update_or_create(
+            task_id=task.id, defaults={"document": document}
+        )
+
+
+def reindex_task(task_id: int) -> None:
+    """
+    Обновляет документ после изменения подзадачи.
+
+    Документ только обновляется и никогда не создаётся заново: при каскадном
+    удалении задачи он может быть уже удалён раньше её подзадач.
+    """
+    task = Task.objects.filter(id=task_id).only("id", "name", "description").first()
+    if task is None:
+        return
+    TaskSearchDocument.objects.filter(task_id=task_id).update(
+        document=build_document(task)
+    )
+
+
+def index_tasks(task_ids: list, created: bool = False) -> None:
+    """
+    Обновляет документы многих задач после bulk_create/bulk_update
+    """
+    documents = [
+        TaskSearchDocument(task_id=task_id, document=document)
+        for task_id, document in build_documents(task_ids).items()
+    ]
+    if created:
+        TaskSearchDocument.objects.bulk_create(documents, batch_size=1000)
+        return
+
+    existing = set(
+        TaskSearchDocument.objects.filter(task_id__in=task_ids).values_list(
+            "task_id", flat=True
+        )
+    )
+    TaskSearchDocument.objects.bulk_update(
+        [document for document in documents if document.task_id in existing],
+        ["document"],
+        batch_size=1000,
+    )
+    TaskSearchDocument.objects.bulk_create(
+        [document for document in documents if document.task_id not in existing],
+        batch_size=1000,
+    )
+
+
+def split_terms(search: str) -> list:
+    return [term.lower() for term in re.findall(r"\w+", search)]
+
+
+class SearchRank(Expression):
+    """
+    Релевантность задачи по `rank_sql` бэкенда. id задачи подставляется
+    компилятором, поэтому выражение работает при любом алиасе таблицы задач
+    (подзапросы, join'ы)
+    """
+
+    output_field = FloatField()
+
+    def __init__(self, backend, query: str, pk=None) -> None:
+        super().__init__()
+        self.backend = backend
+        self.query = query
+        self.pk = F("id") if pk is None else pk
+
+    def get_source_expressions(self) -> list:
+        return [self.pk]
+
+    def set_source_expressions(self, exprs) -> None:
+        (self.pk,) = exprs
+
+    def as_sql(self, compiler, connection):
+        pk_sql, pk_params = compiler.compile(self.pk)
+        return f"({self.backend.rank_sql(pk_sql)})", [self.query, *pk_params]
+
+
+class BaseSearchBackend:
+    """
+    Поиск по TaskSearchDocument.
+
+    `match_sql` возвращает id подходящих задач, `rank_sql(pk)` - релевантность
+    задачи с id из выражения pk (чем больше, тем выше в выдаче). Бэкенд может
+    вместо них переопределить `search` целиком.
+    """
+
+    def query(self, terms: list) -> str:
+        raise NotImplementedError
+
+    def match_sql(self) -> str:
+        raise NotImplementedError
+
+    def rank_sql(self, pk: str) -> str:
+        raise NotImplementedError
+
+    def search(self, queryset, terms: list):
+        query = self.query(terms)
+        return queryset.filter(id__in=RawSQL(self.match_sql(), [query])).annotate(
+            search_rank=SearchRank(self, query)
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector-колонка `search_vector` с GIN-индексом"""
+
+    def query(self, terms: list) -> str:
+        return " & ".join(f"{term}:*" for term in terms)
+
+    def match_sql(self) -> str:
+        return (
+            "SELECT task_id FROM todo_tasksearchdocument "
+            "WHERE search_vector @@ to_tsquery('simple', %s)"
+        )
+
+    def rank_sql(self, pk: str) -> str:
+        return (
+            "SELECT ts_rank(search_vector, to_tsquery('simple', %s))::float8 "
+            f"FROM todo_tasksearchdocument WHERE task_id = {pk}"
+        )
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Виртуальная FTS5-таблица `todo_task_fts` (модель TaskFTS)"""
+
+    def query(self, terms: list) -> str:
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, terms: list):
+        # один join с FTS-таблицей (TaskFTS): MATCH и bm25 берутся из него,
+        # а не из подзапроса на каждую задачу. bm25 в FTS5 отрицательный:
+        # чем меньше, тем релевантнее
+        return queryset.filter(fts__match__match=self.query(terms)).annotate(
+            search_rank=-Func(
+                F("fts__match"), function="bm25", output_field=FloatField()
+            )
+        )
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Запасной вариант для остальных баз: LIKE по готовому документу,
+    без join'а с подзадачами и без ранжирования
+    """
+
+    def search(self, queryset, terms: list):
+        documents = TaskSearchDocument.objects.all()
+        for term in terms:
+            documents = documents.filter(document__icontains=term)
+        return queryset.filter(id__in=documents.values("task_id")).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend() -> BaseSearchBackend:
+    return BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+class TaskSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск по задачам и их подзадачам.
+
+    Заменяет icontains-поиск SearchFilter: каждая задача попадает в выдачу
+    один раз и получает аннотацию `search_rank`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = split_terms(" ".join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
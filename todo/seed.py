@@ -0,0 +1,157 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from todo.models import Task, SubTask, User, UserTaskStats
+from todo.search import index_tasks
+
+
+# распределения по умолчанию, каждое можно переопределить в seed_users
+DEFAULTS = {
+    # задач на пользователя: от и до
+    "TASKS": (10, 200),
+    # uniform - равномерно, pareto - у большинства мало задач, у немногих много
+    "TASKS_DISTRIBUTION": "uniform",
+    "SUBTASKS": (0, 5),
+    # дата задачи в днях от сегодняшней: прошедшие даты дают просроченные задачи
+    "DAYS": (-30, 90),
+    # приоритет -> вес
+    "PRIORITIES": {None: 1, 1: 3, 2: 2, 3: 1},
+    "DONE_RATIO": 0.3,
+    "SUBTASK_DONE_RATIO": 0.5,
+}
+
+# пользователей в одной транзакции
+USERS_PER_BATCH = 50
+
+# из этих слов собираются названия, чтобы поиск находил задачи
+WORDS = (
+    "buy",
+    "call",
+    "write",
+    "read",
+    "fix",
+    "plan",
+    "review",
+    "report",
+    "meeting",
+    "groceries",
+    "project",
+    "email",
+    "doctor",
+    "invoice",
+    "workout",
+    "release",
+)
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def tasks_count(rng: random.Random, options: dict) -> int:
+    low, high = options["TASKS"]
+    if options["TASKS_DISTRIBUTION"] == "pareto":
+        return min(high, low + int(rng.paretovariate(1.2)) - 1)
+    return rng.randint(low, high)
+
+
+def generate_tasks(rng: random.Random, user: User, options: dict) -> tuple:
+    """
+    Задачи пользователя и подзадачи к каждой из них (ещё без task_id)
+    """
+    today = date.today()
+    priorities, weights = zip(*options["PRIORITIES"].items())
+    tasks, subtasks = [], []
+    for _ in range(tasks_count(rng, options)):
+        task = Task(
+            name=random_text(rng, rng.randint(1, 4)),
+            description=random_text(rng, rng.randint(0, 12)) or None,
+            user=user,
+            is_done=rng.random() < options["DONE_RATIO"],
+            priority=rng.choices(priorities, weights)[0],
+            date=today + timedelta(days=rng.randint(*options["DAYS"])),
+        )
+        task.fill_week_number()
+        tasks.append(task)
+        subtasks.append(
+            [
+                SubTask(
+                    name=random_text(rng, rng.randint(1, 3)),
+                    is_done=rng.random() < options["SUBTASK_DONE_RATIO"],
+                )
+                for _ in range(rng.randint(*options["SUBTASKS"]))
+            ]
+        )
+    return tasks, subtasks
+
+
+@transaction.atomic
+def insert_users(rng: random.Random, usernames: list, password: str, options: dict):
+    """
+    Пользователи, их задачи, подзадачи, счётчики и поисковые документы через
+    bulk_create: сигналы не вызываются, поэтому всё заполняется здесь
+    """
+    users = User.objects.bulk_create(
+        [User(username=username, password=password) for username in usernames]
+    )
+    tasks, subtasks, stats = [], [], []
+    for user in users:
+        user_tasks, user_subtasks = generate_tasks(rng, user, options)
+        tasks += user_tasks
+        subtasks += user_subtasks
+        stats.append(
+            UserTaskStats(
+                user=user,
+                tasks=len(user_tasks),
+                done_tasks=sum(task.is_done for task in user_tasks),
+                subtasks=sum(map(len, user_subtasks)),
+                done_subtasks=sum(
+                    subtask.is_done for group in user_subtasks for subtask in group
+                ),
+            )
+        )
+    UserTaskStats.objects.bulk_create(stats)
+    Task.objects.bulk_create(tasks, batch_size=1000)
+
+    for task, group in zip(tasks, subtasks):
+        for subtask in group:
+            subtask.task = task
+    SubTask.objects.bulk_create(
+        [subtask for group in subtasks for subtask in group], batch_size=1000
+    )
+    index_tasks([task.id for task in tasks], created=True)
+    return users
+
+
+def seed_users(
+    count: int,
+    prefix: str = "load_",
+    password: str = "loadtest",
+    seed: int | None = None,
+    **distribution,
+) -> list:
+    """
+    Создаёт count пользователей {prefix}0..{prefix}{count-1} с задачами и
+    подзадачами по распределениям из DEFAULTS (ключи можно переопределить
+    в distribution). Пароль у всех один и хешируется один раз.
+    Возвращает созданных пользователей
+    """
+    unknown = set(distribution) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown distribution options: {', '.join(sorted(unknown))}")
+    options = {**DEFAULTS, **distribution}
+
+    usernames = [f"{prefix}{i}" for i in range(count)]
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"Users with prefix {prefix!r} already exist")
+
+    rng = random.Random(seed)
+    password = make_password(password)
+    users = []
+    for start in range(0, count, USERS_PER_BATCH):
+        batch = usernames[start : start + USERS_PER_BATCH]
+        users += insert_users(rng, batch, password, options)
+    return users
@@ -1,19 +1,21 @@
+from collections import OrderedDict
+
 from django.shortcuts import get_object_or_404
 
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 
 from todo.mixins import CodeMixin
-from todo.services import validate_and_decrement_reset_code
-from todo.models import Task, SubTask, User, ResetPasswordCode
+from todo.services import split_param, validate_and_decrement_reset_code
+from todo.models import Task, SubTask, User, UserTaskStats
 
 
 class DoneTasksSerializer(serializers.ModelSerializer):
-    all_tasks = serializers.IntegerField()
-    done = serializers.IntegerField()
+    all_tasks = serializers.IntegerField(read_only=True)
+    done = serializers.IntegerField(read_only=True)
 
     class Meta:
-        model = User
+        model = UserTaskStats
         fields = ("all_tasks", "done")
 
 
@@ -37,9 +39,6 @@ class CreateNewPasswordSerializer(serializers.Serializer, CodeMixin):
         if new_password != confirm_password:
             raise serializers.ValidationError("Passwords don't match")
 
-        if not ResetPasswordCode.objects.filter(code=code, user_id=user_id).exists():
-            raise serializers.ValidationError("Uncorrect data")
-
         return super().validate(data)
 
 
@@ -61,6 +60,7 @@ class CodeSerializer(serializers.Serializer, CodeMixin):
 
         validate_and_decrement_reset_code(user_id=user.id, user_code=user_code)
 
+        data["user_id"] = user.id
         return super().validate(data)
 
 
@@ -164,6 +164,19 @@ class CreateSubTaskSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class BulkSubTaskSerializer(serializers.ModelSerializer):
+    """
+    Подзадача в bulk-запросах: задача передаётся числом, чтобы не загружать
+    её отдельным запросом для каждой подзадачи
+    """
+
+    task = serializers.IntegerField(source="task_id")
+
+    class Meta:
+        model = SubTask
+        fields = ("id", "name", "description", "priority", "is_done", "task")
+
+
 class TaskSerializer(serializers.ModelSerializer):
     subtasks = SubTaskSerializer(many=True, read_only=True)
     user = serializers.HiddenField(
@@ -186,3 +199,197 @@ class TaskSerializer(serializers.ModelSerializer):
             "week_number",
             "subtasks",
         )
+
+
+class ImportSubTaskSerializer(serializers.ModelSerializer):
+    """
+    Подзадача из файла импорта
+    """
+
+    class Meta:
+        model = SubTask
+        fields = ("name", "description", "priority", "is_done")
+
+
+class ImportTaskSerializer(serializers.ModelSerializer):
+    """
+    Задача из файла импорта: правила полей (в том числе validate_date)
+    берутся из модели, см. todo.importer
+    """
+
+    subtasks = ImportSubTaskSerializer(many=True, required=False)
+
+    class Meta:
+        model = Task
+        fields = ("name", "description", "is_done", "priority", "date", "subtasks")
+
+
+class TaskReadSerializer:
+    """
+    Сериализация задач только для чтения без полей ModelSerializer.
+
+    Задачи берутся строками из .values(), подзадачи всех задач - одним
+    запросом с группировкой по task_id. Со всеми полями и подзадачами
+    результат совпадает с TaskSerializer.
+    """
+
+    # порядок полей как в TaskSerializer
+    output_fields = (
+        "id",
+        "name",
+        "description",
+        "is_done",
+        "priority",
+        "date",
+        "overdue",
+        "week_number",
+    )
+    expandable = ("subtasks",)
+    # нужны ключу кэша и пагинации при любом наборе полей
+    service_fields = ("id", "date", "version", "updated_at")
+    subtask_fields = ("id", "task_id", "name", "description", "priority", "is_done")
+
+    # как у ChoiceField: значение из базы ("1" у SubTask) приводится к ключу choices
+    choices = {str(value): value for value, _ in Task.PRIORITY_CHOICE}
+
+    @classmethod
+    def shape(cls, params, default_expand=()) -> tuple:
+        """
+        Поля (?fields=id,name) и вложенные объекты (?expand=subtasks) ответа
+        """
+        fields = split_param(params.get("fields"))
+        expand = split_param(params.get("expand"))
+        if "subtasks" in fields:
+            fields.remove("subtasks")
+            expand.append("subtasks")
+        if params.get("expand") is None:
+            expand += default_expand
+
+        errors = {}
+        unknown = set(fields) - set(cls.output_fields)
+        if unknown:
+            errors["fields"] = f"Unknown fields: {', '.join(sorted(unknown))}"
+        unknown = set(expand) - set(cls.expandable)
+        if unknown:
+            errors["expand"] = f"Unknown fields: {', '.join(sorted(unknown))}"
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return (
+            tuple(
+                field for field in cls.output_fields if not fields or field in fields
+            ),
+            tuple(field for field in cls.expandable if field in expand),
+        )
+
+    @classmethod
+    def columns(cls, fields: tuple) -> tuple:
+        return tuple(
+            dict.fromkeys(
+                (
+                    *cls.service_fields,
+                    *(field for field in fields if field != "overdue"),
+                )
+            )
+        )
+
+    @classmethod
+    def values(cls, queryset, fields: tuple = output_fields):
+        """
+        Строки задач с нужными колонками и аннотациями (search_rank нужен пагинации)
+        """
+        return queryset.values(*cls.columns(fields), *queryset.query.annotations)
+
+    @classmethod
+    def row(cls, task: Task, fields: tuple = output_fields) -> dict:
+        columns = (*cls.columns(fields), *(("overdue",) if "overdue" in fields else ()))
+        return {field: getattr(task, field) for field in columns}
+
+    @classmethod
+    def choice(cls, value):
+        if value in ("", None):
+            return value
+        return cls.choices.get(str(value), value)
+
+    @classmethod
+    def represent(cls, field: str, value):
+        if field == "priority":
+            return cls.choice(value)
+        if field == "date" and value is not None:
+            return value.isoformat()
+        return value
+
+    @classmethod
+    def subtasks_queryset(cls, task_ids: list):
+        return (
+            SubTask.objects.filter(task_id__in=task_ids)
+            .order_by("id")
+            .values_list(*cls.subtask_fields)
+        )
+
+    @classmethod
+    def group_subtasks(cls, task_ids: list, subtasks) -> dict:
+        grouped = {task_id: [] for task_id in task_ids}
+        for id, task_id, name, description, priority, is_done in subtasks:
+            grouped[task_id].append(
+                OrderedDict(
+                    (
+                        ("id", id),
+                        ("name", name),
+                        ("description", description),
+                        ("priority", cls.choice(priority)),
+                        ("is_done", is_done),
+                    )
+                )
+            )
+        return grouped
+
+    @classmethod
+    def subtasks_by_task(cls, task_ids: list) -> dict:
+        return cls.group_subtasks(task_ids, cls.subtasks_queryset(task_ids))
+
+    @classmethod
+    async def asubtasks_by_task(cls, task_ids: list) -> dict:
+        subtasks = [row async for row in cls.subtasks_queryset(task_ids)]
+        return cls.group_subtasks(task_ids, subtasks)
+
+    @classmethod
+    def to_representation(
+        cls,
+        rows: list,
+        fields: tuple = output_fields,
+        expand: tuple = expandable,
+        subtasks: dict | None = None,
+    ) -> list:
+        """
+        subtasks - уже загруженные подзадачи (asubtasks_by_task)
+        """
+        if subtasks is None and "subtasks" in expand:
+            subtasks = cls.subtasks_by_task([row["id"] for row in rows])
+
+        result = []
+        for row in rows:
+            item = OrderedDict(
+                (field, cls.represent(field, row[field])) for field in fields
+            )
+            if subtasks is not None:
+                item["subtasks"] = subtasks[row["id"]]
+            result.append(item)
+        return result
+
+
+class DeletedObjectsSerializer(serializers.Serializer):
+    tasks = serializers.ListField(child=serializers.IntegerField())
+    subtasks = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncSerializer(serializers.Serializer):
+    """
+    Ответ дельта-синхронизации, см. todo.sync.get_changes
+    """
+
+    sync_token = serializers.CharField()
+    reset = serializers.BooleanField()
+    tasks = TaskSerializer(many=True)
+    subtasks = BulkSubTaskSerializer(many=True)
+    deleted = DeletedObjectsSerializer()
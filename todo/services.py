@@ -1,7 +1,8 @@
 import random
 
 from django.utils import timezone
-from django.db.models import F
+from django.db import connection, transaction
+from django.db.models import F, Q, ExpressionWrapper, BooleanField, QuerySet
 
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
@@ -18,53 +19,79 @@ class CodeAttemptsLimitIsOver(APIException):
     status_code = 429
 
 
-def validate_and_decrement_reset_code(
-    user_id: int, user_code: ResetPasswordCode
-) -> None:
+def validate_and_decrement_reset_code(user_id: int, user_code: str) -> None:
     """
     Проверяет введённый пользователем код и уменьшает количество попыток на его правильное введение.
+    Если код неправильный/попытки исчерпаны/код просрочен, то выбрасывается ошибка.
     """
-    correct_code = get_correct_user_code(user_id)
-    decrement_code_attempts(correct_code, user_code)
-
+    result = consume_code_attempt(user_id, user_code)
 
-def get_correct_user_code(user_id: int) -> ResetPasswordCode:
-    """
-    Достаёт из базы правильный (ожидаемый) код восстановления от пользователя
-    """
-    reset_password_code = ResetPasswordCode.objects.filter(user_id=user_id)
-    if not reset_password_code.exists():
+    if result is None:
+        if ResetPasswordCode.objects.filter(user_id=user_id).exists():
+            raise CodeAttemptsLimitIsOver("Attempts are over")
         raise serializers.ValidationError("Password wasn't reset")
 
-    correct_code = reset_password_code[0]
-
-    return correct_code
+    is_correct, is_alive = result
 
+    if not is_correct:
+        raise serializers.ValidationError("Wrong code")
 
-def decrement_code_attempts(correct_code: ResetPasswordCode, user_code: int) -> None:
-    """
-    Уменьшает количество попыток (-1) на отправку кода восстановления пароля.
-    Если код неправильный/попытки исчерпаны/код просрочен, то выбрасывается ошибка.
-    """
-    if correct_code.attempt == 0:
-        raise CodeAttemptsLimitIsOver("Attempts are over")
+    if not is_alive:
+        raise serializers.ValidationError("Code is overdue")
 
-    correct_code.attempt = F("attempt") - 1
-    correct_code.save()
 
-    if correct_code.code != user_code:
-        raise serializers.ValidationError("Wrong code")
+def consume_code_attempt(user_id: int, user_code: str) -> tuple | None:
+    """
+    Атомарно списывает одну попытку и сравнивает код.
 
-    if correct_code.lasts_until < timezone.now():
-        raise serializers.ValidationError("Code is overdue")
+    Возвращает (код совпал, код не просрочен) или None, если кода нет или попытки
+    закончились. Там, где есть UPDATE ... RETURNING, это один запрос, поэтому
+    параллельные попытки не могут превысить лимит.
+    """
+    now = timezone.now()
+
+    if supports_update_returning():
+        table = connection.ops.quote_name(ResetPasswordCode._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET attempt = attempt - 1 "
+                "WHERE user_id = %s AND attempt > 0 "
+                "RETURNING code = %s, lasts_until >= %s",
+                [user_id, user_code, connection.ops.adapt_datetimefield_value(now)],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), bool(row[1])
+
+    with transaction.atomic():
+        code = (
+            ResetPasswordCode.objects.select_for_update()
+            .filter(user_id=user_id, attempt__gt=0)
+            .first()
+        )
+        if code is None:
+            return None
+        ResetPasswordCode.objects.filter(pk=code.pk).update(attempt=F("attempt") - 1)
+    return code.code == user_code, code.lasts_until >= now
+
+
+def supports_update_returning() -> bool:
+    if connection.vendor == "postgresql":
+        return True
+    # в sqlite RETURNING появился в 3.35 вместе с INSERT ... RETURNING
+    return (
+        connection.vendor == "sqlite"
+        and connection.features.can_return_columns_from_insert
+    )
 
 
 def is_task_owner(request) -> bool:
     """Проверяет является ли создатель подзадачи владельцем задачи"""
     task_id = request.data.get("task")
     if task_id:
-        task = Task.objects.get(id=task_id)
-        if task.user != request.user:
+        task = Task.objects.only("user_id").get(id=task_id)
+        if task.user_id != request.user.id:
             return False
     return True
 
@@ -78,3 +105,27 @@ def generate_code() -> int:
         code += str(random.randint(0, 9))
 
     return int(code)
+
+
+def get_user_tasks(user, overdue: bool = True, subtasks: bool = True) -> QuerySet:
+    """
+    Задачи пользователя с признаком просрочки и подзадачами
+    """
+    queryset = Task.objects.filter(user_id=user)
+    if overdue:
+        date_now = timezone.now().date()
+        queryset = queryset.annotate(
+            overdue=ExpressionWrapper(Q(date__lt=date_now), output_field=BooleanField())
+        )
+    if subtasks:
+        queryset = queryset.prefetch_related("subtasks")
+    return queryset
+
+
+def split_param(value: str | None) -> list:
+    """
+    "a, b,,c" -> ["a", "b", "c"]
+    """
+    if not value:
+        return []
+    return [part.strip() for part in value.split(",") if part.strip()]
@@ -0,0 +1,100 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from todo import stats, sync
+from todo.authentication import token_cache
+from todo.models import Task, SubTask, User, UserTaskStats
+from todo.search import index_task, reindex_task
+from todo.versions import bump_task_versions
+
+
+@receiver(post_save, sender=User)
+def user_saved(
+    sender,
+    instance: User,
+    created: bool,
+    raw: bool = False,
+    update_fields=None,
+    **kwargs,
+):
+    if created:
+        if not raw:
+            UserTaskStats.objects.create(user=instance)
+    elif update_fields != {"last_login"}:
+        # пароль, is_active и т.п. - закэшированные токены больше не верны
+        token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance: Token, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=SubTask)
+def remember_previous_state(
+    sender, instance, raw: bool = False, update_fields=None, **kwargs
+):
+    if raw or instance._state.adding:
+        instance._previous_state = None
+        return
+    parent_field = "user_id" if sender is Task else "task_id"
+    instance._previous_state = stats.previous_state(
+        instance, parent_field, update_fields
+    )
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance: Task, created: bool, raw: bool = False, **kwargs):
+    if raw:
+        return
+    stats.task_saved(instance, created, instance._previous_state)
+    previous = instance._previous_state
+    if previous is not None and previous[0] not in (None, instance.user_id):
+        # для прежнего владельца задача исчезла
+        sync.bury_task(instance.id, previous[0])
+    instance._loaded_state = (instance.user_id, instance.is_done)
+    index_task(instance, created=created)
+
+
+@receiver(pre_delete, sender=Task)
+def task_deleting(sender, instance: Task, origin=None, **kwargs):
+    if sync.deleted_in_batch(origin):
+        return
+    stats.task_deleting(instance)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance: Task, origin=None, **kwargs):
+    if sync.deleted_in_batch(origin):
+        return
+    stats.task_deleted(instance)
+    if instance.user_id is not None and sync.deleted_directly(sender, origin):
+        sync.bury_task(instance.id, instance.user_id)
+
+
+@receiver(post_save, sender=SubTask)
+def subtask_saved(
+    sender, instance: SubTask, created: bool, raw: bool = False, **kwargs
+):
+    if raw:
+        return
+    stats.subtask_saved(instance, created, instance._previous_state)
+    previous = instance._previous_state
+    bump_task_versions([instance.task_id, previous[0] if previous else None])
+    instance._loaded_state = (instance.task_id, instance.is_done)
+    reindex_task(instance.task_id)
+
+
+@receiver(post_delete, sender=SubTask)
+def subtask_deleted(sender, instance: SubTask, origin=None, **kwargs):
+    # при каскадном удалении задачи счётчики обновляет task_deleted,
+    # а версия и поисковый документ удаляются вместе с задачей
+    if not sync.deleted_directly(sender, origin) or sync.deleted_in_batch(origin):
+        return
+    stats.subtask_deleted(instance)
+    bump_task_versions([instance.task_id])
+    reindex_task(instance.task_id)
+    sync.bury_subtask(instance)
@@ -0,0 +1,248 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from todo.models import Task, SubTask, User, UserTaskStats
+
+
+COUNTERS = ("tasks", "done_tasks", "subtasks", "done_subtasks")
+
+
+def update_user_stats(
+    user_id: int | None = None, task_id: int | None = None, **deltas
+) -> None:
+    """
+    Прибавляет deltas к счётчикам пользователя и увеличивает версию его данных
+    (даже без deltas - любая запись меняет ответы API).
+
+    Пользователь задаётся напрямую (user_id) или через задачу (task_id) -
+    тогда он находится подзапросом в том же UPDATE.
+    """
+    if user_id is None and task_id is None:
+        return
+
+    stats = UserTaskStats.objects.all()
+    if user_id is not None:
+        stats = stats.filter(user_id=user_id)
+    else:
+        stats = stats.filter(user__tasks=task_id)
+    stats.update(
+        version=F("version") + 1,
+        updated_at=timezone.now(),
+        **{name: F(name) + delta for name, delta in deltas.items() if delta},
+    )
+
+
+def loaded_state(instance, parent_field: str) -> tuple | None:
+    """
+    Состояние (владелец, is_done), с которым объект был загружен из базы
+    """
+    state = getattr(instance, "_loaded_state", None)
+    if state is None or None in state:
+        state = (
+            type(instance)
+            .objects.filter(pk=instance.pk)
+            .values_list(parent_field, "is_done")
+            .first()
+        )
+    return state
+
+
+def apply_done(model, done: list, undone: list) -> int:
+    """
+    Записывает is_done объектов условными UPDATE ... WHERE is_done = <прежнее>
+    и возвращает изменение числа выполненных по числу изменённых строк.
+
+    Прежнее значение берётся из базы, а не из загруженного объекта: два
+    параллельных переключения одного объекта не учитываются дважды (второй
+    UPDATE ждёт блокировку строки и уже ничего не меняет)
+    """
+    delta = 0
+    if done:
+        delta += model.objects.filter(pk__in=done, is_done=False).update(is_done=True)
+    if undone:
+        delta -= model.objects.filter(pk__in=undone, is_done=True).update(is_done=False)
+    return delta
+
+
+def previous_state(instance, parent_field: str, update_fields=None) -> tuple | None:
+    """
+    Состояние (владелец, is_done) объекта до сохранения. Владелец - из
+    loaded_state, is_done - по результату условного UPDATE (см. apply_done)
+    """
+    state = loaded_state(instance, parent_field)
+    if state is None or (update_fields is not None and "is_done" not in update_fields):
+        return state
+    ids = [instance.pk]
+    if instance.is_done:
+        delta = apply_done(type(instance), ids, [])
+    else:
+        delta = apply_done(type(instance), [], ids)
+    return state[0], bool(int(instance.is_done) - delta)
+
+
+def task_saved(task: Task, created: bool, previous: tuple | None) -> None:
+    if created or previous is None:
+        update_user_stats(task.user_id, tasks=1, done_tasks=int(task.is_done))
+        return
+
+    previous_user_id, previous_is_done = previous
+    if previous_user_id == task.user_id:
+        update_user_stats(
+            task.user_id, done_tasks=int(task.is_done) - int(previous_is_done)
+        )
+        return
+
+    # задача сменила владельца (например, в админке) - вместе с подзадачами
+    subtasks = task.subtasks.aggregate(
+        total=Count("id"), done=Count("id", filter=Q(is_done=True))
+    )
+    update_user_stats(
+        previous_user_id,
+        tasks=-1,
+        done_tasks=-int(previous_is_done),
+        subtasks=-subtasks["total"],
+        done_subtasks=-subtasks["done"],
+    )
+    update_user_stats(
+        task.user_id,
+        tasks=1,
+        done_tasks=int(task.is_done),
+        subtasks=subtasks["total"],
+        done_subtasks=subtasks["done"],
+    )
+
+
+def task_deleting(task: Task) -> None:
+    """
+    Подзадачи удаляемой задачи не обновляют счётчики по одной (см. signals),
+    поэтому до удаления они считаются одним запросом
+    """
+    task._deleted_subtasks = task.subtasks.aggregate(
+        total=Count("id"), done=Count("id", filter=Q(is_done=True))
+    )
+
+
+def task_deleted(task: Task) -> None:
+    subtasks = getattr(task, "_deleted_subtasks", None) or {"total": 0, "done": 0}
+    update_user_stats(
+        task.user_id,
+        tasks=-1,
+        done_tasks=-int(task.is_done),
+        subtasks=-subtasks["total"],
+        done_subtasks=-subtasks["done"],
+    )
+
+
+def subtask_saved(subtask: SubTask, created: bool, previous: tuple | None) -> None:
+    if created or previous is None:
+        update_user_stats(
+            task_id=subtask.task_id, subtasks=1, done_subtasks=int(subtask.is_done)
+        )
+        return
+
+    previous_task_id, previous_is_done = previous
+    if previous_task_id == subtask.task_id:
+        update_user_stats(
+            task_id=subtask.task_id,
+            done_subtasks=int(subtask.is_done) - int(previous_is_done),
+        )
+        return
+
+    update_user_stats(
+        task_id=previous_task_id, subtasks=-1, done_subtasks=-int(previous_is_done)
+    )
+    update_user_stats(
+        task_id=subtask.task_id, subtasks=1, done_subtasks=int(subtask.is_done)
+    )
+
+
+def subtask_deleted(subtask: SubTask) -> None:
+    update_user_stats(
+        task_id=subtask.task_id, subtasks=-1, done_subtasks=-int(subtask.is_done)
+    )
+
+
+def complete_subtasks(task: Task) -> int:
+    """
+    Отмечает все подзадачи задачи выполненными одним UPDATE
+    и переносит изменение в счётчики
+    """
+    with transaction.atomic():
+        updated = task.subtasks.filter(is_done=False).update(
+            is_done=True, updated_at=timezone.now()
+        )
+        update_user_stats(task.user_id, done_subtasks=updated)
+    return updated
+
+
+def count_user_stats() -> dict:
+    """
+    Считает счётчики всех пользователей заново по таблицам задач
+    """
+    counted = {}
+
+    tasks = (
+        Task.objects.filter(user__isnull=False)
+        .values("user_id")
+        .annotate(total=Count("id"), done=Count("id", filter=Q(is_done=True)))
+        .order_by()
+    )
+    for row in tasks:
+        counted.setdefault(row["user_id"], dict.fromkeys(COUNTERS, 0)).update(
+            tasks=row["total"], done_tasks=row["done"]
+        )
+
+    subtasks = (
+        SubTask.objects.filter(task__user__isnull=False)
+        .values("task__user_id")
+        .annotate(total=Count("id"), done=Count("id", filter=Q(is_done=True)))
+        .order_by()
+    )
+    for row in subtasks:
+        counted.setdefault(row["task__user_id"], dict.fromkeys(COUNTERS, 0)).update(
+            subtasks=row["total"], done_subtasks=row["done"]
+        )
+
+    return counted
+
+
+def verify_user_stats() -> list:
+    """
+    Возвращает список расхождений (user_id, сохранённое, посчитанное)
+    """
+    counted = count_user_stats()
+    stored = {
+        row.pop("user_id"): row
+        for row in UserTaskStats.objects.values("user_id", *COUNTERS)
+    }
+
+    mismatches = []
+    for user_id in User.objects.values_list("id", flat=True).iterator():
+        expected = counted.get(user_id, dict.fromkeys(COUNTERS, 0))
+        actual = stored.get(user_id)
+        if actual != expected:
+            mismatches.append((user_id, actual, expected))
+    return mismatches
+
+
+def rebuild_user_stats() -> int:
+    """
+    Исправляет расхождения посчитанными значениями.
+    Возвращает количество исправленных пользователей
+    """
+    mismatches = verify_user_stats()
+    missing = [
+        UserTaskStats(user_id=user_id, **expected)
+        for user_id, actual, expected in mismatches
+        if actual is None
+    ]
+    wrong = [
+        UserTaskStats(user_id=user_id, **expected)
+        for user_id, actual, expected in mismatches
+        if actual is not None
+    ]
+    with transaction.atomic():
+        UserTaskStats.objects.bulk_create(missing, batch_size=1000)
+        UserTaskStats.objects.bulk_update(wrong, COUNTERS, batch_size=1000)
+    return len(mismatches)
@@ -0,0 +1,133 @@
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+from todo.models import Task, SubTask, Tombstone
+from todo.services import get_user_tasks
+
+
+DEFAULTS = {
+    # на сколько секунд назад смещается начало выборки: updated_at выставляется
+    # до коммита, и транзакция, закоммиченная позже чужого запроса синхронизации,
+    # иначе была бы пропущена
+    "SKEW_WINDOW": 5,
+    "TOMBSTONE_DAYS": 30,
+}
+
+TOKEN_SALT = "todo.sync"
+
+
+def get_options() -> dict:
+    return {**DEFAULTS, **getattr(settings, "SYNC", {})}
+
+
+def encode_token(mark: datetime.datetime) -> str:
+    return signing.dumps({"t": mark.timestamp()}, salt=TOKEN_SALT)
+
+
+def decode_token(token: str) -> datetime.datetime:
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+        return datetime.datetime.fromtimestamp(payload["t"], tz=datetime.timezone.utc)
+    except (signing.BadSignature, KeyError, TypeError, ValueError, OverflowError):
+        raise ValidationError({"token": "Invalid sync token"})
+
+
+def deleted_directly(sender, origin) -> bool:
+    """
+    Объект удалён сам по себе, а не каскадом от задачи или пользователя -
+    при каскаде клиент и так удалит его вместе с родителем
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is sender
+
+
+def deleted_in_batch(origin) -> bool:
+    """
+    Queryset удалён пачкой (todo.bulk): счётчики и записи об удалении для
+    него обновлены сразу для всех объектов, а не сигналами по одному
+    """
+    return getattr(origin, "batch_delete", False)
+
+
+def bury_task(task_id: int, user_id: int) -> None:
+    Tombstone.objects.create(user_id=user_id, kind=Tombstone.TASK, object_id=task_id)
+
+
+def bury_many(kind: str, object_ids, user_id: int) -> None:
+    Tombstone.objects.bulk_create(
+        [
+            Tombstone(user_id=user_id, kind=kind, object_id=object_id)
+            for object_id in object_ids
+        ]
+    )
+
+
+def bury_subtask(subtask: SubTask) -> None:
+    # владелец находится подзапросом в том же INSERT
+    Tombstone.objects.create(
+        user_id=Task.objects.filter(id=subtask.task_id).values("user_id")[:1],
+        kind=Tombstone.SUBTASK,
+        object_id=subtask.id,
+    )
+
+
+def prune_tombstones() -> int:
+    before = timezone.now() - datetime.timedelta(days=get_options()["TOMBSTONE_DAYS"])
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=before).delete()
+    return deleted
+
+
+def get_changes(user, token: str | None) -> dict:
+    """
+    Изменения задач пользователя с момента выдачи token.
+
+    Без токена (или если токен старше хранимых записей об удалении)
+    возвращаются все задачи и reset=True: клиент заменяет локальные данные.
+    Изменённые задачи отдаются целиком вместе с подзадачами, изменённые
+    подзадачи остальных задач - отдельным списком.
+    """
+    mark = timezone.now()
+    options = get_options()
+    since = decode_token(token) if token else None
+    oldest = mark - datetime.timedelta(days=options["TOMBSTONE_DAYS"])
+
+    if since is None or since < oldest:
+        return {
+            "sync_token": encode_token(mark),
+            "reset": True,
+            "tasks": list(get_user_tasks(user).order_by("id")),
+            "subtasks": [],
+            "deleted": {"tasks": [], "subtasks": []},
+        }
+
+    since -= datetime.timedelta(seconds=options["SKEW_WINDOW"])
+    tasks = list(get_user_tasks(user).order_by("id").filter(updated_at__gte=since))
+    subtasks = (
+        SubTask.objects.filter(task__user=user, updated_at__gte=since)
+        .exclude(task_id__in=[task.id for task in tasks])
+        .order_by("id")
+    )
+    deleted = {Tombstone.TASK: [], Tombstone.SUBTASK: []}
+    for kind, object_id in (
+        Tombstone.objects.filter(user=user, deleted_at__gte=since)
+        .order_by("deleted_at")
+        .values_list("kind", "object_id")
+    ):
+        deleted[kind].append(object_id)
+
+    return {
+        "sync_token": encode_token(mark),
+        "reset": False,
+        "tasks": tasks,
+        "subtasks": list(subtasks),
+        "deleted": {
+            "tasks": deleted[Tombstone.TASK],
+            "subtasks": deleted[Tombstone.SUBTASK],
+        },
+    }
@@ -1,15 +1,22 @@
-import os
-from email.mime.text import MIMEText
-
+import logging
 import smtplib
-from dotenv import load_dotenv
 
 from celery import shared_task
+from celery.signals import worker_process_shutdown, task_prerun, task_postrun
+from django.conf import settings
+from django.db import connections
+
+from todo.mail import CONNECTION_ERRORS, get_pool, close_pool, build_code_message
+from todo import metrics, sync
+from todo.db.pool import close_pools
 
 
-load_dotenv()
-SENDER = os.getenv("EMAIL")
-PASSWORD = os.getenv("PASSWORD")
+logger = logging.getLogger(__name__)
+
+# результаты send_codes_on_email по адресам
+SENT = "sent"
+REFUSED = "refused"
+FAILED = "failed"
 
 
 @shared_task
@@ -17,11 +24,91 @@ def send_code_on_email(code: int, user_email: str) -> None:
     """
     Отправляет код подтверждения на почту
     """
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-    server.starttls()
-    server.login(SENDER, PASSWORD)
+    get_pool().sendmail(
+        settings.DEFAULT_FROM_EMAIL, user_email, build_code_message(code)
+    )
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_codes_on_email(self, messages: list, done: list = ()) -> list:
+    """
+    Отправляет пачку кодов [(code, email), ...] через одну SMTP-сессию.
+
+    Ошибка одного письма не прерывает пачку. Адреса, окончательно отклонённые
+    сервером (5xx), не повторяются; повторная попытка отправляет только
+    неудавшиеся письма, уже ушедшие коды не дублируются; done - результаты
+    прошлых попыток. Возвращает [(email, SENT | REFUSED | FAILED), ...]
+    """
+    pool = get_pool()
+    sender = settings.DEFAULT_FROM_EMAIL
+    results, failed = list(done), []
+    for index, (code, user_email) in enumerate(messages):
+        try:
+            pool.sendmail(sender, user_email, build_code_message(code))
+        except smtplib.SMTPRecipientsRefused as error:
+            codes = [smtp_code for smtp_code, _ in error.recipients.values()]
+            if all(smtp_code >= 500 for smtp_code in codes):
+                logger.warning("Recipient %s refused: %s", user_email, codes)
+                results.append((user_email, REFUSED))
+                continue
+            logger.warning("Recipient %s deferred: %s", user_email, codes)
+            failed.append((code, user_email))
+        except CONNECTION_ERRORS:
+            # сервер недоступен: остальные письма тоже не уйдут сейчас
+            logger.exception("SMTP server is unavailable")
+            failed += messages[index:]
+            break
+        except smtplib.SMTPException:
+            logger.exception("Can't send code to %s", user_email)
+            failed.append((code, user_email))
+        else:
+            results.append((user_email, SENT))
+
+    if failed and self.request.retries < self.max_retries:
+        logger.info("Retrying %d of %d codes", len(failed), len(messages))
+        raise self.retry(args=(failed,), kwargs={"done": results})
+    return results + [(user_email, FAILED) for _, user_email in failed]
+
+
+@shared_task
+def prune_tombstones() -> int:
+    """
+    Удаляет записи об удалении старше SYNC["TOMBSTONE_DAYS"]
+    """
+    return sync.prune_tombstones()
+
+
+@shared_task
+def compact_metrics() -> None:
+    """
+    Сводит в архив файлы метрик завершившихся процессов хоста воркера
+    """
+    metrics.compact()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    metrics.task_prerun(task_id)
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    metrics.task_postrun(task_id, task.name, state)
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    close_pool()
+
+
+@worker_process_shutdown.connect
+def close_database_connections(**kwargs):
+    # между задачами соединения не закрываются: celery закрывает их через
+    # close_if_unusable_or_obsolete (CONN_MAX_AGE), а пул забирает себе
+    connections.close_all()
+    close_pools()
 
-    message = MIMEText(f"{code}")
-    message["Subject"] = "Reset PASSWORD"
 
-    server.sendmail(SENDER, user_email, message.as_string())
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):
+    metrics.registry.flush(force=True)
@@ -0,0 +1,24 @@
+import logging
+
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Бенчмарки (тег benchmark) заполняют базу тысячами задач и сравнивают
+    время, поэтому без --tag не запускаются: `manage.py test --tag=benchmark`
+    или `--tag=query_budget`
+    """
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        if not tags:
+            exclude_tags = {*(exclude_tags or ()), "benchmark"}
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, **kwargs)
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if "benchmark" not in self.exclude_tags:
+            # результаты бенчмарков пишутся в лог todo.benchmarks
+            logger = logging.getLogger("todo.benchmarks")
+            logger.addHandler(logging.StreamHandler())
+            logger.setLevel(logging.INFO)
@@ -0,0 +1,437 @@
+import json
+import time
+import statistics
+from datetime import date, timedelta
+from unittest import skipIf
+
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from todo.models import Task, User
+from todo.cache import task_cache
+from todo.pagination import Cursor, TaskCursorPagination
+from todo.renderers import ORJSONRenderer
+from todo.serializers import TaskSerializer, TaskReadSerializer
+from todo.services import get_user_tasks
+from todo.tests.utils import logger, seed_user
+
+
+def measure(func, repeat: int = 5) -> float:
+    """Медиана времени выполнения func в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+@tag("benchmark")
+class CursorPaginationBenchmark(TestCase):
+    """
+    Время получения страницы списка задач не должно зависеть от количества задач
+    пользователя и от того, насколько глубоко находится страница.
+    """
+
+    sizes = (500, 5000)
+    page_size = 50
+
+    def deep_page_url(self, user: User, url: str) -> str:
+        """Ссылка на одну из последних страниц выдачи"""
+        last = Task.objects.filter(user=user).order_by("-date", "-id")[self.page_size]
+        pagination = TaskCursorPagination()
+        pagination.base_url = url
+        return pagination.encode_cursor(Cursor(last.date, last.id))
+
+    def test_page_latency_is_flat(self):
+        results = {}
+        for size in self.sizes:
+            user = seed_user(f"bench_user_{size}", size, days=365, every=10)
+            self.client.force_login(user)
+
+            first_url = reverse("todo-list") + f"?page_size={self.page_size}"
+            deep_url = self.deep_page_url(user, first_url)
+
+            for name, url in (("first", first_url), ("deep", deep_url)):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(
+                    any("OFFSET" in query["sql"].upper() for query in queries)
+                )
+                # страница читается одним запросом с LIMIT page_size + 1
+                page_queries = [
+                    query["sql"]
+                    for query in queries
+                    if f"LIMIT {self.page_size + 1}" in query["sql"].upper()
+                ]
+                self.assertEqual(len(page_queries), 1)
+                num_queries = len(queries)
+                results[(size, name)] = (
+                    measure(lambda: self.client.get(url)),
+                    num_queries,
+                )
+
+        for (size, name), (latency, queries) in sorted(results.items()):
+            logger.info(
+                "%6d tasks, %-5s page: %7.2f ms, %d queries",
+                size,
+                name,
+                latency,
+                queries,
+            )
+
+        # количество запросов одинаковое для любой страницы и любого объёма данных
+        self.assertEqual(len({queries for _, queries in results.values()}), 1)
+
+        # глубокая страница и страница при большем объёме данных не дороже
+        # первой страницы на малом объёме (с запасом на шум измерений)
+        base = results[(self.sizes[0], "first")][0]
+        for (size, name), (latency, _) in results.items():
+            with self.subTest(size=size, page=name):
+                self.assertLessEqual(latency, base * 2 + 5)
+
+
+@tag("benchmark")
+class BulkCreateBenchmark(TestCase):
+    """
+    Один bulk-запрос вместо N отдельных POST /todo/ и /create_subtask/
+    """
+
+    sizes = (10, 100)
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bulk_bench", password="bench")
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def post(self, url: str, data) -> list:
+        response = self.client.post(
+            url, json.dumps(data), content_type="application/json"
+        )
+        self.assertIn(
+            response.status_code,
+            (status.HTTP_201_CREATED, status.HTTP_207_MULTI_STATUS),
+        )
+        return response.data
+
+    def single_requests(self, size: int) -> None:
+        for i in range(size):
+            task = self.post(
+                reverse("todo-list"),
+                {"name": f"single task{i}", "date": date.today().isoformat()},
+            )
+            self.post(
+                reverse("create_subtask"),
+                {"name": f"single subtask{i}", "task": task["id"]},
+            )
+
+    def bulk_request(self, size: int) -> None:
+        tasks = self.post(
+            reverse("todo-bulk"),
+            [
+                {"name": f"bulk task{i}", "date": date.today().isoformat()}
+                for i in range(size)
+            ],
+        )
+        self.post(
+            reverse("subtask_bulk"),
+            [
+                {"name": f"bulk subtask{i}", "task": task["data"]["id"]}
+                for i, task in enumerate(tasks)
+            ],
+        )
+
+    def test_bulk_throughput(self):
+        for size in self.sizes:
+            results = {}
+            for name, func in (
+                ("single", self.single_requests),
+                ("bulk", self.bulk_request),
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    func(size)
+                    elapsed = time.perf_counter() - started
+                results[name] = (elapsed, len(queries))
+                logger.info(
+                    "%4d tasks, %-6s: %8.2f ms, %8.0f objects/s, %d queries",
+                    size,
+                    name,
+                    elapsed * 1000,
+                    size * 2 / elapsed,
+                    len(queries),
+                )
+
+            self.assertLess(results["bulk"][1], results["single"][1])
+
+
+@tag("benchmark")
+class TaskPayloadCacheBenchmark(TestCase):
+    """
+    Страница списка задач с пустым и заполненным кэшем сериализованных задач
+    """
+
+    size = 500
+
+    def setUp(self) -> None:
+        self.user = seed_user("cache_bench", self.size, subtasks_per_task=3)
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_cached_list(self):
+        url = reverse("todo-list") + "?page_size=500"
+
+        def cold():
+            task_cache.clear()
+            self.client.get(url)
+
+        cold_latency = measure(cold)
+        task_cache.clear()
+        self.client.get(url)
+        warm_latency = measure(lambda: self.client.get(url))
+        logger.info(
+            "cold: %7.2f ms, warm: %7.2f ms, hit ratio %.2f",
+            cold_latency,
+            warm_latency,
+            task_cache.stats()["hit_ratio"],
+        )
+        self.assertLess(warm_latency, cold_latency)
+
+
+@tag("benchmark")
+class TaskReadSerializerBenchmark(TestCase):
+    """
+    TaskSerializer против TaskReadSerializer на 10k задачах с подзадачами
+    """
+
+    size = 10000
+
+    def setUp(self) -> None:
+        self.user = seed_user("read_bench", self.size, every=2)
+        return super().setUp()
+
+    def test_read_serializer(self):
+        queryset = get_user_tasks(self.user).order_by("id")
+
+        def model_serializer():
+            return TaskSerializer(queryset.all(), many=True).data
+
+        def read_serializer():
+            rows = list(TaskReadSerializer.values(queryset.prefetch_related(None)))
+            return TaskReadSerializer.to_representation(rows)
+
+        self.assertEqual(json.dumps(model_serializer()), json.dumps(read_serializer()))
+        slow = measure(model_serializer, repeat=3)
+        fast = measure(read_serializer, repeat=3)
+        logger.info(
+            "%d tasks: TaskSerializer %8.2f ms, TaskReadSerializer %8.2f ms (%.1fx)",
+            self.size,
+            slow,
+            fast,
+            slow / fast,
+        )
+        self.assertLess(fast, slow)
+
+
+@tag("benchmark")
+class JSONRendererBenchmark(TestCase):
+    """
+    Кодирование страницы списка задач стандартным JSONRenderer и ORJSONRenderer
+    """
+
+    def test_encode(self):
+        today = date.today()
+        payload = {
+            "next": None,
+            "previous": None,
+            "results": [
+                {
+                    "id": i,
+                    "name": f"Benchmark task{i}",
+                    "description": "description " * 5,
+                    "is_done": bool(i % 2),
+                    "priority": i % 3 + 1,
+                    "date": today,
+                    "overdue": False,
+                    "week_number": today.isocalendar().week,
+                    "subtasks": [
+                        {
+                            "id": i * 10 + j,
+                            "name": f"subtask{j}",
+                            "description": None,
+                            "priority": 2,
+                            "is_done": False,
+                        }
+                        for j in range(3)
+                    ],
+                }
+                for i in range(5000)
+            ],
+        }
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            latency = measure(lambda: renderer.render(payload, "application/json"))
+            logger.info("%-15s: %8.2f ms", type(renderer).__name__, latency)
+
+        self.assertEqual(
+            ORJSONRenderer().render(payload), JSONRenderer().render(payload)
+        )
+
+
+@tag("benchmark")
+class MessagePackBenchmark(TestCase):
+    """
+    Размер и время ответа /todo/ в JSON и MessagePack на сгенерированных задачах
+    """
+
+    size = 500
+
+    def setUp(self) -> None:
+        self.user = seed_user("msgpack_bench", self.size, days=30)
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_json_vs_msgpack(self):
+        url = reverse("todo-list") + f"?page_size={self.size}"
+        results = {}
+        for accept in ("application/json", "application/msgpack"):
+            response = self.client.get(url, HTTP_ACCEPT=accept)
+            self.assertEqual(response["Content-Type"], accept)
+            latency = measure(lambda: self.client.get(url, HTTP_ACCEPT=accept))
+            results[accept] = len(response.content)
+            logger.info(
+                "%-20s: %8d bytes, %7.2f ms", accept, len(response.content), latency
+            )
+
+        self.assertLess(results["application/msgpack"], results["application/json"])
+
+
+@tag("benchmark")
+class ImportBenchmark(TestCase):
+    """
+    Строк в секунду при потоковом импорте и при создании задач
+    по одной через POST /todo/
+    """
+
+    sizes = (1000, 10000)
+    single_size = 200
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="import_bench", password="b")
+        self.client.force_login(self.user)
+        self.date = (date.today() + timedelta(days=1)).isoformat()
+        return super().setUp()
+
+    def ndjson(self, size: int) -> bytes:
+        return "".join(
+            json.dumps(
+                {
+                    "name": f"Benchmark task{i}",
+                    "description": "description " * (i % 5),
+                    "priority": i % 3 + 1,
+                    "date": self.date,
+                    "subtasks": [{"name": f"Benchmark subtask{i}"}] * (i % 2),
+                }
+            )
+            + "\n"
+            for i in range(size)
+        ).encode()
+
+    def csv(self, size: int) -> bytes:
+        return (
+            "name,description,priority,date,subtask_name\n"
+            + "".join(
+                f"Benchmark task{i},description,{i % 3 + 1},{self.date},"
+                f"{f'Benchmark subtask{i}' if i % 2 else ''}\n"
+                for i in range(size)
+            )
+        ).encode()
+
+    def test_import_throughput(self):
+        started = time.perf_counter()
+        for i in range(self.single_size):
+            self.client.post(
+                reverse("todo-list"), {"name": f"single task{i}", "date": self.date}
+            )
+        single = self.single_size / (time.perf_counter() - started)
+        logger.info("%6d rows, POST /todo/: %8.0f rows/s", self.single_size, single)
+
+        for size in self.sizes:
+            for content_type, build in (
+                ("application/x-ndjson", self.ndjson),
+                ("text/csv", self.csv),
+            ):
+                body = build(size)
+                started = time.perf_counter()
+                response = self.client.post(
+                    reverse("import"), body, content_type=content_type
+                )
+                rows = size / (time.perf_counter() - started)
+                self.assertEqual(response.json()["tasks"], size)
+                logger.info("%6d rows, %-20s: %8.0f rows/s", size, content_type, rows)
+                self.assertGreater(rows, single)
+
+
+@tag("benchmark")
+@skipIf(
+    connection.vendor != "postgresql",
+    "connection setup is measured against PostgreSQL only",
+)
+class ConnectionPoolBenchmark(TestCase):
+    """
+    Короткий запрос, как /done_tasks/: новое соединение на каждый запрос
+    (CONN_MAX_AGE = 0) против соединения из пула todo.db.postgresql
+    """
+
+    requests = 200
+
+    def make_wrapper(self, engine: str, alias: str):
+        settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": engine,
+            "CONN_MAX_AGE": 0,
+            "POOL": {"MAX_SIZE": 1},
+        }
+        return load_backend(engine).DatabaseWrapper(settings_dict, alias)
+
+    def measure(self, wrapper) -> list:
+        timings = []
+        for _ in range(self.requests):
+            started = time.perf_counter()
+            with wrapper.cursor() as cursor:
+                cursor.execute(
+                    "SELECT tasks, done_tasks FROM todo_usertaskstats WHERE user_id = %s",
+                    [1],
+                )
+                cursor.fetchall()
+            # так Django закрывает соединение в конце запроса
+            wrapper.close_if_unusable_or_obsolete()
+            timings.append((time.perf_counter() - started) * 1000)
+        wrapper.close()
+        return timings
+
+    def test_request_latency(self):
+        results = {}
+        for name, engine in (
+            ("without pool", "django.db.backends.postgresql"),
+            ("with pool", "todo.db.postgresql"),
+        ):
+            wrapper = self.make_wrapper(engine, "benchmark")
+            timings = sorted(self.measure(wrapper))
+            if hasattr(wrapper, "close_pool"):
+                wrapper.close_pool()
+            results[name] = statistics.median(timings)
+            logger.info(
+                "%s: p50 %.2f ms, p95 %.2f ms",
+                name,
+                results[name],
+                timings[int(len(timings) * 0.95)],
+            )
+
+        self.assertLess(results["with pool"], results["without pool"])
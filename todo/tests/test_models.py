@@ -1,9 +1,20 @@
 import datetime
+import threading
 from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
 
-from django.test import TestCase
+from io import StringIO
 
-from todo.models import Task, SubTask, User, ResetPasswordCode
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase
+
+from todo.db.pool import ConnectionPool, PoolTimeout
+from todo.models import Task, SubTask, User, ResetPasswordCode, UserTaskStats
 
 
 class TodoTasksTest(TestCase):
@@ -95,3 +106,271 @@ class ResetPasswordCodeTestCase(TestCase):
         self.assertEqual(reset_code.code, "12345")
 
         self.assertEqual(alive_time, datetime.timedelta(seconds=300))
+
+
+class TaskIndexesTestCase(TestCase):
+    """
+    Каждая комбинация фильтров TodoViewSet должна обслуживаться индексом,
+    а не последовательным чтением всей таблицы задач.
+    """
+
+    filters = [
+        {},
+        {"is_done": False},
+        {"is_done": True},
+        {"priority": 1},
+        {"date": date.today()},
+        {"week_number": 1},
+        {"is_done": False, "priority": 2},
+        {"is_done": True, "date": date.today()},
+        {"is_done": False, "week_number": 1},
+        {"priority": 3, "week_number": 1},
+    ]
+
+    def setUp(self) -> None:
+        self.user = User.objects.create(username="explain_user", password="explain")
+        Task.objects.create(name="Explain task", user=self.user, date=date.today())
+        return super().setUp()
+
+    def explain(self, queryset) -> str:
+        if connection.vendor == "postgresql":
+            # на маленькой таблице postgres всегда выбирает seq scan,
+            # поэтому проверяем, может ли он вообще обойтись без него
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, plan: str) -> None:
+        if connection.vendor == "postgresql":
+            self.assertNotIn("Seq Scan on todo_task", plan)
+        elif connection.vendor == "sqlite":
+            self.assertNotRegex(plan, r"\bSCAN todo_task\b")
+        # неявный индекс по FK не считается: он не покрывает фильтры и сортировку
+        self.assertRegex(plan, r"task_user_\w+_idx")
+
+    def test_filters_use_indexes(self):
+        for filters in self.filters:
+            with self.subTest(filters=filters):
+                queryset = (
+                    Task.objects.filter(user_id=self.user.id)
+                    .filter(**filters)
+                    .order_by("date", "id")[:51]
+                )
+                self.assertUsesIndex(self.explain(queryset))
+
+
+class UserTaskStatsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username="stats_user", password="stats")
+        self.user_2 = User.objects.create(username="stats_user_2", password="stats")
+        self.task = Task.objects.create(
+            name="Stats task", user=self.user, date=date.today()
+        )
+        for i in range(3):
+            SubTask.objects.create(name=f"Stats subtask{i}", task=self.task)
+        return super().setUp()
+
+    def stats(self, user: User) -> tuple:
+        stats = UserTaskStats.objects.get(user=user)
+        return stats.tasks, stats.done_tasks, stats.subtasks, stats.done_subtasks
+
+    def test_create_and_update(self):
+        self.assertEqual(self.stats(self.user), (1, 0, 3, 0))
+
+        self.task.is_done = True
+        self.task.save()
+        subtask = self.task.subtasks.first()
+        subtask.is_done = True
+        subtask.save()
+
+        self.assertEqual(self.stats(self.user), (1, 1, 3, 1))
+
+    def test_deferred_fields(self):
+        task = Task.objects.only("id", "date").get(id=self.task.id)
+        task.is_done = True
+        task.save()
+
+        self.assertEqual(self.stats(self.user), (1, 1, 3, 0))
+
+    def test_change_owner(self):
+        self.task.user = self.user_2
+        self.task.save()
+
+        self.assertEqual(self.stats(self.user), (0, 0, 0, 0))
+        self.assertEqual(self.stats(self.user_2), (1, 0, 3, 0))
+
+    def test_cascade_delete(self):
+        self.task.delete()
+
+        self.assertEqual(self.stats(self.user), (0, 0, 0, 0))
+
+    def test_rebuild_command(self):
+        UserTaskStats.objects.filter(user=self.user).update(tasks=100)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_task_stats", "--verify", stdout=StringIO())
+
+        call_command("rebuild_task_stats", stdout=StringIO())
+        call_command("rebuild_task_stats", "--verify", stdout=StringIO())
+
+        self.assertEqual(self.stats(self.user), (1, 0, 3, 0))
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def make_pool(self, **kwargs) -> ConnectionPool:
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+
+        def reset(fake):
+            fake.in_transaction = False
+            return fake.alive
+
+        return ConnectionPool(
+            connect=connect,
+            check=lambda fake: fake.alive,
+            reset=reset,
+            close=FakeConnection.close,
+            **kwargs,
+        )
+
+    def test_reuses_connection(self):
+        pool = self.make_pool()
+        for _ in range(5):
+            pool.release(pool.acquire())
+        self.assertEqual(pool.opened, 1)
+
+    def test_rolls_back_on_release(self):
+        pool = self.make_pool()
+        fake = pool.acquire()
+        fake.in_transaction = True
+        pool.release(fake)
+        self.assertFalse(pool.acquire().in_transaction)
+
+    def test_broken_connection_is_closed(self):
+        pool = self.make_pool()
+        fake = pool.acquire()
+        fake.alive = False
+        pool.release(fake)
+
+        self.assertTrue(fake.closed)
+        self.assertIsNot(pool.acquire(), fake)
+        self.assertEqual(pool.size, 1)
+
+    def test_health_check(self):
+        pool = self.make_pool(health_check_interval=0)
+        fake = pool.acquire()
+        pool.release(fake)
+        # соединение оборвалось, пока простаивало
+        fake.alive = False
+
+        self.assertIsNot(pool.acquire(), fake)
+        self.assertTrue(fake.closed)
+        self.assertEqual(pool.opened, 2)
+
+    def test_max_age(self):
+        pool = self.make_pool(max_age=0)
+        for _ in range(3):
+            pool.release(pool.acquire())
+        self.assertEqual(pool.opened, 3)
+
+    def test_bounded(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        first, _ = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        # освободившееся соединение достаётся ждущему потоку
+        timer = threading.Timer(0.01, pool.release, (first,))
+        timer.start()
+        pool.timeout = 5
+        self.assertIs(pool.acquire(), first)
+        timer.join()
+        self.assertEqual(pool.opened, 2)
+
+    def test_threads_share_pool(self):
+        pool = self.make_pool(max_size=3)
+        barrier = threading.Barrier(8)
+
+        def work(_):
+            barrier.wait()
+            for _ in range(20):
+                pool.release(pool.acquire())
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(work, range(8)))
+
+        self.assertLessEqual(pool.opened, 3)
+        self.assertEqual(len(pool.in_use), 0)
+
+    def test_forget_after_fork(self):
+        pool = self.make_pool()
+        inherited = pool.acquire()
+        pool.forget()
+        # соединение родителя не закрывается и не попадает в пул
+        pool.release(inherited)
+        pool.discard(inherited)
+        self.assertFalse(inherited.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_failed_connect_frees_slot(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.connect = mock.Mock(side_effect=OSError)
+        with self.assertRaises(OSError):
+            pool.acquire()
+        self.assertEqual(pool.size, 0)
+
+
+@skipIf(connection.vendor != "postgresql", "todo.db.postgresql needs PostgreSQL")
+class PooledPostgresBackendTestCase(TestCase):
+    def setUp(self) -> None:
+        engine = "todo.db.postgresql"
+        self.wrapper = load_backend(engine).DatabaseWrapper(
+            {**connection.settings_dict, "ENGINE": engine, "POOL": {"MAX_SIZE": 2}},
+            "pool_test",
+        )
+        self.addCleanup(self.wrapper.close_pool)
+        return super().setUp()
+
+    def query(self) -> int:
+        with self.wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_connection_is_reused(self):
+        pid = self.query()
+        self.wrapper.close()
+        self.assertEqual(self.query(), pid)
+        self.assertEqual(self.wrapper.pool.opened, 1)
+
+    def test_transaction_is_rolled_back(self):
+        self.wrapper.set_autocommit(False)
+        self.query()
+        self.wrapper.close()
+
+        self.query()
+        self.assertTrue(self.wrapper.get_autocommit())
+        self.assertEqual(
+            self.wrapper.connection.info.transaction_status, TRANSACTION_STATUS_IDLE
+        )
+
+    def test_terminated_connection_is_replaced(self):
+        pid = self.query()
+        self.wrapper.close()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+        self.wrapper.pool.health_check_interval = 0
+
+        self.assertNotEqual(self.query(), pid)
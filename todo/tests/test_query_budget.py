@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import statistics
+from unittest import mock
+from datetime import date
+
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from todo.models import Task, SubTask, User, ResetPasswordCode
+from todo.authentication import token_cache
+from todo.cache import task_cache
+from todo.stats import rebuild_user_stats
+from todo.sync import encode_token
+from todo.tests.utils import logger, seed_user
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "query_budget_baseline.json")
+# перезаписать базовые значения: UPDATE_QUERY_BUDGET_BASELINE=1
+UPDATE_BASELINE = os.environ.get("UPDATE_QUERY_BUDGET_BASELINE") == "1"
+# медиана может вырасти во столько раз (плюс LATENCY_SLACK_MS) без падения теста
+LATENCY_TOLERANCE = 3
+LATENCY_SLACK_MS = 5
+
+# максимум SQL-запросов на запрос к ручке, включая сессию и пользователя
+BUDGETS = {
+    "todo-list": 4,
+    "todo-list-expand": 5,
+    "todo-list-search": 4,
+    "todo-list-filter": 4,
+    "todo-detail": 5,
+    "todo-create": 9,
+    "todo-update": 16,
+    "todo-complete": 20,
+    "todo-destroy": 10,
+    "subtask-detail": 3,
+    "subtask-update": 12,
+    "subtask-destroy": 10,
+    "subtask-create": 12,
+    "done_tasks": 3,
+    "sync": 6,
+    "send_code": 9,
+    "check_code": 4,
+    "create_password": 11,
+}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+@tag("benchmark", "query_budget")
+# без лога медленных запросов: замеры идут на заведомо больших данных
+@override_settings(PROFILING={"SLOW_REQUEST_MS": float("inf")})
+class QueryBudgetTestCase(TestCase):
+    """
+    Количество SQL-запросов каждой ручки не зависит от объёма данных:
+    у маленького и большого пользователя оно одинаковое и не больше бюджета.
+    Перцентили времени сравниваются с query_budget_baseline.json
+    """
+
+    sizes = {"small": 5, "large": 3000}
+    subtasks_per_task = 3
+    users = 20
+    repeat = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = {
+            size: seed_user(f"budget_{size}", tasks, cls.subtasks_per_task)
+            for size, tasks in cls.sizes.items()
+        }
+        for i in range(cls.users - len(cls.sizes)):
+            seed_user(f"budget_other{i}", 100, cls.subtasks_per_task)
+        rebuild_user_stats()
+        if connection.vendor == "postgresql":
+            # статистика планировщика могла остаться от предыдущих бенчмарков
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        return super().setUp()
+
+    # каждая функция готовит данные вне замера и возвращает сам запрос
+
+    def any_task(self, user: User) -> Task:
+        return Task.objects.filter(user=user).order_by("id")[1]
+
+    def new_task(self, user: User) -> Task:
+        task = Task.objects.create(name="fresh", user=user, date=date.today())
+        for j in range(self.subtasks_per_task):
+            SubTask.objects.create(name=f"fresh subtask{j}", task=task)
+        return task
+
+    def request_todo_list(self, user):
+        return lambda: self.client.get(reverse("todo-list"))
+
+    def request_todo_list_expand(self, user):
+        return lambda: self.client.get(reverse("todo-list"), {"expand": "subtasks"})
+
+    def request_todo_list_search(self, user):
+        return lambda: self.client.get(reverse("todo-list"), {"search": "task1"})
+
+    def request_todo_list_filter(self, user):
+        return lambda: self.client.get(
+            reverse("todo-list"), {"is_done": "false", "priority": 2}
+        )
+
+    def request_todo_detail(self, user):
+        url = reverse("todo-detail", args=(self.any_task(user).id,))
+        return lambda: self.client.get(url, {"expand": "subtasks"})
+
+    def request_todo_create(self, user):
+        data = {"name": "new task", "date": date.today().isoformat()}
+        return lambda: self.client.post(reverse("todo-list"), data)
+
+    def request_todo_update(self, user):
+        url = reverse("todo-detail", args=(self.any_task(user).id,))
+        data = json.dumps({"name": "renamed"})
+        return lambda: self.client.patch(url, data, content_type="application/json")
+
+    def request_todo_complete(self, user):
+        url = reverse("todo-detail", args=(self.new_task(user).id,))
+        data = json.dumps({"is_done": True})
+        return lambda: self.client.patch(url, data, content_type="application/json")
+
+    def request_todo_destroy(self, user):
+        url = reverse("todo-detail", args=(self.new_task(user).id,))
+        return lambda: self.client.delete(url)
+
+    def request_subtask_detail(self, user):
+        subtask = self.any_task(user).subtasks.first()
+        return lambda: self.client.get(reverse("subtask", args=(subtask.id,)))
+
+    def request_subtask_update(self, user):
+        subtask = self.any_task(user).subtasks.first()
+        url = reverse("subtask", args=(subtask.id,))
+        data = json.dumps({"name": "renamed", "is_done": True})
+        return lambda: self.client.patch(url, data, content_type="application/json")
+
+    def request_subtask_destroy(self, user):
+        subtask = self.new_task(user).subtasks.first()
+        return lambda: self.client.delete(reverse("subtask", args=(subtask.id,)))
+
+    def request_subtask_create(self, user):
+        data = {"name": "new subtask", "task": self.any_task(user).id}
+        return lambda: self.client.post(reverse("create_subtask"), data)
+
+    def request_done_tasks(self, user):
+        return lambda: self.client.get(reverse("done_tasks"))
+
+    def request_sync(self, user):
+        token = encode_token(timezone.now())
+        return lambda: self.client.get(reverse("sync"), {"token": token})
+
+    def request_send_code(self, user):
+        user.email = f"{user.username}@example.com"
+        user.save()
+
+        def send():
+            with mock.patch("todo.views.send_code_on_email.delay"):
+                return self.client.post(reverse("send_code"), {"email": user.email})
+
+        return send
+
+    def reset_code(self, user: User) -> ResetPasswordCode:
+        ResetPasswordCode.objects.filter(user=user).delete()
+        return ResetPasswordCode.objects.create(user=user, code="12345")
+
+    def request_check_code(self, user):
+        user.email = f"{user.username}@example.com"
+        user.save()
+        self.reset_code(user)
+        data = {"email": user.email, "code": "12345"}
+        return lambda: self.client.post(reverse("check_code"), data)
+
+    def request_create_password(self, user):
+        self.reset_code(user)
+        data = {
+            "user_id": user.id,
+            "code": "12345",
+            "new_password": "new-password",
+            "confirm_password": "new-password",
+        }
+        return lambda: self.client.post(reverse("create_password"), data)
+
+    def measure(self, name: str, user: User) -> tuple:
+        """
+        (запросов в каждом повторе, время в мс)
+        """
+        prepare = getattr(self, f"request_{name.replace('-', '_')}")
+        queries, timings = [], []
+        for _ in range(self.repeat):
+            self.client.force_login(user)
+            task_cache.clear()
+            send = prepare(user)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 300, f"{name}: {response.content}")
+            queries.append(len(captured))
+        return queries, timings
+
+    def test_query_budgets(self):
+        report = {}
+        for name, budget in BUDGETS.items():
+            with self.subTest(endpoint=name):
+                small, _ = self.measure(name, self.seeded["small"])
+                large, timings = self.measure(name, self.seeded["large"])
+
+                self.assertEqual(large, small, f"{name} depends on data volume")
+                self.assertLessEqual(max(large), budget)
+                report[name] = {
+                    "queries": max(large),
+                    "p50": round(statistics.median(timings), 3),
+                    "p90": round(percentile(timings, 0.9), 3),
+                    "p99": round(percentile(timings, 0.99), 3),
+                }
+                logger.info(
+                    "%-18s: %2d queries, p50 %7.2f ms, p90 %7.2f ms",
+                    name,
+                    max(large),
+                    report[name]["p50"],
+                    report[name]["p90"],
+                )
+
+        self.compare_with_baseline(report)
+
+    def compare_with_baseline(self, report: dict) -> None:
+        baselines = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as file:
+                baselines = json.load(file)
+        # время на sqlite и postgres несравнимо
+        baseline = baselines.get(connection.vendor, {})
+
+        # файл в репозитории меняется только по явной команде
+        if UPDATE_BASELINE:
+            baselines[connection.vendor] = {**baseline, **report}
+            with open(BASELINE_PATH, "w") as file:
+                json.dump(baselines, file, indent=2, sort_keys=True)
+                file.write("\n")
+            return
+
+        for name, current in report.items():
+            if name not in baseline:
+                continue
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(current["queries"], baseline[name]["queries"])
+                self.assertLessEqual(
+                    current["p50"],
+                    baseline[name]["p50"] * LATENCY_TOLERANCE + LATENCY_SLACK_MS,
+                    f"{name} is slower than the baseline",
+                )
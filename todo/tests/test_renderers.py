@@ -0,0 +1,192 @@
+import datetime
+import decimal
+import json
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+from unittest import mock, skipIf
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from todo.models import Task, SubTask, User
+from todo.parsers import ORJSONParser
+from todo.renderers import ORJSONRenderer, MessagePackRenderer, msgpack
+
+
+DATA = OrderedDict(
+    (
+        ("id", 1),
+        ("name", "Задача \u2028 с разделителем"),
+        ("date", datetime.date(2030, 1, 2)),
+        ("overdue", False),
+        ("created", datetime.datetime(2030, 1, 2, 3, 4, 5, 678901)),
+        (
+            "updated",
+            datetime.datetime(
+                2030, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+            ),
+        ),
+        ("time", datetime.time(10, 20, 30, 123456)),
+        ("price", decimal.Decimal("10.50")),
+        ("uuid", uuid.UUID("12345678-1234-5678-1234-567812345678")),
+        ("lazy", gettext_lazy("Not found.")),
+        ("priority", None),
+        ("tags", ("a", "b")),
+        ("nested", [{"is_done": True, 1: "int key"}]),
+    )
+)
+
+
+class ORJSONRendererTestCase(TestCase):
+    def assertSameAsJSONRenderer(self, data, media_type=None, context=None):
+        self.assertEqual(
+            ORJSONRenderer().render(data, media_type, context),
+            JSONRenderer().render(data, media_type, context),
+        )
+
+    def test_project_types(self):
+        self.assertSameAsJSONRenderer(DATA)
+
+    def test_indent(self):
+        self.assertSameAsJSONRenderer(DATA, "application/json; indent=4")
+        self.assertSameAsJSONRenderer(DATA, None, {"indent": 4})
+
+    def test_empty(self):
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_without_orjson(self):
+        with mock.patch("todo.renderers.orjson", None):
+            self.assertSameAsJSONRenderer(DATA)
+
+    def test_api_response(self):
+        user = User.objects.create_user(username="orjson_user", password="pass")
+        task = Task.objects.create(name="task", user=user, date=datetime.date.today())
+        SubTask.objects.create(name="subtask", task=task, priority="2")
+        self.client.force_login(user)
+
+        response = self.client.get(reverse("todo-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.content, JSONRenderer().render(response.data, "application/json")
+        )
+
+
+class ORJSONParserTestCase(TestCase):
+    def parse(self, content: bytes, parser=None, encoding="utf-8"):
+        parser = parser or ORJSONParser()
+        return parser.parse(BytesIO(content), parser_context={"encoding": encoding})
+
+    def test_parse(self):
+        content = json.dumps([{"name": "Задача", "date": "2030-01-02"}]).encode()
+        self.assertEqual(self.parse(content), self.parse(content, JSONParser()))
+
+    def test_parse_error(self):
+        for content in (b"{", b'{"a": NaN}'):
+            with self.assertRaises(ParseError):
+                self.parse(content)
+
+    def test_other_encoding(self):
+        content = json.dumps({"name": "Задача"}, ensure_ascii=False).encode("cp1251")
+        self.assertEqual(self.parse(content, encoding="cp1251"), {"name": "Задача"})
+
+    def test_without_orjson(self):
+        with mock.patch("todo.parsers.orjson", None):
+            self.assertEqual(self.parse(b'{"a": [1, 2]}'), {"a": [1, 2]})
+
+    def test_api_request(self):
+        user = User.objects.create_user(username="orjson_parser", password="pass")
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse("todo-list"),
+            json.dumps({"name": "task", "date": "2030-01-02"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(
+            reverse("todo-list"), "{", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipIf(msgpack is None, "msgpack is not installed")
+class MessagePackTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="msgpack_user", password="pass")
+        self.task = Task.objects.create(
+            name="task", user=self.user, date=datetime.date.today()
+        )
+        self.subtask = SubTask.objects.create(
+            name="subtask", task=self.task, priority="2"
+        )
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def get(self, url: str):
+        response = self.client.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        return msgpack.unpackb(response.content)
+
+    def send(self, method: str, url: str, data: dict):
+        return getattr(self.client, method)(
+            url,
+            msgpack.packb(data),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+
+    def test_renderer_matches_json(self):
+        data = OrderedDict(
+            (key, value) for key, value in DATA.items() if key != "nested"
+        )
+        self.assertEqual(
+            msgpack.unpackb(MessagePackRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+    def test_views_render_msgpack(self):
+        for url in (
+            reverse("todo-list"),
+            reverse("todo-detail", args=(self.task.id,)),
+            reverse("subtask", args=(self.subtask.id,)),
+            reverse("done_tasks"),
+        ):
+            self.assertEqual(self.get(url), self.client.get(url).json())
+
+    def test_round_trip(self):
+        response = self.send(
+            "post", reverse("todo-list"), {"name": "packed", "date": "2030-01-02"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = msgpack.unpackb(response.content)
+        self.assertEqual(created["name"], "packed")
+        self.assertEqual(created["date"], "2030-01-02")
+
+        response = self.send(
+            "post", reverse("create_subtask"), {"name": "packed", "task": created["id"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.send(
+            "patch", reverse("subtask", args=(self.subtask.id,)), {"is_done": True}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(msgpack.unpackb(response.content)["is_done"])
+
+        self.assertEqual(self.get(reverse("done_tasks")), [{"all_tasks": 4, "done": 1}])
+
+    def test_parse_error(self):
+        response = self.client.post(
+            reverse("todo-list"),
+            b"\xc1",
+            content_type="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,9 +1,17 @@
 import os
+import time
+import socket
+import smtplib
+import threading
+import socketserver
+from unittest import mock
 from dotenv import load_dotenv
 
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings, tag
 
-from todo.tasks import send_code_on_email
+from todo.mail import SMTPConnectionPool, build_code_message, close_pool
+from todo.tasks import FAILED, REFUSED, SENT, send_code_on_email, send_codes_on_email
+from todo.tests.utils import logger
 
 
 class TasksTestCase(TestCase):
@@ -18,3 +26,210 @@ class TasksTestCase(TestCase):
 
         self.assertTrue(result.successful())
         self.assertIsNone(result.get())
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP-сервер: принимает всё и складывает письма в server.messages.
+    Адреса из server.refused отклоняются (550), из server.busy - один раз (451)
+    """
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost ESMTP stub")
+        data, lines = False, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data:
+                if line.rstrip(b"\r\n") == b".":
+                    data = False
+                    self.server.messages.append(b"".join(lines))
+                    lines = []
+                    self.reply("250 OK")
+                else:
+                    lines.append(line)
+                continue
+
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 localhost")
+            elif command == b"DATA":
+                data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == b"RCPT":
+                address = line.split(b"<", 1)[1].split(b">", 1)[0].decode()
+                if address in self.server.refused:
+                    self.reply("550 No such user")
+                elif address in self.server.busy:
+                    self.server.busy.discard(address)
+                    self.reply("451 Try again later")
+                else:
+                    self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPStubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPStubHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+        self.busy = set()
+
+
+class SMTPStubTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = SMTPStubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.host, self.port = self.server.server_address
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        close_pool()
+        self.server.shutdown()
+        self.server.server_close()
+        return super().tearDown()
+
+    def make_pool(self, **kwargs) -> SMTPConnectionPool:
+        return SMTPConnectionPool(self.host, self.port, use_tls=False, **kwargs)
+
+
+class SMTPConnectionPoolTestCase(SMTPStubTestCase):
+    def test_reuses_connection(self):
+        pool = self.make_pool()
+        for i in range(10):
+            pool.sendmail("from@test.com", "to@test.com", build_code_message(i))
+
+        self.assertEqual(len(self.server.messages), 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reconnects_after_disconnect(self):
+        pool = self.make_pool(health_check_interval=60)
+        pool.sendmail("from@test.com", "to@test.com", build_code_message(1))
+
+        # соединение рвётся, но пул об этом ещё не знает
+        pool.idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+        pool.sendmail("from@test.com", "to@test.com", build_code_message(2))
+
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(pool.opened, 2)
+
+    def test_health_check(self):
+        pool = self.make_pool(health_check_interval=0)
+        pool.sendmail("from@test.com", "to@test.com", build_code_message(1))
+
+        pool.idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+        pool.sendmail("from@test.com", "to@test.com", build_code_message(2))
+
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(pool.opened, 2)
+
+    def test_max_age(self):
+        pool = self.make_pool(max_age=0)
+        for i in range(3):
+            pool.sendmail("from@test.com", "to@test.com", build_code_message(i))
+
+        self.assertEqual(pool.opened, 3)
+
+    def send_codes(self, messages):
+        with self.settings(
+            EMAIL_HOST=self.host,
+            EMAIL_PORT=self.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER=None,
+            DEFAULT_FROM_EMAIL="from@test.com",
+        ):
+            close_pool()
+            return send_codes_on_email.apply(args=(messages,)).get()
+
+    def sent_codes(self):
+        return sorted(
+            int(message.rsplit(b"\n", 2)[-2]) for message in self.server.messages
+        )
+
+    def test_batched_task(self):
+        results = self.send_codes([(10000 + i, f"user{i}@test.com") for i in range(5)])
+
+        self.assertEqual(results, [(f"user{i}@test.com", SENT) for i in range(5)])
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_batch_survives_refused_recipient(self):
+        self.server.refused.add("user1@test.com")
+        self.server.busy.add("user3@test.com")
+
+        with self.assertLogs("todo.tasks", "WARNING") as logs:
+            results = self.send_codes(
+                [(10000 + i, f"user{i}@test.com") for i in range(5)]
+            )
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertCountEqual(
+            results,
+            [
+                ("user0@test.com", SENT),
+                ("user1@test.com", REFUSED),
+                ("user2@test.com", SENT),
+                ("user3@test.com", SENT),
+                ("user4@test.com", SENT),
+            ],
+        )
+        # повтор отправил только отложенное письмо, без дублей
+        self.assertEqual(self.sent_codes(), [10000, 10002, 10003, 10004])
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch.object(send_codes_on_email, "max_retries", 2), mock.patch(
+            "todo.mail.SMTPConnectionPool.sendmail",
+            side_effect=smtplib.SMTPDataError(451, b"Try again later"),
+        ) as sendmail, self.assertLogs("todo.tasks", "WARNING"):
+            results = self.send_codes([(1, "user0@test.com"), (2, "user1@test.com")])
+
+        self.assertEqual(
+            results, [("user0@test.com", FAILED), ("user1@test.com", FAILED)]
+        )
+        self.assertEqual(sendmail.call_count, 6)
+
+
+@tag("benchmark")
+class SMTPPoolBenchmark(SMTPStubTestCase):
+    messages = 200
+
+    def send_without_pool(self):
+        # так письма отправлялись раньше: новое соединение на каждое письмо
+        for i in range(self.messages):
+            server = smtplib.SMTP(self.host, self.port)
+            server.sendmail("from@test.com", "to@test.com", build_code_message(i))
+            server.close()
+
+    def send_with_pool(self):
+        pool = self.make_pool()
+        for i in range(self.messages):
+            pool.sendmail("from@test.com", "to@test.com", build_code_message(i))
+        pool.close_all()
+
+    def test_messages_per_second(self):
+        rates = {}
+        for name, send in (
+            ("without pool", self.send_without_pool),
+            ("with pool", self.send_with_pool),
+        ):
+            started = time.perf_counter()
+            send()
+            rates[name] = self.messages / (time.perf_counter() - started)
+            logger.info("%s: %.0f messages/s", name, rates[name])
+
+        self.assertEqual(len(self.server.messages), self.messages * 2)
+        self.assertEqual(self.server.connections, self.messages + 1)
@@ -1,16 +1,59 @@
 import os
+import csv
+import http.client
 import json
-from datetime import date
-
-from django.test import TestCase
+import random
+import runpy
+import threading
+import tracemalloc
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock, skipIf
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.conf import settings
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import F, OuterRef, QuerySet, Subquery
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from dotenv import load_dotenv
 
 from rest_framework.authtoken.models import Token
 from rest_framework import status
-
-
-from todo.models import Task, SubTask, User, ResetPasswordCode
+from rest_framework.exceptions import ValidationError
+
+
+from todo.models import Task, SubTask, User, UserTaskStats, ResetPasswordCode, Tombstone
+from todo.authentication import TokenCache, token_cache
+from todo.cache import LocMemPayloadCache, RedisPayloadCache, task_cache
+from todo.export import CSV_HEADER, export_tasks
+from todo.importer import import_tasks
+from todo.search import get_search_backend
+from todo import loadtest
+from todo.profiling import Histogram, RequestProfile, profiler
+from todo import metrics
+from todo import routers
+from todo.tasks import compact_metrics, send_code_on_email
+from todo.serializers import TaskSerializer, TaskReadSerializer
+from todo.seed import seed_users
+from todo.services import get_user_tasks
+from todo.stats import verify_user_stats
+from todo.sync import encode_token, prune_tombstones
+from todo.services import validate_and_decrement_reset_code, CodeAttemptsLimitIsOver
+from todo.services import supports_update_returning
 
 
 class TodoTestCase(TestCase):
@@ -38,7 +81,7 @@ class TodoTestCase(TestCase):
         response = self.client.get(reverse("todo-list"))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 10)
+        self.assertEqual(len(response.data["results"]), 10)
 
     def test_nologin_get(self):
         response = self.client.get("/todo/")
@@ -169,6 +212,172 @@ class TodoTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class TodoPaginationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="paginated_user", password="123ruFOJDvdspqw0id0f"
+        )
+        for i in range(25):
+            Task.objects.create(
+                name=f"Paginated task{i}",
+                user=self.user,
+                date=date.today() + timedelta(days=i % 5),
+                is_done=i % 2 == 0,
+            )
+        return super().setUp()
+
+    def walk(self, url: str) -> list:
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(task["id"] for task in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_pages_ordered_by_date_and_id(self):
+        self.client.force_login(self.user)
+
+        ids = self.walk(reverse("todo-list") + "?page_size=7")
+
+        expected = list(
+            Task.objects.filter(user=self.user)
+            .order_by("date", "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_pages_with_filter(self):
+        self.client.force_login(self.user)
+
+        ids = self.walk(reverse("todo-list") + "?page_size=4&is_done=true")
+
+        expected = list(
+            Task.objects.filter(user=self.user, is_done=True)
+            .order_by("date", "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_previous_page(self):
+        self.client.force_login(self.user)
+
+        first = self.client.get(reverse("todo-list") + "?page_size=10")
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertIsNone(first.data["previous"])
+        self.assertEqual(back.data["results"], first.data["results"])
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("todo-list") + "?cursor=broken")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TodoSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="search_user", password="123ruFOJDvdspqw0id0f"
+        )
+        self.user_2 = User.objects.create_user(
+            username="search_user_2", password="123ruFOJDvdspqw0id0f"
+        )
+        self.milk = Task.objects.create(
+            name="Buy milk",
+            description="milk milk milk",
+            user=self.user,
+            date=date.today(),
+        )
+        self.shop = Task.objects.create(
+            name="Shopping", user=self.user, date=date.today()
+        )
+        for name in ("bread", "milk", "milk chocolate"):
+            SubTask.objects.create(name=name, task=self.shop)
+        Task.objects.create(name="Other milk", user=self.user_2, date=date.today())
+        return super().setUp()
+
+    def search(self, query: str) -> list:
+        response = self.client.get(reverse("todo-list"), {"search": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [task["id"] for task in response.data["results"]]
+
+    def test_search_over_subtasks_without_duplicates(self):
+        self.client.force_login(self.user)
+
+        ids = self.search("milk")
+
+        self.assertCountEqual(ids, [self.milk.id, self.shop.id])
+
+    def test_search_prefix_and_all_terms(self):
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.search("choc"), [self.shop.id])
+        self.assertEqual(self.search("buy milk"), [self.milk.id])
+        self.assertEqual(self.search("buy bread"), [])
+
+    def test_search_document_follows_subtask_changes(self):
+        self.client.force_login(self.user)
+        subtask = SubTask.objects.create(name="coffee beans", task=self.milk)
+
+        self.assertEqual(self.search("coffee"), [self.milk.id])
+
+        subtask.name = "tea"
+        subtask.save()
+        self.assertEqual(self.search("coffee"), [])
+        self.assertEqual(self.search("tea"), [self.milk.id])
+
+        subtask.delete()
+        self.assertEqual(self.search("tea"), [])
+
+    def test_search_document_follows_task_changes(self):
+        self.client.force_login(self.user)
+
+        url = reverse("todo-detail", args=(self.milk.id,))
+        self.client.patch(url, {"name": "Buy kefir"}, content_type="application/json")
+
+        self.assertEqual(self.search("kefir"), [self.milk.id])
+
+    def test_search_paginated_by_rank(self):
+        self.client.force_login(self.user)
+
+        ids = []
+        response = self.client.get(
+            reverse("todo-list"), {"search": "milk", "page_size": 1}
+        )
+        while True:
+            ids += [task["id"] for task in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+
+        # "milk" чаще встречается в более коротком документе первой задачи
+        self.assertEqual(ids, [self.milk.id, self.shop.id])
+
+    def test_search_rank_in_subquery(self):
+        # в подзапросе таблица задач получает другой алиас
+        ranks = Subquery(
+            get_search_backend()
+            .search(Task.objects.filter(id=OuterRef("task_id")), ["milk"])
+            .values("search_rank")[:1]
+        )
+
+        subtasks = SubTask.objects.filter(task=self.shop).annotate(rank=ranks)
+
+        self.assertEqual(len({subtask.rank for subtask in subtasks}), 1)
+        self.assertIsNotNone(subtasks[0].rank)
+
+    def test_delete_task_with_subtasks(self):
+        self.client.force_login(self.user)
+
+        response = self.client.delete(reverse("todo-detail", args=(self.shop.id,)))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.search("bread"), [])
+
+
 class DoneTasksView(TestCase):
     def setUp(self) -> None:
         self.user = User.objects.create_user(
@@ -208,6 +417,108 @@ class DoneTasksView(TestCase):
         response = self.client.get(reverse("done_tasks"))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_single_query(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("done_tasks"))
+
+        # сессия + пользователь + одна строка счётчиков
+        with self.assertNumQueries(3):
+            self.client.get(reverse("done_tasks"))
+
+    def test_counters_follow_writes(self):
+        self.client.force_login(self.user)
+        task = Task.objects.filter(is_done=False, subtasks__isnull=False).first()
+        SubTask.objects.create(name="extra subtask", task=task)
+
+        url = reverse("todo-detail", args=(task.id,))
+        self.client.patch(url, {"is_done": True}, content_type="application/json")
+
+        response = self.client.get(reverse("done_tasks"))
+        self.assertEqual(response.data, [{"all_tasks": 31, "done": 13}])
+
+        subtask = task.subtasks.first()
+        response = self.client.patch(
+            reverse("subtask", args=(subtask.id,)),
+            {"is_done": False},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.delete(url)
+
+        response = self.client.get(reverse("done_tasks"))
+        self.assertEqual(response.data, [{"all_tasks": 28, "done": 10}])
+
+    def test_missing_stats_row(self):
+        UserTaskStats.objects.filter(user=self.user).delete()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("done_tasks"))
+        self.assertEqual(response.data, [{"all_tasks": 0, "done": 0}])
+
+        token = Token.objects.create(user=self.user)
+        response = self.client.get(
+            reverse("async-done_tasks"), HTTP_AUTHORIZATION=f"Token {token.key}"
+        )
+        self.assertEqual(response.json(), [{"all_tasks": 0, "done": 0}])
+
+    def test_stale_toggles_counted_once(self):
+        # два запроса загрузили одну и ту же задачу до изменения
+        task = Task.objects.filter(is_done=False).first()
+        first, second = Task.objects.get(id=task.id), Task.objects.get(id=task.id)
+        first.is_done = second.is_done = True
+        first.save()
+        second.save()
+
+        subtask = SubTask.objects.first()
+        first, second = SubTask.objects.get(id=subtask.id), SubTask.objects.get(
+            id=subtask.id
+        )
+        first.is_done = second.is_done = True
+        first.save()
+        second.save()
+
+        stats = UserTaskStats.objects.get(user=self.user)
+        self.assertEqual((stats.done_tasks, stats.done_subtasks), (11, 1))
+        self.assertEqual(verify_user_stats(), [])
+
+    def test_stale_bulk_toggles_counted_once(self):
+        self.client.force_login(self.user)
+        task = Task.objects.filter(is_done=False).first()
+        subtask = SubTask.objects.first()
+        in_bulk = QuerySet.in_bulk
+
+        def load_then_complete(queryset, *args, **kwargs):
+            # параллельный запрос выполняет объект сразу после загрузки
+            loaded = in_bulk(queryset, *args, **kwargs)
+            for obj in loaded.values():
+                completed = (
+                    type(obj)
+                    .objects.filter(id=obj.id, is_done=False)
+                    .update(is_done=True)
+                )
+                counter = "done_tasks" if isinstance(obj, Task) else "done_subtasks"
+                UserTaskStats.objects.filter(user=self.user).update(
+                    **{counter: F(counter) + completed}
+                )
+            return loaded
+
+        with mock.patch.object(QuerySet, "in_bulk", load_then_complete):
+            response = self.client.patch(
+                reverse("todo-bulk"),
+                [{"id": task.id, "is_done": True}],
+                content_type="application/json",
+            )
+            self.assertEqual(response.data[0]["status"], status.HTTP_200_OK)
+            response = self.client.patch(
+                reverse("subtask_bulk"),
+                [{"id": subtask.id, "is_done": True}],
+                content_type="application/json",
+            )
+            self.assertEqual(response.data[0]["status"], status.HTTP_200_OK)
+
+        self.assertEqual(verify_user_stats(), [])
+
 
 class SubTaskTestCase(TestCase):
     def setUp(self) -> None:
@@ -305,152 +616,2135 @@ class CreateSubtaskTestCase(TestCase):
         self.assertEqual(SubTask.objects.all().count(), 1)
 
 
-class AuthenticationTestCase(TestCase):
+class BulkTestCase(TestCase):
     def setUp(self) -> None:
         self.user = User.objects.create_user(
-            username="admin",
-            password="admin",
-            email="admin@gmail.com",
+            username="bulk_user", password="124Rrfdede2dqrq12"
+        )
+        self.user_2 = User.objects.create_user(
+            username="bulk_user_2", password="124DSawqs"
+        )
+        self.task = Task.objects.create(
+            name="Test task", user=self.user, date=date.today()
+        )
+        self.other_task = Task.objects.create(
+            name="Other task", user=self.user_2, date=date.today()
         )
+        self.client.force_login(self.user)
         return super().setUp()
 
-    def test_auth(self):
-        user = User.objects.create_user(username="test", password="test")
-        user.save()
+    def request(self, method: str, url: str, data: list):
+        return getattr(self.client, method)(
+            url, json.dumps(data), content_type="application/json"
+        )
 
-        response = self.client.post(
-            reverse("auth"), {"username": "test", "password": "test"}
+    def test_bulk_create_tasks(self):
+        day = date.today() + timedelta(days=10)
+        response = self.request(
+            "post",
+            reverse("todo-bulk"),
+            [
+                {"name": "first", "date": day.isoformat()},
+                {"name": "second", "date": day.isoformat(), "is_done": True},
+                {"priority": 4},
+            ],
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.data], [201, 201, 400]
+        )
+        self.assertIn("name", response.data[2]["errors"])
+
+        first = Task.objects.get(id=response.data[0]["data"]["id"])
+        self.assertEqual(first.user, self.user)
+        self.assertEqual(first.week_number, day.isocalendar().week)
+        self.assertEqual(verify_user_stats(), [])
+        self.assertEqual(self.search("second"), [response.data[1]["data"]["id"]])
+
+    def test_bulk_create_single_query_per_step(self):
+        today = date.today().isoformat()
+        items = [{"name": f"task {i}", "date": today} for i in range(50)]
+        with CaptureQueriesContext(connection) as small:
+            self.request("post", reverse("todo-bulk"), items[:5])
+        with CaptureQueriesContext(connection) as large:
+            self.request("post", reverse("todo-bulk"), items)
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_update_tasks(self):
+        SubTask.objects.create(name="subtask", task=self.task)
+        day = date.today() + timedelta(days=30)
+        response = self.request(
+            "patch",
+            reverse("todo-bulk"),
+            [
+                {"id": self.task.id, "is_done": True, "date": day.isoformat()},
+                {"id": self.other_task.id, "name": "stolen"},
+                {"id": self.task.id, "priority": 10},
+                {"name": "no id"},
+            ],
+        )
+        self.assertEqual(
+            [result["status"] for result in response.data], [200, 404, 400, 404]
+        )
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.is_done)
+        self.assertEqual(self.task.week_number, day.isocalendar().week)
+        self.assertTrue(self.task.subtasks.get().is_done)
+        self.assertEqual(Task.objects.get(id=self.other_task.id).name, "Other task")
+        self.assertEqual(verify_user_stats(), [])
+
+    def test_bulk_delete_tasks(self):
+        response = self.request(
+            "delete", reverse("todo-bulk"), [self.task.id, self.other_task.id, "x"]
+        )
+        self.assertEqual(
+            [result["status"] for result in response.data], [204, 404, 404]
+        )
+        self.assertFalse(Task.objects.filter(id=self.task.id).exists())
+        self.assertTrue(Task.objects.filter(id=self.other_task.id).exists())
+        self.assertEqual(verify_user_stats(), [])
+        self.assertEqual(
+            list(Tombstone.objects.values_list("user_id", "kind", "object_id")),
+            [(self.user.id, Tombstone.TASK, self.task.id)],
         )
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue("token" in response.data)
+    def test_bulk_delete_queries_per_batch(self):
+        def delete(count: int) -> int:
+            tasks = [
+                Task.objects.create(name=f"task {i}", user=self.user, date=date.today())
+                for i in range(count)
+            ]
+            for task in tasks:
+                SubTask.objects.create(name="subtask", task=task, is_done=True)
+            with CaptureQueriesContext(connection) as captured:
+                self.request("delete", reverse("todo-bulk"), [t.id for t in tasks])
+            return len(captured)
+
+        self.assertEqual(delete(2), delete(20))
+        self.assertEqual(verify_user_stats(), [])
+        self.assertEqual(Tombstone.objects.filter(kind=Tombstone.TASK).count(), 22)
+
+    def test_bulk_results_match_single_requests(self):
+        day = date.today() - timedelta(days=1)
+        Task.objects.filter(id=self.task.id).update(date=day)
+        single = self.client.patch(
+            reverse("todo-detail", args=(self.task.id,)),
+            {"name": "renamed"},
+            content_type="application/json",
+        )
+        response = self.request(
+            "patch", reverse("todo-bulk"), [{"id": self.task.id, "name": "renamed"}]
+        )
+        bulk = response.data[0]["data"]
 
-    def test_register(self):
+        self.assertTrue(bulk["overdue"])
+        self.assertEqual({**bulk, "version": None}, {**single.data, "version": None})
 
-        response = self.client.post(
-            reverse("register"),
-            {
-                "username": "test_register",
-                "password": "1244tfWDwa",
-                "email": "test@gmail.com",
-            },
-        )
+    def test_bulk_requires_list(self):
+        response = self.request("post", reverse("todo-bulk"), {"name": "task"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.logout()
+        response = self.request(
+            "post", reverse("todo-bulk"), [{"name": "task", "date": "2030-01-01"}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_bulk_create_subtasks(self):
+        response = self.request(
+            "post",
+            reverse("subtask_bulk"),
+            [
+                {"name": "first", "task": self.task.id},
+                {"name": "second", "task": self.other_task.id},
+                {"name": "third", "task": self.task.id, "is_done": True},
+                {"task": self.task.id},
+            ],
+        )
+        self.assertEqual(
+            [result["status"] for result in response.data], [201, 403, 201, 400]
+        )
+        self.assertEqual(response.data[0]["data"]["task"], self.task.id)
+        self.assertEqual(self.task.subtasks.count(), 2)
+        self.assertEqual(self.other_task.subtasks.count(), 0)
+        self.assertEqual(verify_user_stats(), [])
+        self.assertEqual(self.search("third"), [self.task.id])
+
+    def test_bulk_create_subtasks_single_ownership_query(self):
+        items = [{"name": f"subtask {i}", "task": self.task.id} for i in range(50)]
+        with CaptureQueriesContext(connection) as small:
+            self.request("post", reverse("subtask_bulk"), items[:5])
+        with CaptureQueriesContext(connection) as large:
+            self.request("post", reverse("subtask_bulk"), items)
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_update_and_delete_subtasks(self):
+        subtask = SubTask.objects.create(name="subtask", task=self.task)
+        other = SubTask.objects.create(name="other", task=self.other_task)
+
+        response = self.request(
+            "patch",
+            reverse("subtask_bulk"),
+            [
+                {"id": subtask.id, "is_done": True, "name": "renamed"},
+                {"id": other.id, "is_done": True},
+                {"id": subtask.id, "task": self.other_task.id},
+            ],
+        )
+        self.assertEqual(
+            [result["status"] for result in response.data], [200, 404, 403]
+        )
+        subtask.refresh_from_db()
+        self.assertTrue(subtask.is_done)
+        self.assertEqual(subtask.task_id, self.task.id)
+        self.assertFalse(SubTask.objects.get(id=other.id).is_done)
+        self.assertEqual(self.search("renamed"), [self.task.id])
+
+        response = self.request(
+            "delete", reverse("subtask_bulk"), [subtask.id, other.id]
+        )
+        self.assertEqual([result["status"] for result in response.data], [204, 404])
+        self.assertTrue(SubTask.objects.filter(id=other.id).exists())
+        self.assertEqual(verify_user_stats(), [])
+        self.assertEqual(self.search("renamed"), [])
         self.assertTrue(
-            User.objects.filter(
-                username="test_register", email="test@gmail.com"
+            Tombstone.objects.filter(
+                user=self.user, kind=Tombstone.SUBTASK, object_id=subtask.id
             ).exists()
         )
 
-    def test_update_password(self):
+    def test_bulk_delete_subtasks_queries_per_batch(self):
+        def delete(count: int) -> int:
+            subtasks = [
+                SubTask.objects.create(name="subtask", task=self.task, is_done=True)
+                for _ in range(count)
+            ]
+            with CaptureQueriesContext(connection) as captured:
+                self.request(
+                    "delete", reverse("subtask_bulk"), [s.id for s in subtasks]
+                )
+            return len(captured)
 
-        Token.objects.create(user=self.user)
+        self.assertEqual(delete(2), delete(20))
+        self.assertEqual(verify_user_stats(), [])
 
-        response = self.client.post(
-            reverse("update_password"),
-            {
-                "token": self.user.auth_token,
-                "old_password": "admin",
-                "new_password": "123RWRWQRQ",
-                "confirm_password": "123RWRWQRQ",
-            },
+    def search(self, query: str) -> list:
+        response = self.client.get(reverse("todo-list"), {"search": query})
+        return [task["id"] for task in response.data["results"]]
+
+
+@override_settings(SYNC={"SKEW_WINDOW": 0, "TOMBSTONE_DAYS": 30})
+class SyncTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="sync_user", password="124Rrfdede2dqrq12"
+        )
+        self.user_2 = User.objects.create_user(
+            username="sync_user_2", password="124DSawqs"
         )
+        self.tasks = [
+            Task.objects.create(name=f"Task {i}", user=self.user, date=date.today())
+            for i in range(3)
+        ]
+        self.subtask = SubTask.objects.create(name="subtask", task=self.tasks[0])
+        self.other_task = Task.objects.create(
+            name="Other task", user=self.user_2, date=date.today()
+        )
+        self.client.force_login(self.user)
+        return super().setUp()
 
+    def sync(self, token: str | None = None) -> dict:
+        params = {"token": token} if token else {}
+        response = self.client.get(reverse("sync"), params)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
 
-    def test_send_code(self):
-        load_dotenv()
-        email = os.getenv("EMAIL")
+    def test_full_sync(self):
+        data = self.sync()
+        self.assertTrue(data["reset"])
+        self.assertEqual(
+            [task["id"] for task in data["tasks"]], [task.id for task in self.tasks]
+        )
+        self.assertEqual(data["tasks"][0]["subtasks"][0]["id"], self.subtask.id)
+
+    def test_no_changes(self):
+        data = self.sync(self.sync()["sync_token"])
+        self.assertFalse(data["reset"])
+        self.assertEqual(data["tasks"], [])
+        self.assertEqual(data["subtasks"], [])
+        self.assertEqual(data["deleted"], {"tasks": [], "subtasks": []})
+
+    def test_changes_since_token(self):
+        token = self.sync()["sync_token"]
+
+        self.tasks[1].name = "renamed"
+        self.tasks[1].save()
+        self.subtask.is_done = True
+        self.subtask.save()
+        Task.objects.create(name="new", user=self.user_2, date=date.today())
+
+        data = self.sync(token)
+        self.assertEqual([task["id"] for task in data["tasks"]], [self.tasks[1].id])
+        self.assertEqual(data["subtasks"][0]["id"], self.subtask.id)
+        self.assertEqual(data["subtasks"][0]["task"], self.tasks[0].id)
+
+        data = self.sync(data["sync_token"])
+        self.assertEqual(data["tasks"], [])
+
+    def test_changed_subtask_inside_changed_task(self):
+        token = self.sync()["sync_token"]
+        self.client.patch(
+            reverse("todo-detail", args=(self.tasks[0].id,)),
+            {"is_done": True},
+            content_type="application/json",
+        )
 
-        User.objects.create_user(
-            username="test",
-            password="test",
-            email=email,
+        data = self.sync(token)
+        self.assertEqual([task["id"] for task in data["tasks"]], [self.tasks[0].id])
+        self.assertTrue(data["tasks"][0]["subtasks"][0]["is_done"])
+        self.assertEqual(data["subtasks"], [])
+
+    def test_bulk_changes(self):
+        token = self.sync()["sync_token"]
+        self.client.patch(
+            reverse("todo-bulk"),
+            json.dumps([{"id": self.tasks[2].id, "priority": 3}]),
+            content_type="application/json",
+        )
+        self.client.patch(
+            reverse("subtask_bulk"),
+            json.dumps([{"id": self.subtask.id, "name": "renamed"}]),
+            content_type="application/json",
         )
 
-        response = self.client.post(reverse("send_code"), {"email": email})
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = self.sync(token)
+        self.assertEqual([task["id"] for task in data["tasks"]], [self.tasks[2].id])
+        self.assertEqual(
+            [subtask["id"] for subtask in data["subtasks"]], [self.subtask.id]
+        )
 
-    def test_wrong_email_send_code(self):
+    def test_deletions(self):
+        SubTask.objects.create(name="cascade", task=self.tasks[1])
+        token = self.sync()["sync_token"]
 
-        response = self.client.post(reverse("send_code"), {"email": "@wrong.email@"})
+        self.client.delete(reverse("subtask", args=(self.subtask.id,)))
+        self.client.delete(reverse("todo-detail", args=(self.tasks[1].id,)))
+        self.other_task.delete()
+
+        data = self.sync(token)
+        self.assertEqual(
+            data["deleted"],
+            {"tasks": [self.tasks[1].id], "subtasks": [self.subtask.id]},
+        )
 
+    def test_deleted_user_has_no_tombstones(self):
+        self.user_2.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse("sync"), {"token": "garbage"})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    def test_check_code(self):
+    def test_expired_token_resets(self):
+        token = encode_token(timezone.now() - timedelta(days=31))
+        data = self.sync(token)
+        self.assertTrue(data["reset"])
+        self.assertEqual(len(data["tasks"]), 3)
+
+    @override_settings(SYNC={"SKEW_WINDOW": 60, "TOMBSTONE_DAYS": 30})
+    def test_skew_window(self):
+        # изменения последних SKEW_WINDOW секунд отдаются повторно
+        data = self.sync(self.sync()["sync_token"])
+        self.assertEqual(len(data["tasks"]), 3)
+
+    def test_prune_tombstones(self):
+        self.tasks[0].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        task_id = self.tasks[1].id
+        self.tasks[1].delete()
+
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertEqual(
+            list(Tombstone.objects.values_list("object_id", flat=True)), [task_id]
+        )
 
-        Token.objects.create(user=self.user)
-        code = "12345"
+    def test_no_auth(self):
+        self.client.logout()
+        response = self.client.get(reverse("sync"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
-        ResetPasswordCode.objects.create(user=self.user, code=code)
 
-        response = self.client.post(
-            reverse("check_code"), {"email": "admin@gmail.com", "code": code}
+class ConditionalGetTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="etag_user", password="124Rrfdede2dqrq12"
+        )
+        self.task = Task.objects.create(
+            name="Test task", user=self.user, date=date.today()
+        )
+        self.other_task = Task.objects.create(
+            name="Other task", user=self.user, date=date.today()
+        )
+        self.subtask = SubTask.objects.create(name="subtask", task=self.task)
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def assertNotModified(self, url: str, **headers):
+        etag = self.client.get(url, **headers)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # задачи не загружаются
+        self.assertFalse(
+            any("todo_subtask" in query["sql"] for query in queries.captured_queries)
         )
+        return etag
 
+    def assertModified(self, url: str, etag: str):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, {"Correct": "True", "user_id": self.user.id})
-
-    def test_check_code_attempts(self):
-        Token.objects.create(user=self.user)
-        code = "12345"
+        self.assertNotEqual(response["ETag"], etag)
 
-        reset_code_obj = ResetPasswordCode.objects.create(user=self.user, code=code)
-        self.assertEqual(reset_code_obj.attempt, 5)
+    def test_list(self):
+        url = reverse("todo-list")
+        etag = self.assertNotModified(url)
 
-        # make 5 attempts with wrong code and after assert code attempts == 0
-        for _ in range(5):
-            response = self.client.post(
-                reverse("check_code"), {"email": "admin@gmail.com", "code": "54321"}
-            )
-            self.assertEqual(response.status_code, 400)
+        self.client.patch(
+            reverse("todo-detail", args=(self.task.id,)),
+            {"name": "renamed"},
+            content_type="application/json",
+        )
+        self.assertModified(url, etag)
+
+    def test_list_depends_on_query_string(self):
+        url = reverse("todo-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertModified(url + "?is_done=true", etag)
+
+    def test_write_paths_bump_list_version(self):
+        url = reverse("todo-list")
+        writes = (
+            lambda: self.client.patch(
+                reverse("subtask", args=(self.subtask.id,)),
+                {"name": "renamed"},
+                content_type="application/json",
+            ),
+            lambda: self.client.patch(
+                reverse("todo-detail", args=(self.task.id,)),
+                {"is_done": True},
+                content_type="application/json",
+            ),
+            lambda: self.client.patch(
+                reverse("todo-bulk"),
+                json.dumps([{"id": self.other_task.id, "priority": 2}]),
+                content_type="application/json",
+            ),
+            lambda: self.client.delete(reverse("subtask", args=(self.subtask.id,))),
+            lambda: self.client.delete(reverse("todo-detail", args=(self.task.id,))),
+        )
+        for write in writes:
+            etag = self.client.get(url)["ETag"]
+            write()
+            self.assertModified(url, etag)
 
-        reset_code_obj.refresh_from_db()
-        self.assertEqual(reset_code_obj.attempt, 0)
+    def test_retrieve(self):
+        url = reverse("todo-detail", args=(self.task.id,))
+        etag = self.assertNotModified(url)
 
-    def test_use_all_code_attempts_429(self):
-        Token.objects.create(user=self.user)
-        reset_code = ResetPasswordCode.objects.create(user=self.user, code="77777")
-        self.assertEqual(reset_code.attempt, 5)
+        # изменение другой задачи не меняет эту
+        self.other_task.name = "renamed"
+        self.other_task.save()
+        self.assertNotModified(url)
 
-        for _ in range(6):
-            response = self.client.post(
-                reverse("check_code"), {"email": "admin@gmail.com", "code": "11111"}
-            )
+        self.client.patch(
+            reverse("subtask", args=(self.subtask.id,)),
+            {"is_done": True},
+            content_type="application/json",
+        )
+        self.assertModified(url, etag)
 
-        self.assertEqual(response.status_code, 429)
-        self.assertEqual(response.json(), {"detail": "Attempts are over"})
+        etag = self.client.get(url)["ETag"]
+        self.client.delete(reverse("subtask", args=(self.subtask.id,)))
+        self.assertModified(url, etag)
 
-    def test_create_password(self):
+    def test_save_of_stale_instance(self):
+        url = reverse("todo-detail", args=(self.task.id,))
+        task = Task.objects.get(id=self.task.id)
+        SubTask.objects.create(name="new", task=self.task)
+        etag = self.client.get(url)["ETag"]
 
-        Token.objects.create(user=self.user)
-        code = "54321"
+        # версия задачи в памяти отстала от базы
+        task.name = "renamed"
+        task.save()
 
-        ResetPasswordCode.objects.create(user=self.user, code=code)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "renamed")
+        self.assertEqual(task.version, Task.objects.get(id=task.id).version)
 
-        response = self.client.post(
-            reverse("create_password"),
-            {
-                "user_id": self.user.id,
-                "code": code,
-                "new_password": "21dFEQEWqwds2",
-                "confirm_password": "21dFEQEWqwds2",
-            },
+    def test_retrieve_bulk_subtasks(self):
+        url = reverse("todo-detail", args=(self.task.id,))
+        etag = self.client.get(url)["ETag"]
+        self.client.post(
+            reverse("subtask_bulk"),
+            json.dumps([{"name": "new", "task": self.task.id}]),
+            content_type="application/json",
         )
+        self.assertModified(url, etag)
 
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    def test_if_modified_since(self):
+        url = reverse("done_tasks")
+        response = self.client.get(url)
+        last_modified = response["Last-Modified"]
 
-        user = User.objects.get(id=self.user.id)
-        self.assertTrue(user.check_password("21dFEQEWqwds2"))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
 
-    def test_create_password_attempts(self):
+    def test_if_modified_since_after_midnight(self):
+        url = reverse("todo-detail", args=(self.task.id,))
+        last_modified = self.client.get(url)["Last-Modified"]
 
-        Token.objects.create(user=self.user)
-        code = "54321"
+        # задача на сегодня станет просроченной завтра без изменения данных
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch("django.utils.timezone.now", return_value=tomorrow):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
 
-        reset_code = ResetPasswordCode.objects.create(user=self.user, code=code)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["overdue"])
+
+    def test_done_tasks(self):
+        url = reverse("done_tasks")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        SubTask.objects.create(name="new", task=self.task)
+        self.assertModified(url, etag)
+
+    def test_not_owner(self):
+        user = User.objects.create_user(username="etag_user_2", password="124DSaw")
+        self.client.force_login(user)
+        response = self.client.get(reverse("todo-detail", args=(self.task.id,)))
+        self.assertFalse(response.has_header("ETag"))
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+
+
+class FakeRedis:
+    """Минимальная замена redis.Redis: mget и pipeline().set"""
+
+    def __init__(self) -> None:
+        self.data = {}
+        self.expires = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+        self.expires[key] = ex
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis) -> None:
+        self.client = client
+        self.commands = []
+
+    def set(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+    def execute(self):
+        for args, kwargs in self.commands:
+            self.client.set(*args, **kwargs)
+
+
+class TaskPayloadCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="cache_user", password="124Rrfdede2dqrq12"
+        )
+        self.tasks = [
+            Task.objects.create(name=f"Task {i}", user=self.user, date=date.today())
+            for i in range(3)
+        ]
+        self.subtask = SubTask.objects.create(name="subtask", task=self.tasks[0])
+        self.client.force_login(self.user)
+        task_cache.clear()
+        return super().setUp()
+
+    def get_list(self) -> list:
+        return self.client.get(reverse("todo-list"), {"expand": "subtasks"}).data[
+            "results"
+        ]
+
+    def test_second_list_served_from_cache(self):
+        first = self.get_list()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get_list()
+        self.assertEqual(first, second)
+        self.assertFalse(
+            any("todo_subtask" in query["sql"] for query in queries.captured_queries)
+        )
+        self.assertEqual(task_cache.stats()["hits"], 3)
+        self.assertEqual(task_cache.stats()["hit_ratio"], 0.5)
+
+    def test_cached_payload_equals_serializer(self):
+        self.get_list()
+        cached = self.get_list()
+        task_cache.clear()
+        self.assertEqual(cached, self.get_list())
+
+        url = reverse("todo-detail", args=(self.tasks[0].id,))
+        self.assertEqual(self.client.get(url, {"expand": "subtasks"}).data, cached[0])
+
+    def test_writes_bump_version(self):
+        self.get_list()
+
+        self.client.patch(
+            reverse("subtask", args=(self.subtask.id,)),
+            {"name": "renamed"},
+            content_type="application/json",
+        )
+        self.assertEqual(self.get_list()[0]["subtasks"][0]["name"], "renamed")
+
+        self.client.post(
+            reverse("create_subtask"), {"name": "created", "task": self.tasks[1].id}
+        )
+        self.assertEqual(self.get_list()[1]["subtasks"][0]["name"], "created")
+
+        self.client.patch(
+            reverse("todo-detail", args=(self.tasks[2].id,)),
+            {"name": "renamed task"},
+            content_type="application/json",
+        )
+        self.assertEqual(self.get_list()[2]["name"], "renamed task")
+
+        # сохранение из админки
+        task = Task.objects.get(id=self.tasks[2].id)
+        task.description = "from admin"
+        task.save()
+        self.assertEqual(self.get_list()[2]["description"], "from admin")
+
+    def test_overdue_recomputed(self):
+        cached = self.get_list()
+        self.assertFalse(cached[0]["overdue"])
+
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch("todo.cache.timezone.now", return_value=tomorrow):
+            response = self.get_list()
+        self.assertTrue(response[0]["overdue"])
+
+    def test_lru(self):
+        cache = LocMemPayloadCache(max_size=2)
+        cache.set_many({"a": {"id": 1}, "b": {"id": 2}})
+        cache.get_many(["a"])
+        cache.set_many({"c": {"id": 3}})
+        self.assertEqual(set(cache.get_many(["a", "b", "c"])), {"a", "c"})
+
+    def test_redis_backend(self):
+        client = FakeRedis()
+        cache = RedisPayloadCache(client=client, ttl=60)
+        with mock.patch("todo.cache.task_cache", cache):
+            first = self.get_list()
+            second = self.get_list()
+        self.assertEqual(first, second)
+        self.assertEqual(len(client.data), 3)
+        self.assertEqual(set(client.expires.values()), {60})
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 3, "hit_ratio": 0.5})
+
+
+class TaskReadSerializerTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="read_user", password="124Rrfdede2dqrq12"
+        )
+        for i in range(6):
+            task = Task.objects.create(
+                name=f"Task {i}",
+                description=None if i % 2 else f"description {i}",
+                priority=(None, 1, 2, 3)[i % 4],
+                is_done=i % 3 == 0,
+                user=self.user,
+                date=date.today() + timedelta(days=i - 3),
+            )
+            for j in range(i % 3):
+                SubTask.objects.create(
+                    name=f"subtask {i}-{j}",
+                    description=None if j else "subtask description",
+                    priority=(None, 2, "3")[j],
+                    is_done=bool(j),
+                    task=task,
+                )
+        self.client.force_login(self.user)
+        task_cache.clear()
+        return super().setUp()
+
+    def test_parity_with_task_serializer(self):
+        queryset = get_user_tasks(self.user).order_by("id")
+        expected = TaskSerializer(queryset, many=True).data
+        rows = list(TaskReadSerializer.values(queryset.prefetch_related(None)))
+        self.assertEqual(
+            json.dumps(TaskReadSerializer.to_representation(rows)),
+            json.dumps(expected),
+        )
+
+    def test_list_and_retrieve_match_task_serializer(self):
+        queryset = get_user_tasks(self.user).order_by("date", "id")
+        expected = json.loads(json.dumps(TaskSerializer(queryset, many=True).data))
+
+        response = self.client.get(reverse("todo-list"), {"expand": "subtasks"})
+        self.assertEqual(response.json()["results"], expected)
+
+        response = self.client.get(
+            reverse("todo-detail", args=(expected[0]["id"],)), {"expand": "subtasks"}
+        )
+        self.assertEqual(response.json(), expected[0])
+
+    def test_subtasks_not_expanded_by_default(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("todo-list"))
+        self.assertNotIn("subtasks", response.json()["results"][0])
+        self.assertFalse(
+            any("todo_subtask" in query["sql"] for query in queries.captured_queries)
+        )
+
+    @override_settings(TASK_DEFAULT_EXPAND=("subtasks",))
+    def test_default_expand_setting(self):
+        response = self.client.get(reverse("todo-list"))
+        self.assertIn("subtasks", response.json()["results"][0])
+
+        response = self.client.get(reverse("todo-list"), {"expand": ""})
+        self.assertNotIn("subtasks", response.json()["results"][0])
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("todo-list"), {"fields": "name,id,is_done"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.json()["results"][0]), ["id", "name", "is_done"])
+        sql = queries.captured_queries[-1]["sql"]
+        self.assertNotIn("description", sql)
+        self.assertNotIn("overdue", sql)
+
+        task = get_user_tasks(self.user).get(name="Task 2")
+        expected = json.loads(json.dumps(TaskSerializer(task).data))
+        response = self.client.get(
+            reverse("todo-detail", args=(task.id,)), {"fields": "name,subtasks"}
+        )
+        self.assertEqual(
+            response.json(), {"name": "Task 2", "subtasks": expected["subtasks"]}
+        )
+
+    def test_overdue_field(self):
+        response = self.client.get(reverse("todo-list"), {"fields": "id,overdue"})
+        results = response.json()["results"]
+        self.assertEqual([list(item) for item in results], [["id", "overdue"]] * 6)
+        self.assertEqual(
+            [item["overdue"] for item in results], [True] * 3 + [False] * 3
+        )
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse("todo-list"), {"fields": "id,user"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", response.json())
+
+        response = self.client.get(reverse("todo-list"), {"expand": "user"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("expand", response.json())
+
+    def test_shapes_cached_separately(self):
+        full = self.client.get(reverse("todo-list")).json()["results"]
+        short = self.client.get(reverse("todo-list"), {"fields": "id"}).json()
+        self.assertEqual(short["results"], [{"id": item["id"]} for item in full])
+
+    def test_subtasks_in_one_query(self):
+        rows = list(TaskReadSerializer.values(get_user_tasks(self.user)))
+        with self.assertNumQueries(1):
+            TaskReadSerializer.to_representation(rows)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="export_user", password="124Rrfdede2dqrq12"
+        )
+        for i in range(5):
+            task = Task.objects.create(
+                name=f"Задача {i}",
+                description='a, "quoted"\nline' if i == 0 else None,
+                priority=(None, 1, 2)[i % 3],
+                is_done=i % 2 == 0,
+                user=self.user,
+                date=date.today() + timedelta(days=i - 2),
+            )
+            for j in range(i % 3):
+                SubTask.objects.create(name=f"subtask {i}-{j}", task=task)
+        other = User.objects.create_user(username="other", password="124Rrfdede2dqrq12")
+        Task.objects.create(name="foreign", user=other, date=date.today())
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def get_export(self, **params) -> str:
+        response = self.client.get(reverse("export"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_matches_task_serializer(self):
+        queryset = get_user_tasks(self.user).order_by("id")
+        expected = json.loads(json.dumps(TaskSerializer(queryset, many=True).data))
+
+        lines = self.get_export().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.get_export(output="csv"))))
+        # задачи без подзадач занимают одну строку
+        self.assertEqual(len(rows), 1 + 1 + 2 + 1 + 1)
+        self.assertEqual(list(rows[0]), list(CSV_HEADER))
+        self.assertEqual(rows[0]["description"], 'a, "quoted"\nline')
+        self.assertEqual(rows[0]["subtask_id"], "")
+        self.assertEqual(rows[1]["name"], "Задача 1")
+        self.assertEqual(rows[1]["subtask_name"], "subtask 1-0")
+
+    def test_headers(self):
+        response = self.client.get(reverse("export"), {"output": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="tasks.csv"', response["Content-Disposition"])
+
+        response = self.client.get(reverse("export"), HTTP_ACCEPT="text/csv")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+    def test_unknown_output(self):
+        response = self.client.get(reverse("export"), {"output": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_auth_required(self):
+        self.client.logout()
+        response = self.client.get(reverse("export"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_subtasks_per_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(export_tasks(self.user, "ndjson", chunk_size=2))
+        self.assertEqual(len(lines), 5)
+        subtask_queries = [
+            query
+            for query in queries.captured_queries
+            if "todo_subtask" in query["sql"]
+        ]
+        self.assertEqual(len(subtask_queries), 3)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command("export_tasks", "export_user", stdout=stdout)
+        self.assertEqual(stdout.getvalue(), self.get_export())
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tasks.csv")
+            call_command(
+                "export_tasks", "export_user", "--output=csv", f"--file={path}"
+            )
+            with open(path, encoding="utf-8", newline="") as file:
+                self.assertEqual(file.read(), self.get_export(output="csv"))
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command("export_tasks", "nobody", stdout=StringIO())
+
+    def measure_export_peak(self, count: int) -> int:
+        user = User.objects.create_user(
+            username=f"export_{count}", password="124Rrfdede2dqrq12"
+        )
+        self.client.force_login(user)
+        tasks = Task.objects.bulk_create(
+            Task(
+                name=f"task {i}",
+                description="x" * 200,
+                user=user,
+                date=date.today(),
+            )
+            for i in range(count)
+        )
+        SubTask.objects.bulk_create(
+            SubTask(name=f"subtask {task.id}", task=task) for task in tasks
+        )
+
+        tracemalloc.start()
+        try:
+            response = self.client.get(reverse("export"))
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, count * 200)
+        return peak
+
+    @override_settings(EXPORT_CHUNK_SIZE=100)
+    def test_memory_does_not_grow_with_rows(self):
+        small = self.measure_export_peak(300)
+        large = self.measure_export_peak(3000)
+        # в 10 раз больше строк, память - в пределах одной пачки
+        self.assertLess(large, small * 1.5)
+
+
+class ImportTestCase(TestCase):
+    def setUp(self) -> None:
+        self.source = User.objects.create_user(
+            username="source_user", password="124Rrfdede2dqrq12"
+        )
+        for i in range(5):
+            task = Task.objects.create(
+                name=f"Задача {i}",
+                description='a, "quoted"\nline' if i == 0 else None,
+                priority=(None, 1, 2)[i % 3],
+                is_done=i % 2 == 0,
+                user=self.source,
+                date=date.today() + timedelta(days=i * 3),
+            )
+            for j in range(i % 3):
+                SubTask.objects.create(
+                    name=f"subtask {i}-{j}", priority=j + 1, is_done=bool(j), task=task
+                )
+        self.user = User.objects.create_user(
+            username="import_user", password="124Rrfdede2dqrq12"
+        )
+        self.client.force_login(self.user)
+        self.future = (date.today() + timedelta(days=1)).isoformat()
+        return super().setUp()
+
+    def post_import(self, body: str, content_type: str, **params) -> dict:
+        url = reverse("import")
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        response = self.client.post(url, body.encode(), content_type=content_type)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def exported(self, user: User, output: str = "ndjson") -> list:
+        lines = list(export_tasks(user, output))
+        if output == "csv":
+            rows = list(csv.DictReader(lines))
+            for row in rows:
+                row.pop("id")
+                row.pop("subtask_id")
+            return rows
+        tasks = [json.loads(line) for line in lines]
+        for task in tasks:
+            task.pop("id")
+            for subtask in task["subtasks"]:
+                subtask.pop("id")
+        return tasks
+
+    def test_ndjson_round_trip(self):
+        body = "".join(export_tasks(self.source, "ndjson"))
+        report = self.post_import(body, "application/x-ndjson")
+
+        self.assertEqual(
+            report, {"tasks": 5, "subtasks": 4, "error_count": 0, "errors": []}
+        )
+        self.assertEqual(self.exported(self.user), self.exported(self.source))
+
+    def test_csv_round_trip(self):
+        body = "".join(export_tasks(self.source, "csv"))
+        report = self.post_import(body, "text/csv")
+
+        self.assertEqual((report["tasks"], report["subtasks"]), (5, 4))
+        self.assertEqual(
+            self.exported(self.user, "csv"), self.exported(self.source, "csv")
+        )
+
+    def test_derived_data(self):
+        body = "".join(export_tasks(self.source, "ndjson"))
+        self.post_import(body, "application/x-ndjson")
+
+        for task in Task.objects.filter(user=self.user):
+            self.assertEqual(task.week_number, task.date.isocalendar().week)
+        self.assertEqual(verify_user_stats(), [])
+        response = self.client.get(reverse("todo-list"), {"search": "subtask"})
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_row_errors_do_not_abort_batch(self):
+        lines = [
+            {"name": "first", "date": self.future},
+            "{broken",
+            {"name": "past", "date": "2000-01-01"},
+            {"date": self.future},
+            {"name": "bad subtask", "date": self.future, "subtasks": [{"priority": 7}]},
+            [1, 2],
+            {"name": "last", "date": self.future, "subtasks": [{"name": "ok"}]},
+        ]
+        body = "\n".join(
+            line if isinstance(line, str) else json.dumps(line) for line in lines
+        )
+        report = self.post_import(body, "application/x-ndjson")
+
+        self.assertEqual((report["tasks"], report["subtasks"]), (2, 1))
+        self.assertEqual(report["error_count"], 5)
+        self.assertEqual([error["line"] for error in report["errors"]], [2, 3, 4, 5, 6])
+        self.assertIn("date", report["errors"][1]["errors"])
+        self.assertIn("name", report["errors"][2]["errors"])
+        self.assertIn("subtasks", report["errors"][3]["errors"])
+        self.assertEqual(
+            list(Task.objects.filter(user=self.user).values_list("name", flat=True)),
+            ["first", "last"],
+        )
+
+    def test_csv_line_numbers(self):
+        body = (
+            "id,name,date,subtask_name\n"
+            f"1,first,{self.future},a\n"
+            f"1,first,{self.future},b\n"
+            "2,past,2000-01-01,\n"
+            f"3,,{self.future},\n"
+            f",no id,{self.future},\n"
+        )
+        report = self.post_import(body, "text/csv")
+
+        self.assertEqual((report["tasks"], report["subtasks"]), (2, 2))
+        self.assertEqual([error["line"] for error in report["errors"]], [4, 5])
+
+    @override_settings(IMPORT_BATCH_SIZE=2)
+    def test_batches(self):
+        body = "\n".join(
+            json.dumps({"name": f"task {i}", "date": self.future}) for i in range(5)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            report = self.post_import(body, "application/x-ndjson")
+        self.assertEqual(report["tasks"], 5)
+        inserts = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "todo_task"')
+        ]
+        self.assertEqual(len(inserts), 3)
+
+    @mock.patch("todo.importer.MAX_REPORTED_ERRORS", 2)
+    def test_reported_errors_limit(self):
+        report = self.post_import("{\n" * 5, "application/x-ndjson")
+        self.assertEqual(report["error_count"], 5)
+        self.assertEqual(len(report["errors"]), 2)
+
+    def test_unreadable_file(self):
+        body = json.dumps({"name": "ok", "date": self.future}).encode() + b"\n\xff\n"
+        response = self.client.post(
+            reverse("import"), body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.json()["error_count"], 1)
+        self.assertIsNone(response.json()["errors"][0]["line"])
+
+    def test_input_format(self):
+        body = f"name,date\nfrom csv,{self.future}\n"
+        report = self.post_import(body, "text/plain", input="csv")
+        self.assertEqual(report["tasks"], 1)
+
+        response = self.client.post(reverse("import"), body, content_type="text/plain")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_auth_required(self):
+        self.client.logout()
+        response = self.client.post(
+            reverse("import"), "", content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_command(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tasks.csv")
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                file.writelines(export_tasks(self.source, "csv"))
+            stdout = StringIO()
+            call_command("import_tasks", "import_user", path, stdout=stdout)
+
+        self.assertIn("Imported 5 tasks and 4 subtasks, 0 errors", stdout.getvalue())
+        self.assertEqual(
+            self.exported(self.user, "csv"), self.exported(self.source, "csv")
+        )
+
+    def test_import_function(self):
+        lines = [json.dumps({"name": "direct", "date": self.future})]
+        report = import_tasks(self.user, lines, "ndjson", batch_size=1)
+        self.assertEqual(report["tasks"], 1)
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="profiled", password="124Rrfdede2dqrq12"
+        )
+        self.admin = User.objects.create_user(
+            username="admin_user", password="124Rrfdede2dqrq12", is_staff=True
+        )
+        for i in range(3):
+            Task.objects.create(name=f"task {i}", user=self.user, date=date.today())
+        self.client.force_login(self.user)
+        profiler.reset()
+        return super().setUp()
+
+    def test_views_resolved(self):
+        task = Task.objects.filter(user=self.user).first()
+        self.client.get(reverse("todo-list"))
+        self.client.get(reverse("todo-list"))
+        self.client.get(reverse("todo-detail", args=(task.id,)))
+        self.client.get(reverse("done_tasks"))
+
+        snapshot = profiler.snapshot()
+        self.assertEqual(
+            set(snapshot), {"TodoViewSet.list", "TodoViewSet.retrieve", "DoneTasksView"}
+        )
+        stats = snapshot["TodoViewSet.list"]
+        self.assertEqual(stats["wall"]["count"], 2)
+        self.assertEqual(stats["serialization"]["count"], 2)
+        self.assertGreater(stats["queries"]["sum"], 0)
+        self.assertLessEqual(stats["sql_time"]["sum"], stats["wall"]["sum"])
+
+    def test_query_count_matches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("todo-list"))
+        stats = profiler.snapshot()["TodoViewSet.list"]
+        self.assertEqual(stats["queries"]["sum"], len(queries))
+
+    def test_duplicates(self):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            for task in Task.objects.filter(user=self.user):
+                list(task.subtasks.all())
+        self.assertEqual(len(profile.queries), 4)
+        self.assertEqual(profile.duplicates, 2)
+        # порядок top_queries зависит от времени, поэтому ищем подзадачи по SQL
+        counts = {query["sql"]: query["count"] for query in profile.top_queries(2)}
+        self.assertEqual(sorted(counts.values()), [1, 3])
+        subtasks = max(counts, key=counts.get)
+        self.assertIn("todo_subtask", subtasks)
+
+    @override_settings(PROFILING={"SAMPLE_RATE": 0})
+    def test_sampling(self):
+        self.client.get(reverse("todo-list"))
+        self.assertEqual(profiler.snapshot(), {})
+
+    @override_settings(PROFILING={"SLOW_REQUEST_MS": 0, "TOP_QUERIES": 2})
+    def test_slow_request_log(self):
+        with self.assertLogs("todo.profiling", "WARNING") as logs:
+            self.client.get(reverse("todo-list"))
+        self.assertIn("TodoViewSet.list", logs.output[0])
+        self.assertEqual(logs.output[0].count(" ms x"), 2)
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["buckets"], {"1": 1, "10": 2, "100": 1, "+Inf": 1})
+        self.assertEqual(snapshot["p50"], 10)
+        self.assertEqual(snapshot["p99"], 500)
+        self.assertEqual(snapshot["max"], 500)
+
+    def test_admin_only(self):
+        self.client.get(reverse("todo-list"))
+        response = self.client.get(reverse("profiling"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("profiling"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("TodoViewSet.list", response.json())
+
+        response = self.client.delete(reverse("profiling"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(profiler.snapshot()), ["ProfilingView"])
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="metrics_user", password="124Rrfdede2dqrq12"
+        )
+        Task.objects.create(name="task", user=self.user, date=date.today())
+        self.client.force_login(self.user)
+        metrics.registry.reset()
+        task_cache.clear()
+        return super().setUp()
+
+    def scrape(self) -> dict:
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                series, value = line.rsplit(" ", 1)
+                samples[series] = float(value)
+        return samples
+
+    def test_requests_by_url_name(self):
+        task = Task.objects.get(user=self.user)
+        self.client.get(reverse("todo-list"))
+        self.client.get(reverse("todo-list"))
+        self.client.get(reverse("todo-detail", args=(task.id,)))
+        self.client.get(reverse("done_tasks"))
+
+        samples = self.scrape()
+        self.assertEqual(
+            samples[
+                'todo_http_requests_total{method="GET",status="200",url_name="todo-list"}'
+            ],
+            2,
+        )
+        self.assertEqual(
+            samples['todo_http_request_duration_seconds_count{url_name="todo-detail"}'],
+            1,
+        )
+        self.assertEqual(
+            samples[
+                'todo_http_request_duration_seconds_bucket{url_name="todo-list",le="+Inf"}'
+            ],
+            2,
+        )
+        self.assertGreater(samples['todo_db_queries_total{url_name="done_tasks"}'], 0)
+
+    def test_cache_hit_ratio(self):
+        self.client.get(reverse("todo-list"))
+        self.client.get(reverse("todo-list"))
+
+        samples = self.scrape()
+        self.assertEqual(samples['todo_cache_hits_total{cache="task_payload"}'], 1)
+        self.assertEqual(samples['todo_cache_hit_ratio{cache="task_payload"}'], 0.5)
+
+    def test_celery_tasks(self):
+        with mock.patch("todo.tasks.get_pool"):
+            send_code_on_email.apply(args=(12345, "user@example.com"))
+        with mock.patch("todo.tasks.get_pool", side_effect=ConnectionError):
+            send_code_on_email.apply(args=(12345, "user@example.com"))
+
+        samples = self.scrape()
+        labels = 'task="todo.tasks.send_code_on_email"'
+        self.assertEqual(
+            samples[f'todo_celery_tasks_total{{state="SUCCESS",{labels}}}'], 1
+        )
+        self.assertEqual(samples[f"todo_celery_task_failures_total{{{labels}}}"], 1)
+        self.assertEqual(
+            samples[f"todo_celery_task_duration_seconds_count{{{labels}}}"], 2
+        )
+
+    def test_thread_shards(self):
+        def work():
+            for _ in range(1000):
+                metrics.registry.inc("todo_db_queries_total", {"url_name": "x"})
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counters = metrics.registry.collect()["counters"]
+        self.assertEqual(
+            counters[("todo_db_queries_total", (("url_name", "x"),))], 4000
+        )
+        # шарды завершившихся потоков сложены в один
+        self.assertEqual(metrics.registry.shards, [])
+
+        for _ in range(20):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+            self.assertLessEqual(len(metrics.registry.shards), 1)
+        counters = metrics.registry.collect()["counters"]
+        self.assertEqual(
+            counters[("todo_db_queries_total", (("url_name", "x"),))], 24000
+        )
+
+    def test_multiprocess_aggregation(self):
+        with TemporaryDirectory() as directory:
+            with override_settings(METRICS={"MULTIPROCESS_DIR": directory}):
+                metrics.registry.inc("todo_db_queries_total", {"url_name": "x"}, 3)
+                metrics.registry.observe(
+                    "todo_celery_task_duration_seconds", {"task": "t"}, 0.2
+                )
+                # файл другого процесса (например, воркера celery)
+                metrics.write_dump(directory, 0, metrics.registry.collect())
+                metrics.registry.flush(force=True)
+                self.assertTrue(
+                    os.path.exists(metrics.dump_path(directory, os.getpid()))
+                )
+
+                samples = self.scrape()
+
+        self.assertEqual(samples['todo_db_queries_total{url_name="x"}'], 6)
+        self.assertEqual(
+            samples['todo_celery_task_duration_seconds_bucket{task="t",le="0.25"}'], 2
+        )
+
+    def test_dead_processes_are_archived(self):
+        with TemporaryDirectory() as directory:
+            with override_settings(METRICS={"MULTIPROCESS_DIR": directory}):
+                metrics.registry.inc("todo_db_queries_total", {"url_name": "x"}, 3)
+                data = metrics.registry.collect()
+                metrics.registry.reset()
+                # файл прежнего процесса с тем же pid и завершившегося процесса
+                metrics.write_dump(directory, os.getpid(), data)
+                metrics.write_dump(directory, 4242, data)
+                metrics.registry.claimed = False
+
+                with mock.patch("todo.metrics.process_alive", return_value=False):
+                    metrics.registry.inc("todo_db_queries_total", {"url_name": "x"})
+                    metrics.registry.flush(force=True)
+                    first = self.scrape()
+                    # /metrics только читает файлы
+                    scraped = sorted(os.listdir(directory))
+                    compact_metrics.apply()
+                    second = self.scrape()
+
+                files = sorted(os.listdir(directory))
+
+        dead = os.path.basename(metrics.dump_path("", 4242))
+        self.assertEqual(first['todo_db_queries_total{url_name="x"}'], 7)
+        self.assertEqual(second['todo_db_queries_total{url_name="x"}'], 7)
+        self.assertIn(dead, scraped)
+        self.assertNotIn(dead, files)
+        self.assertIn(metrics.ARCHIVE_NAME, files)
+
+    def test_access(self):
+        url = reverse("metrics")
+        response = self.client.get(url, REMOTE_ADDR="10.1.2.3")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS={"TOKEN": "secret"}):
+            response = self.client.get(
+                url, REMOTE_ADDR="10.1.2.3", HTTP_AUTHORIZATION="Bearer wrong"
+            )
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(
+                url, REMOTE_ADDR="10.1.2.3", HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with override_settings(METRICS={"ALLOWED_IPS": ["10.0.0.0/8"]}):
+            response = self.client.get(url, REMOTE_ADDR="10.1.2.3")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS={"PORT": 9100})
+    def test_separate_port(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        metrics.registry.inc("todo_db_queries_total", {"url_name": "x"}, 2)
+        server = metrics.start_server(0, host="127.0.0.1")
+        self.addCleanup(setattr, metrics, "server", None)
+        self.addCleanup(server.stop)
+        connection = http.client.HTTPConnection(*server.server_address)
+        self.addCleanup(connection.close)
+
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertIn('todo_db_queries_total{url_name="x"} 2', response.read().decode())
+
+        connection.request("GET", "/todo/")
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+
+        with override_settings(METRICS={"ALLOWED_IPS": []}):
+            connection.request("GET", "/metrics")
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 403)
+
+    def test_after_fork(self):
+        metrics.registry.inc("todo_db_queries_total", {"url_name": "x"})
+        metrics.registry.after_fork()
+        self.assertNotIn(
+            "todo_db_queries_total",
+            {name for name, _ in metrics.registry.collect()["counters"]},
+        )
+
+    def test_label_escaping(self):
+        self.assertEqual(
+            metrics.format_labels((("task", 'a"b\\c\nd'),)), '{task="a\\"b\\\\c\\nd"}'
+        )
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+# без лога медленных запросов: хеширование пароля в api-token-auth медленное
+@override_settings(PROFILING={"SLOW_REQUEST_MS": float("inf")})
+class LoadTestTestCase(TransactionTestCase):
+    def setUp(self) -> None:
+        token_cache.clear()
+        task_cache.clear()
+        return super().setUp()
+
+    def test_seed_load(self):
+        stdout = StringIO()
+        call_command(
+            "seed_load",
+            "3",
+            "--seed",
+            "1",
+            "--tasks",
+            "2:5",
+            "--subtasks",
+            "1:2",
+            "--days=-3:3",
+            "--priorities",
+            "none=0,3=1",
+            "--done-ratio",
+            "1",
+            stdout=stdout,
+        )
+        self.assertIn("Created 3 users", stdout.getvalue())
+
+        tasks = Task.objects.filter(user__username__startswith="load_")
+        self.assertEqual(User.objects.filter(username__startswith="load_").count(), 3)
+        self.assertTrue(2 * 3 <= tasks.count() <= 5 * 3)
+        self.assertEqual(set(tasks.values_list("priority", flat=True)), {3})
+        self.assertFalse(tasks.filter(is_done=False).exists())
+        self.assertFalse(tasks.filter(subtasks__isnull=True).exists())
+        self.assertEqual(verify_user_stats(), [])
+        for task in tasks:
+            self.assertEqual(task.week_number, task.date.isocalendar().week)
+            self.assertTrue(task.search.document)
+
+        with self.assertRaises(CommandError):
+            call_command("seed_load", "1", stdout=StringIO())
+
+    def test_seed_is_reproducible(self):
+        first = seed_users(2, prefix="a_", seed=5)
+        second = seed_users(2, prefix="b_", seed=5)
+        names = [
+            list(Task.objects.filter(user=user).values_list("name", "date"))
+            for user in first + second
+        ]
+        self.assertEqual(names[:2], names[2:])
+
+    def test_parse_mix(self):
+        self.assertEqual(
+            loadtest.parse_mix("todo-list=3, subtask"), {"todo-list": 3, "subtask": 1}
+        )
+        for value in ("unknown=1", "todo-list=x", "todo-list=0"):
+            with self.assertRaises(ValueError):
+                loadtest.parse_mix(value)
+
+    def test_wsgi_client(self):
+        seed_users(1, seed=1, TASKS=(1, 1), SUBTASKS=(0, 0))
+        session = loadtest.build_sessions("load_")[0]
+        request = loadtest.create_subtask(random.Random(1), session, "loadtest")
+        client = loadtest.WSGIClient(get_internal_wsgi_application())
+
+        self.assertEqual(client(*request, token=session.token), 201)
+        self.assertEqual(client(*request, token="wrong"), 401)
+        self.assertEqual(SubTask.objects.filter(task_id=session.task_ids[0]).count(), 1)
+
+    @skipIf(
+        connection.vendor == "sqlite",
+        "in-memory sqlite locks the whole table for concurrent writers",
+    )
+    def test_run_with_writes(self):
+        seed_users(2, seed=1)
+        sessions = loadtest.build_sessions("load_")
+        report = loadtest.run(
+            loadtest.WSGIClient(get_internal_wsgi_application()),
+            sessions,
+            {"create_subtask": 1, "todo-list": 1},
+            requests=20,
+            threads=4,
+            seed=1,
+        )
+        self.assertEqual(report["endpoints"]["total"]["errors"], 0)
+
+    def test_run(self):
+        seed_users(3, seed=1, TASKS=(1, 3), SUBTASKS=(1, 2))
+        sessions = loadtest.build_sessions("load_")
+        mix = {**loadtest.DEFAULT_MIX, "create_subtask": 0, "api-token-auth": 0}
+
+        report = loadtest.run(
+            loadtest.WSGIClient(get_internal_wsgi_application()),
+            sessions,
+            mix,
+            requests=30,
+            threads=2,
+            seed=1,
+        )
+
+        endpoints = report["endpoints"]
+        self.assertEqual(endpoints["total"]["requests"], 30)
+        self.assertEqual(endpoints["total"]["errors"], 0)
+        self.assertNotIn("create_subtask", endpoints)
+        for row in endpoints.values():
+            self.assertLessEqual(row["p50"], row["p95"])
+            self.assertLessEqual(row["p95"], row["p99"])
+            self.assertGreater(row["rps"], 0)
+
+    @override_settings(ALLOWED_HOSTS=["127.0.0.1"])
+    def test_http_client(self):
+        seed_users(1, seed=1, TASKS=(1, 1))
+        session = loadtest.build_sessions("load_")[0]
+        server = make_server(
+            "127.0.0.1", 0, get_internal_wsgi_application(), handler_class=QuietHandler
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = loadtest.HTTPClient(f"http://127.0.0.1:{server.server_port}")
+            request = loadtest.done_tasks(random.Random(1), session, "loadtest")
+            # wsgiref закрывает соединение после ответа: клиент переподключается
+            self.assertEqual(client(*request, token=session.token), 200)
+            self.assertEqual(client(*request, token=session.token), 200)
+            self.assertEqual(client(*request, token="wrong"), 401)
+            client.close()
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    @override_settings(ALLOWED_HOSTS=["127.0.0.1"])
+    def test_async_http_client(self):
+        seed_users(2, seed=1, TASKS=(2, 2), SUBTASKS=(1, 1))
+        sessions = loadtest.build_sessions("load_")
+        server = make_server(
+            "127.0.0.1", 0, get_internal_wsgi_application(), handler_class=QuietHandler
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            for prefix in ("", "/async"):
+                client = loadtest.AsyncHTTPClient(
+                    f"http://127.0.0.1:{server.server_port}", prefix=prefix
+                )
+                report = loadtest.arun(
+                    client,
+                    sessions,
+                    loadtest.READ_MIX,
+                    requests=20,
+                    connections=4,
+                    seed=1,
+                )
+                total = report["endpoints"]["total"]
+                self.assertEqual(total["requests"], 20)
+                self.assertEqual(total["errors"], 0)
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    def test_loadtest_command(self):
+        with self.assertRaises(CommandError):
+            call_command("loadtest", stdout=StringIO())
+
+        seed_users(1, seed=1, TASKS=(1, 1))
+        stdout = StringIO()
+        call_command(
+            "loadtest",
+            "--threads",
+            "1",
+            "--requests",
+            "5",
+            "--mix",
+            "done_tasks",
+            "--json",
+            stdout=stdout,
+        )
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["endpoints"]["done_tasks"]["requests"], 5)
+
+
+class GunicornConfigTestCase(TestCase):
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "tdp", "gunicorn.conf.py"
+    )
+
+    def load(self, **env) -> dict:
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(self.path)
+
+    def test_defaults(self):
+        with mock.patch("multiprocessing.cpu_count", return_value=4):
+            config = self.load(WEB_CONCURRENCY="", GUNICORN_THREADS="")
+        self.assertEqual(config["workers"], 9)
+        self.assertEqual(config["threads"], 2)
+        self.assertEqual(config["worker_class"], "gthread")
+        self.assertTrue(config["preload_app"])
+
+    def test_env(self):
+        config = self.load(
+            WEB_CONCURRENCY="3", GUNICORN_THREADS="1", GUNICORN_RELOAD="1"
+        )
+        self.assertEqual(config["workers"], 3)
+        self.assertEqual(config["worker_class"], "sync")
+        self.assertTrue(config["reload"])
+        self.assertFalse(config["preload_app"])
+
+    def test_refuses_workers_without_shared_token_cache(self):
+        on_starting = self.load()["on_starting"]
+        server = mock.Mock()
+        server.cfg.workers = 3
+        token_auth_cache = {**settings.TOKEN_AUTH_CACHE, "CACHE_ALIAS": None}
+
+        with override_settings(PRODUCTION=True, TOKEN_AUTH_CACHE=token_auth_cache):
+            with self.assertRaises(ImproperlyConfigured):
+                on_starting(server)
+            server.cfg.workers = 1
+            on_starting(server)
+
+        token_auth_cache["CACHE_ALIAS"] = "default"
+        server.cfg.workers = 3
+        with override_settings(PRODUCTION=True, TOKEN_AUTH_CACHE=token_auth_cache):
+            on_starting(server)
+
+    def test_asgi_worker(self):
+        config = self.load(GUNICORN_WORKER_CLASS="uvicorn.workers.UvicornWorker")
+        self.assertEqual(config["worker_class"], "uvicorn.workers.UvicornWorker")
+
+
+class AsyncViewsTestCase(TestCase):
+    """
+    Асинхронные ручки отвечают так же, как синхронные
+    """
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="async_user", password="124Rrfdede2dqrq12"
+        )
+        self.other = User.objects.create_user(
+            username="async_other", password="124Rrfdede2dqrq12"
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.other_token = Token.objects.create(user=self.other).key
+        for i in range(5):
+            task = Task.objects.create(
+                name=f"async task {i}",
+                user=self.user,
+                date=date.today() + timedelta(days=i - 2),
+                priority=i % 3 + 1,
+                is_done=i % 2 == 0,
+            )
+            SubTask.objects.create(name=f"subtask {i}", task=task)
+        self.task = Task.objects.filter(user=self.user).first()
+        self.subtask = SubTask.objects.filter(task=self.task).first()
+        token_cache.clear()
+        task_cache.clear()
+        return super().setUp()
+
+    def get(self, name: str, *args, token=None, **extra):
+        return self.client.get(
+            reverse(name, args=args),
+            HTTP_AUTHORIZATION=f"Token {token or self.token}",
+            **extra,
+        )
+
+    def assertSameResponse(self, name: str, *args, query: str = "", **extra):
+        sync = self.client.get(
+            reverse(name, args=args) + query,
+            HTTP_AUTHORIZATION=f"Token {self.token}",
+            **extra,
+        )
+        response = self.client.get(
+            reverse(f"async-{name}", args=args) + query,
+            HTTP_AUTHORIZATION=f"Token {self.token}",
+            **extra,
+        )
+        self.assertEqual(response.status_code, sync.status_code)
+        if sync.status_code == status.HTTP_200_OK:
+            # ссылки пагинации ведут на свои адреса
+            content = response.content.decode().replace("/async/", "/")
+            self.assertEqual(json.loads(content), json.loads(sync.content))
+        else:
+            self.assertEqual(response.json(), sync.json())
+        return response
+
+    def test_same_as_sync(self):
+        self.assertSameResponse("todo-list")
+        self.assertSameResponse("todo-list", query="?is_done=true&priority=2")
+        self.assertSameResponse("todo-list", query="?fields=id,name,overdue")
+        self.assertSameResponse("todo-list", query="?expand=subtasks&page_size=2")
+        self.assertSameResponse("todo-list", query="?search=async")
+        self.assertSameResponse("todo-list", query="?fields=unknown")
+        self.assertSameResponse("todo-detail", self.task.id)
+        self.assertSameResponse("todo-detail", self.task.id, query="?expand=subtasks")
+        self.assertSameResponse("subtask", self.subtask.id)
+        self.assertSameResponse("done_tasks")
+
+    def test_pagination_links(self):
+        response = self.get("async-todo-list", data={"page_size": 2})
+        next_url = response.json()["next"]
+        self.assertIn("/async/todo/", next_url)
+        response = self.client.get(next_url, HTTP_AUTHORIZATION=f"Token {self.token}")
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_errors(self):
+        response = self.client.get(reverse("async-todo-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response["WWW-Authenticate"], "Token")
+        response = self.client.get(
+            reverse("async-todo-list"), HTTP_AUTHORIZATION="Token wrong"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {"detail": "Invalid token."})
+
+        response = self.get("async-todo-detail", self.task.id, token=self.other_token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.get("async-subtask", self.subtask.id, token=self.other_token)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json(), {"detail": "Not a task owner"})
+        response = self.get("async-subtask", 0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post(
+            reverse("async-todo-list"), HTTP_AUTHORIZATION=f"Token {self.token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_conditional_get(self):
+        for name, args in (
+            ("async-todo-list", ()),
+            ("async-todo-detail", (self.task.id,)),
+            ("async-done_tasks", ()),
+        ):
+            etag = self.get(name, *args)["ETag"]
+            response = self.get(name, *args, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = self.get("async-todo-list")["ETag"]
+        self.client.patch(
+            reverse("todo-detail", args=(self.task.id,)),
+            {"name": "renamed"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {self.token}",
+        )
+        response = self.get("async-todo-list", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_msgpack(self):
+        response = self.get("async-done_tasks", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+
+    async def test_async_client(self):
+        headers = {"authorization": f"Token {self.token}"}
+        response = await self.async_client.get(reverse("async-todo-list"), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 5)
+
+        response = await self.async_client.get(reverse("async-done_tasks"), **headers)
+        self.assertEqual(response.json(), [{"all_tasks": 10, "done": 3}])
+
+    async def test_network_caches_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        client = FakeRedis()
+        mget = client.mget
+
+        def recording_mget(keys):
+            threads.append(threading.get_ident())
+            return mget(keys)
+
+        client.mget = recording_mget
+        payloads = RedisPayloadCache(client=client)
+        await payloads.aset_many({"1": {"id": 1}})
+        self.assertEqual(await payloads.aget_many(["1"]), {"1": {"id": 1}})
+
+        tokens = TokenCache(cache_alias="default")
+        tokens.set("key", (self.user, "key"))
+        tokens.entries.clear()
+        get = LocMemCache.get
+
+        def recording_get(cache, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return get(cache, *args, **kwargs)
+
+        with mock.patch.object(LocMemCache, "get", recording_get):
+            self.assertEqual(await tokens.aget("key"), (self.user, "key"))
+
+        # payloads.mget, токен и поколение пользователя
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+
+
+class ReplicaRoutingTestCase(TransactionTestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="replica_user", password="124Rrfdede2dqrq12"
+        )
+        self.task = Task.objects.create(name="task", user=self.user, date=date.today())
+        self.client.force_login(self.user)
+        routers.write_marks.clear()
+        routers.lag_monitor.clear()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        routers.write_marks.clear()
+        routers.lag_monitor.clear()
+        return super().tearDown()
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Task), "default")
+
+        state = routers.ReadState(None)
+        state.enable(None, routers.get_options())
+        state.alias = "replica1"
+        token = routers.read_state.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Task), "replica1")
+            self.assertEqual(router.db_for_read(Token), "default")
+            self.assertEqual(router.db_for_read(User), "default")
+            self.assertEqual(router.db_for_write(Task), "default")
+        finally:
+            routers.read_state.reset(token)
+
+    def test_atomic_block_reads_from_primary(self):
+        state = routers.ReadState(None)
+        state.enable(None, routers.get_options())
+        state.alias = "replica1"
+        token = routers.read_state.set(state)
+        try:
+            with transaction.atomic():
+                self.assertEqual(routers.ReplicaRouter().db_for_read(Task), "default")
+        finally:
+            routers.read_state.reset(token)
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"]})
+    def test_allow_migrate(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate("replica1", "todo"))
+        self.assertIsNone(router.allow_migrate("default", "todo"))
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"]})
+    def test_safe_requests_read_from_replica(self):
+        with mock.patch.object(
+            routers, "choose_replica", return_value="default"
+        ) as choose:
+            self.client.get(reverse("todo-list"))
+            self.client.get(reverse("todo-detail", args=(self.task.id,)))
+            self.client.get(reverse("done_tasks"))
+            self.assertEqual(choose.call_count, 3)
+
+            # синхронизация и экспорт читают только с основной базы
+            self.client.get(reverse("sync"))
+            self.client.get(reverse("export"))
+            self.assertEqual(choose.call_count, 3)
+
+    @override_settings(REPLICAS={"ALIASES": []})
+    def test_without_replicas(self):
+        with mock.patch.object(routers, "choose_replica") as choose:
+            response = self.client.get(reverse("todo-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        choose.assert_not_called()
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"], "STICKY_SECONDS": 60})
+    def test_read_your_writes(self):
+        with mock.patch.object(
+            routers, "choose_replica", return_value="default"
+        ) as choose:
+            self.client.patch(
+                reverse("todo-detail", args=(self.task.id,)),
+                data={"name": "renamed"},
+                content_type="application/json",
+            )
+            response = self.client.get(reverse("todo-detail", args=(self.task.id,)))
+            self.assertEqual(response.data["name"], "renamed")
+            choose.assert_not_called()
+
+            # других пользователей запись не касается
+            other = User.objects.create_user(
+                username="other_replica_user", password="124Rrfdede2dqrq12"
+            )
+            self.client.force_login(other)
+            self.client.get(reverse("todo-list"))
+            choose.assert_called_once()
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"], "STICKY_SECONDS": 0})
+    def test_sticky_window_expires(self):
+        self.client.patch(
+            reverse("todo-detail", args=(self.task.id,)),
+            data={"name": "renamed"},
+            content_type="application/json",
+        )
+        with mock.patch.object(
+            routers, "choose_replica", return_value="default"
+        ) as choose:
+            self.client.get(reverse("todo-list"))
+        choose.assert_called_once()
+
+    def test_sticky_shared_cache(self):
+        with override_settings(
+            CACHES={
+                "replicas": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            }
+        ):
+            routers.write_marks.mark(self.user.id, 60, "replicas")
+            routers.write_marks.clear()
+            # другой процесс видит отметку через общий кэш
+            self.assertTrue(routers.write_marks.is_sticky(self.user.id, "replicas"))
+            self.assertFalse(routers.write_marks.is_sticky(self.user.id, None))
+
+    def test_lag(self):
+        lags = {"replica1": 0.5, "replica2": 30}
+
+        def measure(alias):
+            if alias == "replica3":
+                raise OperationalError("connection refused")
+            return lags[alias]
+
+        options = {
+            **routers.DEFAULTS,
+            "ALIASES": ["replica1", "replica2", "replica3"],
+            "MAX_LAG": 5,
+            "LAG_CHECK_INTERVAL": 60,
+        }
+        with mock.patch.object(
+            routers.lag_monitor, "measure", side_effect=measure
+        ), self.assertLogs("todo.routers", "WARNING"):
+            for _ in range(5):
+                self.assertEqual(routers.choose_replica(options), "replica1")
+            self.assertIsNone(routers.lag_monitor.lag("replica3", 60))
+
+            # отставание кэшируется на LAG_CHECK_INTERVAL
+            lags["replica1"] = 10
+            self.assertEqual(routers.choose_replica(options), "replica1")
+            routers.lag_monitor.clear()
+            self.assertEqual(routers.choose_replica(options), "default")
+
+    def test_measure_lag(self):
+        if connection.vendor == "postgresql":
+            # основная база не в режиме восстановления
+            self.assertEqual(routers.measure_lag("default"), 0)
+        else:
+            self.assertEqual(routers.measure_lag("default"), 0.0)
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"]})
+    def test_fallback_to_primary(self):
+        request = RequestFactory().get(reverse("todo-list"))
+        request.user = self.user
+        request.resolver_match = mock.Mock(url_name="todo-list")
+        calls = []
+
+        def view(request):
+            calls.append(routers.ReplicaRouter().db_for_read(Task))
+            if len(calls) == 1:
+                raise OperationalError("replica is gone")
+            return "response"
+
+        middleware = routers.ReplicaMiddleware(lambda request: None)
+        with mock.patch.object(routers.lag_monitor, "measure", return_value=0):
+            token = routers.read_state.set(routers.ReadState(request))
+            try:
+                middleware.process_view(request, view, (), {})
+                with self.assertRaises(OperationalError):
+                    view(request)
+                with self.assertLogs("todo.routers", "WARNING"):
+                    response = middleware.process_exception(
+                        request, OperationalError("replica is gone")
+                    )
+            finally:
+                routers.read_state.reset(token)
+            self.assertEqual(response, "response")
+            self.assertEqual(calls, ["replica1", "default"])
+            # до следующей проверки реплика не используется
+            self.assertIsNone(routers.lag_monitor.lag("replica1", 60))
+            self.assertEqual(routers.choose_replica(routers.get_options()), "default")
+
+
+@skipIf("replica1" not in settings.DATABASES, "No replica configured")
+class ReplicaDatabaseTestCase(TransactionTestCase):
+    """
+    С настроенной репликой (DB_REPLICAS, в тестах - зеркало default)
+    """
+
+    databases = "__all__"
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="replica_user", password="124Rrfdede2dqrq12"
+        )
+        Task.objects.create(name="task", user=self.user, date=date.today())
+        self.token = Token.objects.create(user=self.user).key
+        routers.write_marks.clear()
+        routers.lag_monitor.clear()
+        return super().setUp()
+
+    def get(self):
+        with CaptureQueriesContext(connections["replica1"]) as queries:
+            response = self.client.get(
+                reverse("todo-list"), HTTP_AUTHORIZATION=f"Token {self.token}"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    @override_settings(REPLICAS={"ALIASES": ["replica1"], "STICKY_SECONDS": 60})
+    def test_reads_and_writes(self):
+        response, replica_queries = self.get()
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertGreater(replica_queries, 0)
+
+        with CaptureQueriesContext(connections["replica1"]) as queries:
+            self.client.post(
+                reverse("todo-list"),
+                data={"name": "new", "date": date.today()},
+                HTTP_AUTHORIZATION=f"Token {self.token}",
+            )
+        self.assertEqual(len(queries), 0)
+
+        response, replica_queries = self.get()
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(replica_queries, 0)
+
+
+class AuthenticationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="admin",
+            password="admin",
+            email="admin@gmail.com",
+        )
+        return super().setUp()
+
+    def test_auth(self):
+        user = User.objects.create_user(username="test", password="test")
+        user.save()
+
+        response = self.client.post(
+            reverse("auth"), {"username": "test", "password": "test"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue("token" in response.data)
+
+    def test_register(self):
+
+        response = self.client.post(
+            reverse("register"),
+            {
+                "username": "test_register",
+                "password": "1244tfWDwa",
+                "email": "test@gmail.com",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertTrue(
+            User.objects.filter(
+                username="test_register", email="test@gmail.com"
+            ).exists()
+        )
+
+    def test_update_password(self):
+
+        Token.objects.create(user=self.user)
+
+        response = self.client.post(
+            reverse("update_password"),
+            {
+                "token": self.user.auth_token,
+                "old_password": "admin",
+                "new_password": "123RWRWQRQ",
+                "confirm_password": "123RWRWQRQ",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_send_code(self):
+        load_dotenv()
+        email = os.getenv("EMAIL")
+
+        User.objects.create_user(
+            username="test",
+            password="test",
+            email=email,
+        )
+
+        response = self.client.post(reverse("send_code"), {"email": email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_wrong_email_send_code(self):
+
+        response = self.client.post(reverse("send_code"), {"email": "@wrong.email@"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_check_code(self):
+
+        Token.objects.create(user=self.user)
+        code = "12345"
+
+        ResetPasswordCode.objects.create(user=self.user, code=code)
+
+        response = self.client.post(
+            reverse("check_code"), {"email": "admin@gmail.com", "code": code}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"Correct": "True", "user_id": self.user.id})
+
+    def test_check_code_attempts(self):
+        Token.objects.create(user=self.user)
+        code = "12345"
+
+        reset_code_obj = ResetPasswordCode.objects.create(user=self.user, code=code)
+        self.assertEqual(reset_code_obj.attempt, 5)
+
+        # make 5 attempts with wrong code and after assert code attempts == 0
+        for _ in range(5):
+            response = self.client.post(
+                reverse("check_code"), {"email": "admin@gmail.com", "code": "54321"}
+            )
+            self.assertEqual(response.status_code, 400)
+
+        reset_code_obj.refresh_from_db()
+        self.assertEqual(reset_code_obj.attempt, 0)
+
+    def test_use_all_code_attempts_429(self):
+        Token.objects.create(user=self.user)
+        reset_code = ResetPasswordCode.objects.create(user=self.user, code="77777")
+        self.assertEqual(reset_code.attempt, 5)
+
+        for _ in range(6):
+            response = self.client.post(
+                reverse("check_code"), {"email": "admin@gmail.com", "code": "11111"}
+            )
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "Attempts are over"})
+
+    def test_create_password(self):
+
+        Token.objects.create(user=self.user)
+        code = "54321"
+
+        ResetPasswordCode.objects.create(user=self.user, code=code)
+
+        response = self.client.post(
+            reverse("create_password"),
+            {
+                "user_id": self.user.id,
+                "code": code,
+                "new_password": "21dFEQEWqwds2",
+                "confirm_password": "21dFEQEWqwds2",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        user = User.objects.get(id=self.user.id)
+        self.assertTrue(user.check_password("21dFEQEWqwds2"))
+
+    def test_create_password_attempts(self):
+
+        Token.objects.create(user=self.user)
+        code = "54321"
+
+        reset_code = ResetPasswordCode.objects.create(user=self.user, code=code)
 
         wrong_code = "55555"
         # make try to create new pass with wrong and check that number of attempts decrement
@@ -467,3 +2761,231 @@ class AuthenticationTestCase(TestCase):
 
         reset_code.refresh_from_db()
         self.assertEqual(reset_code.attempt, 4)
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="cached_user",
+            password="cached_password",
+            email="cached@gmail.com",
+        )
+        self.token = Token.objects.create(user=self.user)
+        return super().setUp()
+
+    def get(self, key: str):
+        return self.client.get(reverse("done_tasks"), HTTP_AUTHORIZATION=f"Token {key}")
+
+    def test_second_request_skips_token_query(self):
+        self.get(self.token.key)
+
+        with self.assertNumQueries(1):
+            response = self.get(self.token.key)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+        self.assertEqual(token_cache.stats()["misses"], 1)
+
+    def test_password_reset_runs_user_signals(self):
+        code = "54321"
+        ResetPasswordCode.objects.create(user=self.user, code=code)
+
+        with mock.patch("todo.signals.token_cache.invalidate_user") as invalidate:
+            self.client.post(
+                reverse("create_password"),
+                {
+                    "user_id": self.user.id,
+                    "code": code,
+                    "new_password": "21dFEQEWqwds2",
+                    "confirm_password": "21dFEQEWqwds2",
+                },
+            )
+
+        # сохранение пользователя и удаление его токена
+        self.assertEqual(invalidate.call_args_list, [mock.call(self.user.id)] * 2)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("21dFEQEWqwds2"))
+
+    def test_deleted_token_is_invalidated(self):
+        self.get(self.token.key)
+        code = "54321"
+        ResetPasswordCode.objects.create(user=self.user, code=code)
+
+        self.client.post(
+            reverse("create_password"),
+            {
+                "user_id": self.user.id,
+                "code": code,
+                "new_password": "21dFEQEWqwds2",
+                "confirm_password": "21dFEQEWqwds2",
+            },
+        )
+
+        response = self.get(self.token.key)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_user(self):
+        self.get(self.token.key)
+
+        self.client.post(
+            reverse("update_password"),
+            {
+                "token": self.token.key,
+                "old_password": "cached_password",
+                "new_password": "123RWRWQRQ",
+                "confirm_password": "123RWRWQRQ",
+            },
+        )
+
+        self.assertEqual(token_cache.stats()["size"], 0)
+
+    def test_deactivated_user_is_invalidated(self):
+        self.get(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.get(self.token.key)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_is_a_copy(self):
+        self.get(self.token.key)
+        user, _ = token_cache.get(self.token.key)
+        user.first_name = "changed"
+
+        cached, token = token_cache.get(self.token.key)
+
+        self.assertEqual(cached.first_name, "")
+        self.assertIsNot(cached, user)
+        self.assertIs(token.user, cached)
+
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "token-revocation",
+            },
+        }
+    )
+    def test_revocation_reaches_other_processes(self):
+        # другой процесс: свой локальный кэш, общий кэш Django
+        other = TokenCache(cache_alias="shared")
+        with mock.patch.object(token_cache, "cache_alias", "shared"):
+            self.get(self.token.key)
+            other.set(self.token.key, (self.user, self.token))
+            self.assertIsNotNone(other.get(self.token.key))
+
+            self.user.is_active = False
+            self.user.save()
+
+            self.assertIsNone(other.get(self.token.key))
+            self.assertEqual(other.stats()["size"], 0)
+            response = self.get(self.token.key)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # запись из общего кэша, выданная до отзыва, тоже не действует
+        fresh = TokenCache(cache_alias="shared")
+        self.assertIsNone(fresh.get(self.token.key))
+
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "token-revocation-async",
+            },
+        }
+    )
+    async def test_async_revocation_reaches_other_processes(self):
+        first = TokenCache(cache_alias="shared")
+        second = TokenCache(cache_alias="shared")
+        await first.aset(self.token.key, (self.user, self.token))
+        self.assertIsNotNone(await second.aget(self.token.key))
+
+        first.invalidate_user(self.user.pk)
+
+        self.assertIsNone(await second.aget(self.token.key))
+
+    def test_lru_and_ttl(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        for key in ("a", "b", "c"):
+            cache.set(key, (self.user, key))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), (self.user, "c"))
+
+        cache.ttl = -1
+        cache.set("d", (self.user, "d"))
+        self.assertIsNone(cache.get("d"))
+
+
+class ResetCodeConcurrencyTestCase(TransactionTestCase):
+    """
+    Параллельные попытки угадать код не должны превышать лимит в 5 попыток
+    """
+
+    guesses = 20
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username="race_user", password="race_password", email="race@gmail.com"
+        )
+        self.reset_code = ResetPasswordCode.objects.create(user=self.user, code="12345")
+        return super().setUp()
+
+    def guess(self, code: str) -> str:
+        try:
+            validate_and_decrement_reset_code(self.user.id, code)
+            return "correct"
+        except CodeAttemptsLimitIsOver:
+            return "limit"
+        except ValidationError:
+            return "wrong"
+        finally:
+            connection.close()
+
+    @skipIf(
+        connection.vendor == "sqlite",
+        "in-memory sqlite locks the whole table for concurrent writers",
+    )
+    def test_parallel_guesses(self):
+        barrier = threading.Barrier(self.guesses)
+
+        def guess(i):
+            barrier.wait()
+            return self.guess(f"{i:05d}")
+
+        with ThreadPoolExecutor(max_workers=self.guesses) as executor:
+            results = list(executor.map(guess, range(self.guesses)))
+
+        self.assertEqual(results.count("wrong"), 5)
+        self.assertEqual(results.count("limit"), self.guesses - 5)
+        self.reset_code.refresh_from_db()
+        self.assertEqual(self.reset_code.attempt, 0)
+
+    def test_single_query_per_guess(self):
+        with self.assertNumQueries(1):
+            self.guess("54321")
+        with self.assertNumQueries(1):
+            self.guess("12345")
+
+    def test_attempt_is_checked_and_spent_in_one_statement(self):
+        # детерминированная замена test_parallel_guesses для sqlite: проверка
+        # лимита и списание - один UPDATE, окна для гонки между ними нет
+        if not supports_update_returning():
+            self.skipTest("no UPDATE ... RETURNING, select_for_update is used")
+        ResetPasswordCode.objects.filter(pk=self.reset_code.pk).update(attempt=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.guess("54321"), "wrong")
+
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]["sql"].upper()
+        self.assertTrue(sql.startswith("UPDATE"))
+        self.assertIn("ATTEMPT > 0", sql)
+        self.assertIn("RETURNING", sql)
+        self.assertEqual([self.guess("12345") for _ in range(3)], ["limit"] * 3)
+        self.reset_code.refresh_from_db()
+        self.assertEqual(self.reset_code.attempt, 0)
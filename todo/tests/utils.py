@@ -0,0 +1,50 @@
+import logging
+from datetime import date, timedelta
+
+from todo.models import Task, SubTask, User
+from todo.search import index_tasks
+
+
+# результаты бенчмарков; выводятся, только если бенчмарки запрошены через --tag
+logger = logging.getLogger("todo.benchmarks")
+
+
+def seed_user(
+    username: str,
+    tasks: int,
+    subtasks_per_task: int = 1,
+    days: int = 60,
+    every: int = 1,
+) -> User:
+    """
+    Создаёт пользователя с tasks задачами на days дней вперёд и
+    subtasks_per_task подзадачами у каждой every-й задачи
+    """
+    user = User.objects.create_user(username=username, password="bench")
+    created = Task.objects.bulk_create(
+        [
+            Task(
+                name=f"{username} task{i}",
+                description="description " * (i % 5),
+                priority=i % 3 + 1,
+                is_done=i % 4 == 0,
+                user=user,
+                date=date.today() + timedelta(days=i % days),
+                week_number=(date.today() + timedelta(days=i % days))
+                .isocalendar()
+                .week,
+            )
+            for i in range(tasks)
+        ],
+        batch_size=1000,
+    )
+    SubTask.objects.bulk_create(
+        [
+            SubTask(name=f"subtask{j} of {task.name}", is_done=j == 0, task=task)
+            for task in created[::every]
+            for j in range(subtasks_per_task)
+        ],
+        batch_size=1000,
+    )
+    index_tasks([task.id for task in created], created=True)
+    return user
@@ -3,9 +3,11 @@ from django.urls import path, include
 from rest_framework import routers
 from rest_framework.authtoken import views
 
+from todo import async_views
 from todo.views import (
     TodoViewSet,
     SubTaskDetailView,
+    BulkSubTaskView,
     CreateSubTaskView,
     RegisterUserView,
     UpdatePasswordView,
@@ -13,6 +15,11 @@ from todo.views import (
     GetCodeView,
     CreateNewPasswordView,
     DoneTasksView,
+    SyncView,
+    ExportView,
+    ImportView,
+    ProfilingView,
+    metrics_view,
 )
 
 
@@ -27,7 +34,22 @@ urlpatterns = [
     path("send_code/", EmailView.as_view(), name="send_code"),
     path("check_code/", GetCodeView.as_view(), name="check_code"),
     path("create_password/", CreateNewPasswordView.as_view(), name="create_password"),
+    path("subtask/bulk/", BulkSubTaskView.as_view(), name="subtask_bulk"),
     path("subtask/<int:pk>/", SubTaskDetailView.as_view(), name="subtask"),
     path("create_subtask/", CreateSubTaskView.as_view(), name="create_subtask"),
     path("done_tasks/", DoneTasksView.as_view(), name="done_tasks"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("export/", ExportView.as_view(), name="export"),
+    path("import/", ImportView.as_view(), name="import"),
+    path("profiling/", ProfilingView.as_view(), name="profiling"),
+    path("metrics", metrics_view, name="metrics"),
+    # асинхронные версии ручек чтения для ASGI, см. todo.async_views
+    path("async/todo/", async_views.task_list, name="async-todo-list"),
+    path("async/todo/<int:pk>/", async_views.task_detail, name="async-todo-detail"),
+    path(
+        "async/subtask/<int:pk>/",
+        async_views.subtask_detail,
+        name="async-subtask",
+    ),
+    path("async/done_tasks/", async_views.done_tasks, name="async-done_tasks"),
 ]
@@ -0,0 +1,124 @@
+import datetime
+import hashlib
+
+from django.db.models import F
+from django.utils import timezone
+
+from todo.models import Task, UserTaskStats
+
+
+def bump_task_versions(task_ids) -> None:
+    """
+    Увеличивает версию задач, у которых изменились подзадачи
+    """
+    task_ids = [task_id for task_id in set(task_ids) if task_id is not None]
+    if task_ids:
+        Task.objects.filter(id__in=task_ids).update(version=F("version") + 1)
+
+
+def make_etag(*parts) -> str:
+    """
+    Признак просрочки зависит от текущей даты, а формат ответа - от Accept,
+    поэтому оба входят в ETag вместе с версией
+    """
+    parts = (*parts, timezone.now().date())
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def last_modified(updated_at):
+    """
+    Признак просрочки меняется в полночь без изменения данных, поэтому
+    Last-Modified не раньше начала текущих суток (дата та же, что в make_etag)
+    """
+    if updated_at is None:
+        return None
+    today = datetime.datetime.combine(
+        timezone.now().date(), datetime.time.min, tzinfo=datetime.timezone.utc
+    )
+    return max(updated_at, today)
+
+
+def get_user_stats(request) -> UserTaskStats | None:
+    """
+    Строка UserTaskStats пользователя - один запрос на request
+    """
+    if not hasattr(request, "_user_stats"):
+        request._user_stats = UserTaskStats.objects.filter(
+            user_id=request.user.pk
+        ).first()
+    return request._user_stats
+
+
+def get_task_version(request, pk) -> tuple:
+    """
+    (версия задачи, время изменения данных пользователя) одним запросом
+    """
+    if not hasattr(request, "_task_version"):
+        if not str(pk).isdigit():
+            return (None, None)
+        request._task_version = (
+            Task.objects.filter(id=pk, user_id=request.user.pk)
+            .values_list("version", "user__task_stats__updated_at")
+            .first()
+        ) or (None, None)
+    return request._task_version
+
+
+async def aget_user_stats(request) -> UserTaskStats | None:
+    """
+    get_user_stats для async view: строка загружается асинхронно и
+    запоминается в request, дальше работают синхронные функции
+    """
+    if not hasattr(request, "_user_stats"):
+        request._user_stats = await UserTaskStats.objects.filter(
+            user_id=request.user.pk
+        ).afirst()
+    return request._user_stats
+
+
+async def aget_task_version(request, pk) -> tuple:
+    if not hasattr(request, "_task_version"):
+        if not str(pk).isdigit():
+            return (None, None)
+        request._task_version = (
+            await Task.objects.filter(id=pk, user_id=request.user.pk)
+            .values_list("version", "user__task_stats__updated_at")
+            .afirst()
+        ) or (None, None)
+    return request._task_version
+
+
+def user_etag(request, *args, **kwargs) -> str | None:
+    stats = get_user_stats(request)
+    if stats is None:
+        return None
+    return make_etag(
+        request.user.pk,
+        stats.version,
+        request.get_full_path(),
+        request.META.get("HTTP_ACCEPT", ""),
+    )
+
+
+def user_last_modified(request, *args, **kwargs):
+    stats = get_user_stats(request)
+    return last_modified(stats.updated_at if stats is not None else None)
+
+
+def task_etag(request, pk=None, *args, **kwargs) -> str | None:
+    version, _ = get_task_version(request, pk)
+    if version is None:
+        return None
+    return make_etag(
+        request.user.pk,
+        pk,
+        version,
+        request.get_full_path(),
+        request.META.get("HTTP_ACCEPT", ""),
+    )
+
+
+def task_last_modified(request, pk=None, *args, **kwargs):
+    # изменения подзадач не трогают updated_at задачи, поэтому берётся
+    # время последнего изменения любых данных пользователя
+    return last_modified(get_task_version(request, pk)[1])
@@ -1,19 +1,29 @@
-from django.utils import timezone
+import codecs
+
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q, F, ExpressionWrapper, BooleanField
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from rest_framework import status
 from rest_framework import viewsets, generics
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authtoken.models import Token
-from rest_framework.filters import SearchFilter
 
 from django_filters.rest_framework.backends import DjangoFilterBackend
 
-from todo.models import Task, SubTask, User, ResetPasswordCode
+from todo.models import SubTask, User, ResetPasswordCode, UserTaskStats
 from todo.serializers import (
     TaskSerializer,
     SubTaskSerializer,
@@ -24,12 +34,41 @@ from todo.serializers import (
     CodeSerializer,
     CreateNewPasswordSerializer,
     DoneTasksSerializer,
+    SyncSerializer,
+    TaskReadSerializer,
 )
+from todo import bulk
+from todo.export import CONTENT_TYPES, export_tasks
+from todo.importer import FORMATS, import_tasks
 from todo.permissions import IsOwner, IsTaskOwner
-from todo.services import is_task_owner, generate_code
+from todo.cache import get_payloads
+from todo.pagination import TaskCursorPagination
+from todo.profiling import profiler
+from todo import metrics
+from todo.search import TaskSearchFilter
+from todo.services import (
+    is_task_owner,
+    generate_code,
+    get_user_tasks,
+)
+from todo.stats import complete_subtasks
+from todo.sync import get_changes
 from todo.tasks import send_code_on_email
+from todo.versions import (
+    get_user_stats,
+    user_etag,
+    user_last_modified,
+    task_etag,
+    task_last_modified,
+)
+
+
+# 304 отдаётся до выполнения запроса к задачам, см. todo.versions
+user_condition = condition(etag_func=user_etag, last_modified_func=user_last_modified)
+task_condition = condition(etag_func=task_etag, last_modified_func=task_last_modified)
 
 
+@method_decorator(user_condition, name="get")
 class DoneTasksView(generics.ListAPIView):
     """
     Возвращает количество всех/выполненных задач пользователя
@@ -41,55 +80,208 @@ class DoneTasksView(generics.ListAPIView):
     ]
 
     def get_queryset(self):
-        done_tasks = Count("tasks", filter=Q(tasks__is_done=True))
-        done_subtasks = Count("tasks", filter=Q(tasks__subtasks__is_done=True))
-
-        return (
-            User.objects.filter(username=self.request.user)
-            .prefetch_related("tasks__subtasks")
-            .annotate(
-                done_subtasks=done_subtasks,
-                done_tasks=done_tasks,
-                done=F("done_subtasks") + F("done_tasks"),
-                all_tasks=Count("tasks") + Count("tasks__subtasks"),
+        # счётчики поддерживаются при каждой записи, см. todo.stats
+        return UserTaskStats.objects.filter(pk=self.request.user.pk)
+
+    def list(self, request, *args, **kwargs):
+        # строка уже загружена для ETag; без неё (пользователь создан до
+        # счётчиков и не пересчитан) - нули, как раньше
+        stats = get_user_stats(request) or UserTaskStats(user_id=request.user.pk)
+        serializer = self.get_serializer([stats], many=True)
+        return Response(serializer.data)
+
+
+class SyncView(APIView):
+    """
+    Задачи и подзадачи, изменённые или удалённые с момента выдачи токена
+    синхронизации (?token=); ответ содержит новый токен
+    """
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request):
+        changes = get_changes(request.user, request.query_params.get("token"))
+        serializer = SyncSerializer(changes, context={"request": request})
+        return Response(serializer.data)
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов в текстовом формате Prometheus. Доступ - по
+    METRICS["ALLOWED_IPS"] или токену; при METRICS["PORT"] метрики отдаёт
+    только отдельный порт
+    """
+    if metrics.get_options()["PORT"]:
+        raise Http404
+    if not metrics.allowed(
+        request.META.get("REMOTE_ADDR", ""), request.headers.get("Authorization", "")
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(metrics.aggregate()), content_type=metrics.CONTENT_TYPE
+    )
+
+
+class ProfilingView(APIView):
+    """
+    Гистограммы времени и SQL по view (см. todo.profiling); DELETE - сброс
+    """
+
+    permission_classes = [
+        IsAdminUser,
+    ]
+
+    def get(self, request):
+        return Response(profiler.snapshot())
+
+    def delete(self, request):
+        profiler.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ExportView(APIView):
+    """
+    Потоковая выгрузка всех задач пользователя с подзадачами
+    (?output=ndjson|csv, по умолчанию ndjson)
+    """
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request):
+        # ?format занят выбором рендерера DRF
+        output = request.query_params.get("output", "ndjson")
+        if output not in CONTENT_TYPES:
+            raise ValidationError(
+                {"output": f"Expected one of: {', '.join(CONTENT_TYPES)}"}
             )
+        response = StreamingHttpResponse(
+            export_tasks(request.user, output), content_type=CONTENT_TYPES[output]
         )
+        response["Content-Disposition"] = f'attachment; filename="tasks.{output}"'
+        return response
 
+    def perform_content_negotiation(self, request, force=False):
+        # ответ формируется не рендерером, поэтому Accept: text/csv не даёт 406
+        return super().perform_content_negotiation(request, force=True)
 
+
+class ImportView(APIView):
+    """
+    Потоковый импорт задач с подзадачами из тела запроса в формате выгрузки
+    (?input=ndjson|csv, по умолчанию - по Content-Type). Ошибочные записи
+    пропускаются и перечисляются в ответе
+    """
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def post(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        input_format = request.query_params.get("input", FORMATS.get(content_type))
+        if input_format not in CONTENT_TYPES:
+            raise ValidationError(
+                {"input": f"Expected one of: {', '.join(CONTENT_TYPES)}"}
+            )
+        # тело читается построчно, без request.data
+        lines = codecs.iterdecode(request.stream or [], "utf-8")
+        report = import_tasks(request.user, lines, input_format)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+@method_decorator(user_condition, name="list")
+@method_decorator(task_condition, name="retrieve")
 class TodoViewSet(viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated & IsOwner]
+    pagination_class = TaskCursorPagination
 
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    filter_fields = ["is_done", "priority", "date", "week_number"]
-    search_fields = ["name", "description", "subtasks__name", "subtasks__description"]
+    filter_backends = [DjangoFilterBackend, TaskSearchFilter]
+    filterset_fields = ["is_done", "priority", "date", "week_number"]
 
     def get_queryset(self):
-        date_now = timezone.now().date()
-        return (
-            Task.objects.filter(user_id=self.request.user)
-            .annotate(
-                overdue=ExpressionWrapper(
-                    Q(date__lt=date_now), output_field=BooleanField()
-                )
+        if self.action not in ("list", "retrieve"):
+            # запись идёт в одну задачу: её подзадачи для ответа загружаются
+            # одним запросом и без prefetch (он сбрасывается после update)
+            return get_user_tasks(self.request.user, subtasks=False)
+
+        # чтение идёт через TaskReadSerializer, он загружает подзадачи сам
+        fields, _ = self.get_shape()
+        queryset = get_user_tasks(
+            self.request.user, overdue="overdue" in fields, subtasks=False
+        )
+        # user_id нужен IsOwner в retrieve
+        return queryset.only(*TaskReadSerializer.columns(fields), "user_id")
+
+    def get_shape(self) -> tuple:
+        """
+        Поля (?fields=id,name) и вложенные объекты (?expand=subtasks) ответа
+        """
+        if not hasattr(self, "_shape"):
+            self._shape = TaskReadSerializer.shape(
+                self.request.query_params, settings.TASK_DEFAULT_EXPAND
             )
-            .prefetch_related("subtasks")
+        return self._shape
+
+    def list(self, request, *args, **kwargs):
+        fields, _ = self.get_shape()
+        queryset = TaskReadSerializer.values(
+            self.filter_queryset(self.get_queryset()), fields
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.represent(list(queryset)))
+        return self.get_paginated_response(self.represent(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        fields, _ = self.get_shape()
+        row = TaskReadSerializer.row(self.get_object(), fields)
+        return Response(self.represent([row])[0])
+
+    def represent(self, rows: list) -> list:
+        fields, expand = self.get_shape()
+        return get_payloads(
+            rows,
+            lambda misses: TaskReadSerializer.to_representation(misses, fields, expand),
+            shape=fields + expand,
         )
 
+    @transaction.atomic
     def perform_update(self, serializer):
         # если задача становится выполненной, то все подзадачи выполняются автоматически
         if "is_done" in serializer.validated_data:
             if serializer.validated_data["is_done"] and not serializer.instance.is_done:
-                serializer.instance.subtasks.update(is_done=True)
+                complete_subtasks(serializer.instance)
         return super().perform_update(serializer)
 
+    @action(detail=False, methods=["post", "patch", "delete"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Массовое создание (POST), изменение (PATCH) и удаление (DELETE, список id)
+        задач. Для каждого элемента возвращается свой статус
+        """
+        items = bulk.validate_items(request.data)
+        context = self.get_serializer_context()
+        if request.method == "POST":
+            results = bulk.bulk_create_tasks(items, context)
+        elif request.method == "PATCH":
+            results = bulk.bulk_update_tasks(items, context)
+        else:
+            results = bulk.bulk_delete_tasks(items, request.user)
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
 
 class SubTaskDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Подзадача
     """
 
-    queryset = SubTask.objects.all()
+    # задача нужна IsTaskOwner
+    queryset = SubTask.objects.select_related("task")
     serializer_class = SubTaskSerializer
     permission_classes = [IsTaskOwner]
 
@@ -109,6 +301,29 @@ class CreateSubTaskView(generics.CreateAPIView):
         return super().post(request, *args, **kwargs)
 
 
+class BulkSubTaskView(APIView):
+    """
+    Массовое создание, изменение и удаление подзадач
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items = bulk.validate_items(request.data)
+        results = bulk.bulk_create_subtasks(items, request.user)
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+    def patch(self, request):
+        items = bulk.validate_items(request.data)
+        results = bulk.bulk_update_subtasks(items, request.user)
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+    def delete(self, request):
+        items = bulk.validate_items(request.data)
+        results = bulk.bulk_delete_subtasks(items, request.user)
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+
 class CreateNewPasswordView(APIView):
     """
     Создание нового пароля после восстановления
@@ -118,13 +333,12 @@ class CreateNewPasswordView(APIView):
         serializer = CreateNewPasswordSerializer(data=request.data)
         if serializer.is_valid():
             user_id = serializer.data["user_id"]
-            code = serializer.data["code"]
             new_password = serializer.data["new_password"]
 
-            self.update_password(user_id, new_password)
-            self.delete_token(user_id)
-
-            ResetPasswordCode.objects.get(code=code, user_id=user_id).delete()
+            with transaction.atomic():
+                self.update_password(user_id, new_password)
+                self.delete_token(user_id)
+                ResetPasswordCode.objects.filter(user_id=user_id).delete()
 
             return Response(
                 {"detail": "Password created!"}, status=status.HTTP_201_CREATED
@@ -134,20 +348,19 @@ class CreateNewPasswordView(APIView):
     @staticmethod
     def update_password(user_id: int, new_password: str) -> None:
         """
-        Обновляет пароль пользователя с указанным id
+        Обновляет пароль пользователя с указанным id; через save(), чтобы
+        сработали сигналы User (сброс кэша токенов)
         """
-        user = get_object_or_404(User, id=user_id)
+        user = get_object_or_404(User.objects.only("id", "password"), id=user_id)
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=["password"])
 
     @staticmethod
     def delete_token(user_id: int) -> None:
         """
         Удаляет токен авторизации, если он существует
         """
-        user_token = Token.objects.filter(user_id=user_id)
-        if user_token.exists():
-            user_token[0].delete()
+        Token.objects.filter(user_id=user_id).delete()
 
 
 class GetCodeView(APIView):
@@ -158,11 +371,9 @@ class GetCodeView(APIView):
     def post(self, request):
         serializer = CodeSerializer(data=request.data)
         if serializer.is_valid():
-            email = serializer.data["email"]
-            user = get_object_or_404(User, email=email)
-
             return Response(
-                {"Correct": "True", "user_id": user.id}, status=status.HTTP_200_OK
+                {"Correct": "True", "user_id": serializer.validated_data["user_id"]},
+                status=status.HTTP_200_OK,
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 